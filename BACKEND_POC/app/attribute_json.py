@@ -0,0 +1,261 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from app.bulkload import update_rows
+from app.graph_cache import graph_json_cache
+
+
+# <editor-fold Constants">
+# Name of the field holding the rolled up attributes of graphs, vertexes and
+# transactions, as a JSON object keyed by attribute label.
+ATTRIBUTE_JSON_FIELD = 'attribute_json'
+
+# Databases whose JSON functions are used to update attribute_json in place.
+# Django's JSONField requires SQLite's JSON1 extension, so json_set and
+# json_remove are always available on SQLite.
+NATIVE_JSON_VENDORS = ('mysql', 'postgresql', 'sqlite')
+# </editor-fold>
+
+
+def supports_native_update(connection, labels):
+    """
+    :param connection: Database connection.
+    :param labels: Attribute labels to be updated.
+    :return: True if attribute_json can be updated using the databases JSON
+             functions. Labels containing quotes or backslashes cannot be
+             quoted in SQLite JSON paths, and fall back to the ORM.
+    """
+    if connection.vendor not in NATIVE_JSON_VENDORS:
+        return False
+    return not any('"' in label or '\\' in label for label in labels)
+
+
+def json_path(connection, label):
+    """
+    :return: Parameter addressing the attribute label within a JSON object.
+    """
+    if connection.vendor == 'postgresql':
+        return [label]
+    return '$."' + label + '"'
+
+
+def json_set_sql(connection, column, count):
+    """
+    Return an SQL expression evaluating to the JSON object held in a column
+    with count attributes set, taking a JSON path (refer to json_path) and
+    JSON encoded value parameter for each:
+     - MySQL/MariaDB: JSON_SET(column, path, JSON_EXTRACT(value, '$'), ..)
+     - PostgreSQL: jsonb_set(jsonb_set(column, path, value), ..)
+     - SQLite: json_set(column, path, json(value), ..)
+    :param connection: Database connection.
+    :param column: Quoted name of the column.
+    :param count: Number of attributes set.
+    :return: SQL of the expression.
+    """
+    if connection.vendor == 'postgresql':
+        sql = column
+        for index in range(count):
+            sql = "jsonb_set(" + sql + ", %s::text[], %s::jsonb)"
+        return sql
+    if connection.vendor == 'mysql':
+        function, value = 'JSON_SET', "JSON_EXTRACT(%s, '$')"
+    else:
+        function, value = 'json_set', "json(%s)"
+    return function + "(" + column + (", %s, " + value) * count + ")"
+
+
+def json_remove_sql(connection, column, count):
+    """
+    Return an SQL expression evaluating to the JSON object held in a column
+    with count attributes removed, taking a JSON path parameter for each
+    (refer to json_path):
+     - MySQL/MariaDB: JSON_REMOVE(column, path, ..)
+     - PostgreSQL: (column #- path ..)
+     - SQLite: json_remove(column, path, ..)
+    :param connection: Database connection.
+    :param column: Quoted name of the column.
+    :param count: Number of attributes removed.
+    :return: SQL of the expression.
+    """
+    if connection.vendor == 'postgresql':
+        return "(" + column + " #- %s::text[]" * count + ")"
+    function = 'JSON_REMOVE' if connection.vendor == 'mysql' else 'json_remove'
+    return function + "(" + column + ", %s" * count + ")"
+
+
+def _graph_id(instance):
+    """
+    :return: ID of the Graph a Graph, Vertex or Transaction belongs to.
+    """
+    return getattr(instance, 'graph_fk_id', instance.pk)
+
+
+def _update_in_memory(instance, update):
+    """
+    Apply an update to the attribute_json held by a model instance, if it has
+    been loaded, so that it matches the stored row.
+    """
+    if ATTRIBUTE_JSON_FIELD in instance.__dict__ and isinstance(instance.attribute_json, dict):
+        update(instance.attribute_json)
+
+
+def _update_with_orm(model, pk, update, using):
+    """
+    Update the attribute_json of a row by reading, modifying and writing it
+    back, with the row locked so that concurrent updates are not lost. Used
+    for databases without native JSON functions.
+    """
+    with transaction.atomic(using=using):
+        attribute_json = model.objects.using(using).select_for_update().filter(pk=pk)\
+            .values_list(ATTRIBUTE_JSON_FIELD, flat=True).get()
+        attribute_json = dict(attribute_json or {})
+        update(attribute_json)
+        model.objects.using(using).filter(pk=pk).update(**{ATTRIBUTE_JSON_FIELD: attribute_json})
+
+
+def set_attributes(instance, values):
+    """
+    Set attributes held in the attribute_json of a Graph, Vertex or
+    Transaction, updating only the supplied keys of the stored JSON object in
+    a single statement, rather than decoding, modifying, encoding and saving
+    the whole object. The update is atomic, so concurrent updates of other
+    attributes of the same row are not lost. No signals are sent, but the
+    graphs JSON cache version is bumped once the write commits.
+    :param instance: Graph, Vertex or Transaction to update.
+    :param values: Dictionary of attribute values keyed by label.
+    """
+    if not values:
+        return
+    model = instance.__class__
+    using = instance._state.db or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    labels = list(values)
+    if supports_native_update(connection, labels):
+        quote_name = connection.ops.quote_name
+        column = quote_name(model._meta.get_field(ATTRIBUTE_JSON_FIELD).column)
+        params = []
+        for label in labels:
+            params.append(json_path(connection, label))
+            params.append(json.dumps(values[label]))
+        params.append(instance.pk)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE " + quote_name(model._meta.db_table) + " SET " + column + " = " +
+                           json_set_sql(connection, column, len(labels)) +
+                           " WHERE " + quote_name(model._meta.pk.column) + " = %s", params)
+    else:
+        _update_with_orm(model, instance.pk, lambda attribute_json: attribute_json.update(values), using)
+    _update_in_memory(instance, lambda attribute_json: attribute_json.update(values))
+    graph_json_cache.graph_changed(_graph_id(instance))
+
+
+def remove_attributes(instance, labels):
+    """
+    Remove attributes held in the attribute_json of a Graph, Vertex or
+    Transaction, in a single atomic statement (refer to set_attributes).
+    Labels not held are ignored. No signals are sent, but the graphs JSON
+    cache version is bumped once the write commits.
+    :param instance: Graph, Vertex or Transaction to update.
+    :param labels: Labels of the attributes to remove.
+    """
+    labels = list(labels)
+    if not labels:
+        return
+
+    def remove(attribute_json):
+        for label in labels:
+            attribute_json.pop(label, None)
+
+    model = instance.__class__
+    using = instance._state.db or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    if supports_native_update(connection, labels):
+        quote_name = connection.ops.quote_name
+        column = quote_name(model._meta.get_field(ATTRIBUTE_JSON_FIELD).column)
+        params = [json_path(connection, label) for label in labels]
+        params.append(instance.pk)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE " + quote_name(model._meta.db_table) + " SET " + column + " = " +
+                           json_remove_sql(connection, column, len(labels)) +
+                           " WHERE " + quote_name(model._meta.pk.column) + " = %s", params)
+    else:
+        _update_with_orm(model, instance.pk, remove, using)
+    _update_in_memory(instance, remove)
+    graph_json_cache.graph_changed(_graph_id(instance))
+
+
+def bulk_set_attributes(model, graph_id, rows, batch_size, using=DEFAULT_DB_ALIAS):
+    """
+    Set attributes held in the attribute_json of many rows of a model, using
+    an UPDATE .. SET attribute_json = CASE pk WHEN .. THEN <json_set_sql> END
+    statement per batch of rows (refer to set_attributes), so the existing
+    JSON objects are never read. The caller is expected to hold locks on the
+    rows if the rows must not change between choosing and applying values.
+    No signals are sent, but the graphs JSON cache version is bumped once the
+    writes commit.
+    :param model: Graph, Vertex or Transaction.
+    :param graph_id: ID of the Graph the rows belong to.
+    :param rows: List of (primary key, dictionary of values keyed by label)
+                 tuples.
+    :param batch_size: Maximum number of rows to update per statement,
+                       capped by the number of query parameters the
+                       database allows.
+    :param using: Alias of the database to update.
+    """
+    rows = [(pk, values) for pk, values in rows if values]
+    if not rows:
+        return
+    connection = connections[using]
+    if not supports_native_update(connection, set(label for pk, values in rows for label in values)):
+        # Read, modify and write back each batch of rows
+        for start in range(0, len(rows), batch_size):
+            batch = dict(rows[start:start + batch_size])
+            attribute_jsons = []
+            for pk, attribute_json in model.objects.using(using).select_for_update().filter(pk__in=list(batch))\
+                    .values_list('pk', ATTRIBUTE_JSON_FIELD):
+                attribute_json = dict(attribute_json or {})
+                attribute_json.update(batch[pk])
+                attribute_jsons.append((pk, attribute_json))
+            update_rows(model, ATTRIBUTE_JSON_FIELD, attribute_jsons, batch_size, connection)
+        graph_json_cache.graph_changed(graph_id)
+        return
+
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    pk_column = quote_name(model._meta.pk.column)
+    column = quote_name(model._meta.get_field(ATTRIBUTE_JSON_FIELD).column)
+    # Parameters per row: the primary key twice (WHEN and IN), then a path
+    # and value per attribute
+    max_values = max(len(values) for pk, values in rows)
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(['pk', 'pk'] + ['path', 'value'] * max_values, rows))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cases = []
+            params = []
+            for pk, values in batch:
+                cases.append("WHEN %s THEN " + json_set_sql(connection, column, len(values)))
+                params.append(pk)
+                for label, value in values.items():
+                    params.append(json_path(connection, label))
+                    params.append(json.dumps(value))
+            params.extend(pk for pk, values in batch)
+            cursor.execute("UPDATE " + table + " SET " + column + " = CASE " + pk_column + " " + " ".join(cases) +
+                           " END WHERE " + pk_column + " IN (" + ", ".join(["%s"] * len(batch)) + ")", params)
+    graph_json_cache.graph_changed(graph_id)
@@ -0,0 +1,290 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+from itertools import repeat
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.dispatch import Signal
+from app.attribute_json import bulk_set_attributes
+from app.bulkload import update_rows
+from app.models import AttribTypeChoice, attrib_str_to_value
+from app.models import Graph, GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex, GraphAttribDefTrans
+from app.models import Vertex, VertexAttrib, Transaction, TransactionAttrib
+
+
+# <editor-fold Constants">
+# Types of element whose attributes can be edited, keying the edits returned
+# by parse_edits.
+ELEMENT_GRAPH = 'graph'
+ELEMENT_VERTEX = 'vertex'
+ELEMENT_TRANSACTION = 'transaction'
+
+# Elements whose attributes can be edited, each identified by its type, the
+# field identifying it within its graph (None for the graph itself), the key
+# of its columns in a batch edit request, its model, the model and foreign
+# key of its attributes and the model of its attribute definitions.
+EDIT_ELEMENTS = (
+    (ELEMENT_GRAPH, None, 'graph', Graph, GraphAttrib, 'graph_fk', GraphAttribDefGraph),
+    (ELEMENT_VERTEX, 'vx_id', 'vertexes', Vertex, VertexAttrib, 'vertex_fk', GraphAttribDefVertex),
+    (ELEMENT_TRANSACTION, 'tx_id', 'transactions', Transaction, TransactionAttrib, 'transaction_fk',
+     GraphAttribDefTrans),
+)
+
+# Number of records looked up, and of rows updated or created, per query.
+EDIT_BATCH_SIZE = 1000
+
+# Number of missing vx_ids/tx_ids or labels listed in error messages.
+MAX_REPORTED_MISSING = 10
+# </editor-fold>
+
+
+# Sent once a batch of edits has been applied, in place of the post_save
+# signal of each attribute and element, with the arguments:
+#  - graph_id: ID of the edited graph.
+#  - values: Dictionary keyed by element type of the new attribute values,
+#    each a dictionary keyed by vx_id/tx_id (None for the graph) of
+#    dictionaries of values keyed by attribute label.
+#  - record_ids: Dictionary keyed by element type of the primary keys of the
+#    edited vertexes and transactions, keyed by vx_id/tx_id.
+#  - using: Alias of the database the edits were made in.
+attributes_edited = Signal()
+
+
+class BatchEditError(Exception):
+    """
+    Raised when a batch of attribute edits is malformed, or refers to
+    elements or attributes that do not exist.
+    """
+    pass
+
+
+def _element_id(value, id_field):
+    """
+    :return: vx_id/tx_id value converted to an integer.
+    :raises BatchEditError: If the value is not an integer.
+    """
+    if isinstance(value, bool):
+        raise BatchEditError(id_field + " values must be integers")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BatchEditError(id_field + " values must be integers")
+
+
+def _chunks(items, size=EDIT_BATCH_SIZE):
+    """
+    :return: Generator of lists of up to size items.
+    """
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _missing(items):
+    """
+    :return: Comma separated list of the first MAX_REPORTED_MISSING items.
+    """
+    items = sorted(items)
+    listed = ', '.join(str(item) for item in items[:MAX_REPORTED_MISSING])
+    if len(items) > MAX_REPORTED_MISSING:
+        listed = listed + ' and ' + str(len(items) - MAX_REPORTED_MISSING) + ' more'
+    return listed
+
+
+def parse_edits(data):
+    """
+    Parse the edits of a batch edit request, supplied as rows, columns or
+    both:
+        {"graph_id": 3,
+         "edits": [{"vx_id": 0, "label": "x", "value": 1.0},
+                   {"tx_id": 5, "label": "weight", "value": 2},
+                   {"label": "title", "value": "My graph"}],
+         "vertexes": {"vx_id": [0, 1, 2], "values": {"x": [1.0, 2.0, 3.0], "color": "red"}},
+         "transactions": {"tx_id": [5, 6], "values": {"weight": [2, 3]}},
+         "graph": {"title": "My graph"}}
+    Rows edit an attribute of the vertex identified by vx_id, the transaction
+    identified by tx_id, or of the graph itself if neither is supplied.
+    Columns supply, for each attribute label, either a list of values (one
+    per listed vx_id/tx_id) or a single value given to each of them. Where an
+    attribute is edited more than once, columns take precedence over rows and
+    later values over earlier ones.
+    :param data: Body of the request.
+    :return: Dictionary of edits keyed by element type (ie ELEMENT_VERTEX),
+             each a dictionary of values keyed by (vx_id/tx_id, label), the
+             ID being None for graph attributes.
+    :raises BatchEditError: If the edits are malformed.
+    """
+    edits = dict((element[0], {}) for element in EDIT_ELEMENTS)
+
+    rows = data.get('edits', [])
+    if not isinstance(rows, list):
+        raise BatchEditError("edits must be a list")
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict) or not isinstance(row.get('label'), str) or 'value' not in row:
+            raise BatchEditError("edits[" + str(index) + "] must contain a label and value")
+        element_type, element_id = ELEMENT_GRAPH, None
+        for name, id_field, columns_key, model, attribute_model, attribute_fk, def_model in EDIT_ELEMENTS:
+            if id_field is not None and id_field in row:
+                element_type, element_id = name, _element_id(row[id_field], id_field)
+        edits[element_type][(element_id, row['label'])] = row['value']
+
+    for name, id_field, columns_key, model, attribute_model, attribute_fk, def_model in EDIT_ELEMENTS:
+        columns = data.get(columns_key)
+        if columns is None:
+            continue
+        if not isinstance(columns, dict):
+            raise BatchEditError(columns_key + " must be an object")
+        if id_field is None:
+            for label, value in columns.items():
+                edits[name][(None, label)] = value
+            continue
+        ids = columns.get(id_field)
+        values = columns.get('values', {})
+        if not isinstance(ids, list) or not isinstance(values, dict):
+            raise BatchEditError(columns_key + " must contain a list of " + id_field + " and an object of values")
+        ids = [_element_id(element_id, id_field) for element_id in ids]
+        for label, column in values.items():
+            if not isinstance(column, list):
+                column = repeat(column)
+            elif len(column) != len(ids):
+                raise BatchEditError(columns_key + " values of " + label + " must list a value for each " + id_field)
+            for element_id, value in zip(ids, column):
+                edits[name][(element_id, label)] = value
+    return edits
+
+
+def apply_edits(graph_id, edits, using=DEFAULT_DB_ALIAS):
+    """
+    Apply a batch of attribute edits to a graph in one transaction, using set
+    based queries rather than saving each attribute and element. Elements and
+    attributes are looked up, existing attributes updated (refer to
+    app/bulkload.py:update_rows) and missing attributes created
+    EDIT_BATCH_SIZE at a time, and the edited keys of the attribute_json of
+    each edited element (and the graph) set in place (refer to
+    app/attribute_json.py:bulk_set_attributes).
+    No post_save signals are sent; attributes_edited is sent once instead,
+    from which a single notification describing the batch is sent to
+    subscribers.
+    :param graph_id: ID of the graph being edited.
+    :param edits: Edits, as returned by parse_edits.
+    :param using: Alias of the database to edit.
+    :return: Dictionary keyed by the type of each edited element of the
+             number of elements edited and attributes updated and created.
+    :raises Graph.DoesNotExist: If the graph does not exist.
+    :raises BatchEditError: If an edited element or attribute definition
+                            does not exist, in which case nothing is changed.
+    """
+    counts = {}
+    values = {}
+    record_ids = {}
+    with transaction.atomic(using=using):
+        if not Graph.objects.using(using).filter(pk=graph_id).exists():
+            raise Graph.DoesNotExist("Could not find graph " + str(graph_id))
+        for element in EDIT_ELEMENTS:
+            name = element[0]
+            if not edits.get(name):
+                continue
+            counts[name], values[name], record_ids[name] = _apply_element_edits(element, graph_id, edits[name], using)
+        if values:
+            attributes_edited.send(sender=Graph, graph_id=graph_id, values=values, record_ids=record_ids,
+                                   using=using)
+    return counts
+
+
+def _apply_element_edits(element, graph_id, edits, using):
+    """
+    Apply the edits of the attributes of one type of element.
+    :param element: Entry of EDIT_ELEMENTS.
+    :param graph_id: ID of the graph being edited.
+    :param edits: Dictionary of values keyed by (vx_id/tx_id, label).
+    :param using: Alias of the database to edit.
+    :return: Tuple of the counts of the edit, the new values keyed by
+             vx_id/tx_id and label, and the primary keys of the edited
+             elements keyed by vx_id/tx_id.
+    """
+    name, id_field, columns_key, model, attribute_model, attribute_fk, def_model = element
+
+    # Attribute definitions, taking the last defined where a label is
+    # defined more than once
+    labels = set(label for element_id, label in edits)
+    attribute_defs = {}
+    for attribute_def in def_model.objects.using(using).filter(graph_fk_id=graph_id, label__in=labels)\
+            .select_related('type_fk').order_by('id'):
+        attribute_defs[attribute_def.label] = attribute_def
+    if len(attribute_defs) != len(labels):
+        raise BatchEditError("Could not find " + name + " attributes with labels " +
+                             _missing(labels.difference(attribute_defs)))
+
+    # Primary keys of the edited elements, keyed by vx_id/tx_id. Rows are
+    # locked so that concurrent batches editing the same elements leave their
+    # attributes and attribute_json agreeing.
+    records = {}
+    element_ids = set(element_id for element_id, label in edits)
+    if id_field is None:
+        records[None] = model.objects.using(using).select_for_update().filter(pk=graph_id)\
+            .values_list('id', flat=True).get()
+    else:
+        for chunk in _chunks(sorted(element_ids)):
+            records.update((element_id, record_id) for record_id, element_id in model.objects.using(using)
+                           .select_for_update().filter(graph_fk_id=graph_id, **{id_field + '__in': chunk})
+                           .values_list('id', id_field))
+        if len(records) != len(element_ids):
+            raise BatchEditError("Could not find " + columns_key + " with " + id_field + " " +
+                                 _missing(element_ids.difference(records)))
+
+    # Primary keys of existing attributes, keyed by (element primary key,
+    # definition primary key)
+    attributes = {}
+    attribute_def_ids = [attribute_def.id for attribute_def in attribute_defs.values()]
+    for chunk in _chunks(records.values()):
+        attributes.update(((record_id, attribute_def_id), attribute_id)
+                          for attribute_id, record_id, attribute_def_id in attribute_model.objects.using(using)
+                          .filter(**{attribute_fk + '_id__in': chunk, 'attrib_fk_id__in': attribute_def_ids})
+                          .values_list('id', attribute_fk + '_id', 'attrib_fk_id'))
+
+    updated = []
+    created = []
+    values = {}
+    for (element_id, label), value in edits.items():
+        attribute_def = attribute_defs[label]
+        record_id = records[element_id]
+        raw_type = attribute_def.type_fk.raw_type
+        if raw_type == AttribTypeChoice.DICT.value:
+            value_str = json.dumps(value)
+        else:
+            value_str = str(value)
+        attribute_id = attributes.get((record_id, attribute_def.id))
+        if attribute_id is None:
+            created.append(attribute_model(**{attribute_fk + '_id': record_id, 'attrib_fk_id': attribute_def.id,
+                                              'value_str': value_str}))
+        else:
+            updated.append((attribute_id, value_str))
+        values.setdefault(element_id, {})[label] = attrib_str_to_value(raw_type, value_str)
+
+    connection = connections[using]
+    update_rows(attribute_model, 'value_str', updated, EDIT_BATCH_SIZE, connection)
+    attribute_model.objects.using(using).bulk_create(created, batch_size=EDIT_BATCH_SIZE)
+
+    bulk_set_attributes(model, graph_id,
+                        [(records[element_id], record_values) for element_id, record_values in values.items()],
+                        EDIT_BATCH_SIZE, using)
+
+    counts = {'elements': len(records), 'updated': len(updated), 'created': len(created)}
+    if id_field is None:
+        return counts, values, {}
+    return counts, values, records
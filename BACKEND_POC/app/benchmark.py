@@ -0,0 +1,70 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+import random
+import zipfile
+from app.importer import STAR_GRAPH_MEMBER
+
+
+# <editor-fold Constants">
+# Schema recorded in synthetic star files.
+BENCHMARK_SCHEMA = 'benchmark.schema'
+
+# Prefix of the titles of graphs imported by benchmarks, which are deleted
+# once each benchmark completes.
+BENCHMARK_TITLE_PREFIX = '__benchmark__'
+# </editor-fold>
+
+
+def write_synthetic_star(star_filename, vertex_count, transaction_count, seed=0):
+    """
+    Write a star file holding a randomly generated graph, for use when
+    benchmarking. Each vertex has four attributes and each transaction two,
+    covering the float, string, boolean, integer and raw (DICT) attribute
+    types loaded from attribtype.json.
+    :param star_filename: Path of the star file to write.
+    :param vertex_count: Number of vertexes to generate.
+    :param transaction_count: Number of transactions to generate.
+    :param seed: Random seed, allowing the same graph to be regenerated.
+    """
+    rand = random.Random(seed)
+    graph_json = [
+        {'version': 1, 'schema': BENCHMARK_SCHEMA},
+        {'graph': [
+            {'attrs': [{'label': 'title', 'type': 'string', 'descr': 'Graph title'}]},
+            {'data': [{'title': 'Synthetic benchmark graph'}]}]},
+        {'vertex': [
+            {'attrs': [{'label': 'Identifier', 'type': 'string', 'descr': 'Identifier'},
+                       {'label': 'x', 'type': 'float', 'descr': 'X position', 'default': '0.0'},
+                       {'label': 'selected', 'type': 'boolean', 'descr': 'Selected', 'default': 'false'},
+                       {'label': 'raw', 'type': 'raw', 'descr': 'Raw data'}]},
+            {'data': [{'vx_id_': vx_id, 'Identifier': 'vertex ' + str(vx_id), 'x': rand.random(),
+                       'selected': vx_id % 2 == 0, 'raw': {'rank': vx_id}}
+                      for vx_id in range(vertex_count)]}]},
+        {'transaction': [
+            {'attrs': [{'label': 'weight', 'type': 'integer', 'descr': 'Weight', 'default': '1'},
+                       {'label': 'label', 'type': 'string', 'descr': 'Label'}]},
+            {'data': [{'tx_id_': tx_id, 'vx_src_': rand.randrange(vertex_count),
+                       'vx_dst_': rand.randrange(vertex_count), 'tx_dir_': True,
+                       'weight': rand.randrange(100), 'label': 'transaction ' + str(tx_id)}
+                      for tx_id in range(transaction_count)]}]},
+        {'meta': []},
+    ]
+    with zipfile.ZipFile(star_filename, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(STAR_GRAPH_MEMBER, json.dumps(graph_json))
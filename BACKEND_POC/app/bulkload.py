@@ -0,0 +1,416 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import os
+import time
+import tempfile
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+
+
+# <editor-fold Constants">
+# Names of the available loaders, selected using the IMPORT_BULK_LOADER
+# setting. The native loader uses the databases own bulk load statement where
+# one is supported and falls back to the ORM loader otherwise.
+LOADER_ORM = 'orm'
+LOADER_NATIVE = 'native'
+
+# Number of rows the native loader spools to file for a table before loading
+# them. Rows of tables that need to be read back after loading (ie to obtain
+# their primary keys) are loaded whenever the importer flushes them.
+NATIVE_SPOOL_ROWS = 100000
+
+# Escape sequences of the MySQL LOAD DATA and PostgreSQL COPY text formats.
+# PostgreSQL text cannot hold NUL characters at all, so COPY has no escape
+# for them and values holding them are rejected (refer to NativeLoader.add).
+SPOOL_NULL = '\\N'
+SPOOL_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+POSTGRESQL_SPOOL_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+# </editor-fold>
+
+
+@contextmanager
+def deferred_checks(connection=default_connection):
+    """
+    Context manager deferring the constraint checks and unique index
+    maintenance of rows written within it, for use while loading rows that
+    are known to be consistent within a single transaction.
+     - MySQL/MariaDB: unique_checks and foreign_key_checks are disabled for
+       the session, allowing InnoDB to buffer secondary index changes rather
+       than checking each row, and restored on exit.
+     - PostgreSQL/SQLite: Django creates foreign keys as DEFERRABLE INITIALLY
+       DEFERRED, so they are already checked at commit and nothing is done.
+    :param connection: Database connection the rows are written through.
+    """
+    if connection.vendor != 'mysql':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT @@SESSION.unique_checks, @@SESSION.foreign_key_checks")
+        unique_checks, foreign_key_checks = cursor.fetchone()
+        cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SET SESSION unique_checks = %s, foreign_key_checks = %s",
+                           [unique_checks, foreign_key_checks])
+
+
+def reserve_ids(model, count, connection=default_connection):
+    """
+    Reserve a contiguous range of primary keys for rows about to be inserted
+    into the models table, so that the rows can be linked to without reading
+    them back. Keys are taken from the tables key counter, so keys of deleted
+    rows are never reused. Must be called within a transaction, with the
+    rows inserted before it ends:
+     - PostgreSQL: the table is locked in SHARE ROW EXCLUSIVE mode until the
+       transaction ends, blocking other inserts while its sequence is
+       advanced past the range.
+     - SQLite: the tables AUTOINCREMENT counter (sqlite_sequence) is advanced
+       past the range. Writing it takes the databases write lock, which is
+       held until the transaction ends.
+     - MySQL/MariaDB: not supported, as the AUTO_INCREMENT counter cannot be
+       advanced within a transaction without racing concurrent inserts.
+       Rows are instead inserted using insert_rows, which reads their keys
+       back.
+     - Others: the highest primary key is read, relying on the database
+       serialising writers. Keys of deleted rows may be reused.
+    :param model: Model whose table the rows are to be inserted into.
+    :param count: Number of primary keys to reserve.
+    :param connection: Database connection the rows are inserted through.
+    :return: The first primary key of the reserved range.
+    """
+    quote_name = connection.ops.quote_name
+    table = model._meta.db_table
+    pk_column = model._meta.pk.column
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("LOCK TABLE " + quote_name(table) + " IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, %s), "
+                           "nextval(pg_get_serial_sequence(%s, %s)) + %s)",
+                           [table, pk_column, table, pk_column, count - 1])
+            return cursor.fetchone()[0] - count + 1
+        if connection.vendor == 'mysql':
+            raise ValueError("primary keys cannot be reserved on MySQL, use insert_rows")
+        max_id_sql = "SELECT MAX(" + quote_name(pk_column) + ") FROM " + quote_name(table)
+        if connection.vendor != 'sqlite':
+            cursor.execute(max_id_sql)
+            return (cursor.fetchone()[0] or 0) + 1
+        # The counter is advanced before it is read, so it is read holding
+        # the write lock. A table yet to have rows inserted has no counter.
+        cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s", [count, table])
+        if cursor.rowcount == 0:
+            cursor.execute(max_id_sql)
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                           [table, (cursor.fetchone()[0] or 0) + count])
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+        return cursor.fetchone()[0] - count + 1
+
+
+def insert_rows(model, fields, rows, connection=default_connection):
+    """
+    Insert rows into the models table using a single multi-row INSERT
+    statement, and return the primary keys the database assigned them. For
+    MySQL/MariaDB, where keys cannot be reserved (refer to reserve_ids).
+    InnoDB allocates the AUTO_INCREMENT values of a multi-row INSERT (a
+    "simple insert") in one step in every innodb_autoinc_lock_mode, without
+    holding a table lock, so the keys are LAST_INSERT_ID() onwards, spaced by
+    auto_increment_increment.
+    :param model: Model whose table the rows belong to.
+    :param fields: Tuple of field attnames, in row order.
+    :param rows: List of row tuples, excluding the primary key.
+    :param connection: Database connection to insert rows through.
+    :return: Range of the primary keys assigned to the rows, in row order.
+    """
+    objects = [model(**dict(zip(fields, row))) for row in rows]
+    # MySQL has no limit on the rows per statement, so a batch_size of None
+    # creates all rows in one statement
+    model.objects.using(connection.alias).bulk_create(objects)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT LAST_INSERT_ID(), @@SESSION.auto_increment_increment")
+        first_id, increment = cursor.fetchone()
+    return range(first_id, first_id + len(rows) * increment, increment)
+
+
+def update_rows(model, field_name, rows, batch_size, connection=default_connection):
+    """
+    Set a field of many rows of the models table to per row values, using an
+        UPDATE .. SET field = CASE pk WHEN .. THEN .. END WHERE pk IN (..)
+    statement per batch of rows. This is the statement QuerySet.bulk_update
+    generates, without the cost of building and compiling a When expression
+    for every row, which dominates bulk_update for thousands of rows. Values
+    are converted using the fields get_db_prep_save method, so the stored
+    values match those written by the ORM. No signals are sent.
+    :param model: Model whose table the rows belong to.
+    :param field_name: Name of the field to update.
+    :param rows: List of (primary key, value) tuples.
+    :param batch_size: Maximum number of rows to update per statement,
+                       capped by the number of query parameters the
+                       database allows.
+    :param connection: Database connection to update rows through.
+    :return: Number of rows updated.
+    """
+    if not rows:
+        return 0
+    field = model._meta.get_field(field_name)
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    pk_column = quote_name(model._meta.pk.column)
+    # Parameters per row: the primary key twice (WHEN and IN) and the value
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(['pk', 'pk', field_name], rows))
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            case = "CASE " + pk_column + " " + "WHEN %s THEN %s " * len(batch) + "END"
+            if connection.features.requires_casted_case_in_updates:
+                case = "CAST(" + case + " AS " + field.cast_db_type(connection) + ")"
+            params = []
+            for pk, value in batch:
+                params.append(pk)
+                params.append(field.get_db_prep_save(value, connection))
+            params.extend(pk for pk, value in batch)
+            cursor.execute("UPDATE " + table + " SET " + quote_name(field.column) + " = " + case +
+                           " WHERE " + pk_column + " IN (" + ", ".join(["%s"] * len(batch)) + ")", params)
+            updated = updated + cursor.rowcount
+    return updated
+
+
+class OrmLoader:
+    """
+    Loader creating rows through the Django ORM using bulk_create. Rows are
+    supplied as tuples of values for the supplied model field attnames, such
+    as 'vertex_fk_id', and are created as soon as they are added.
+    """
+    name = LOADER_ORM
+
+    def __init__(self, batch_size, connection=default_connection):
+        """
+        :param batch_size: Number of rows to create per database hit.
+        :param connection: Database connection to load rows through.
+        """
+        self.batch_size = batch_size
+        self.connection = connection
+        # Seconds spent loading rows, keyed by the caller supplied row key
+        self.timings = {}
+
+    def _record_time(self, key, start):
+        """
+        Accumulate time spent since start against the supplied key.
+        """
+        self.timings[key] = self.timings.get(key, 0.0) + time.monotonic() - start
+
+    def add(self, key, model, fields, rows):
+        """
+        Add rows to be created in the models table.
+        :param key: Key to accumulate loading time against.
+        :param model: Model whose table the rows belong to.
+        :param fields: Tuple of field attnames, in row order.
+        :param rows: List of row tuples.
+        """
+        start = time.monotonic()
+        objects = [model(**dict(zip(fields, row))) for row in rows]
+        model.objects.using(self.connection.alias).bulk_create(objects, batch_size=self.batch_size)
+        self._record_time(key, start)
+
+    def add_with_ids(self, key, model, fields, rows):
+        """
+        Write rows to the models table straight away, and return the primary
+        keys assigned to them. Keys are reserved and the rows written with
+        them (refer to reserve_ids), or on MySQL/MariaDB the rows are written
+        in a single INSERT and their keys read back (refer to insert_rows).
+        :param key: Key to accumulate loading time against. Any other rows
+                    added with this key are also written.
+        :param model: Model whose table the rows belong to.
+        :param fields: Tuple of field attnames, in row order.
+        :param rows: List of row tuples, excluding the primary key.
+        :return: Range of the primary keys assigned to the rows, in row
+                 order.
+        """
+        if not rows:
+            return range(0)
+        pk_field = (model._meta.pk.attname,)
+        with transaction.atomic(using=self.connection.alias, savepoint=False):
+            if self.connection.vendor == 'mysql':
+                self.flush(key)
+                start = time.monotonic()
+                ids = insert_rows(model, fields, rows, self.connection)
+                self._record_time(key, start)
+                return ids
+            start = time.monotonic()
+            first_id = reserve_ids(model, len(rows), self.connection)
+            self._record_time(key, start)
+            self.add(key, model, pk_field + tuple(fields),
+                     [(first_id + offset,) + tuple(row) for offset, row in enumerate(rows)])
+            self.flush(key)
+        return range(first_id, first_id + len(rows))
+
+    def flush(self, key=None):
+        """
+        Ensure added rows have been written. The ORM loader writes rows as
+        they are added, so there is nothing to do.
+        :param key: If supplied, only rows added with this key need to be
+                    written.
+        """
+        pass
+
+    def discard(self):
+        """
+        Release any rows added but not yet written, once loading has finished
+        or failed. The ORM loader holds no rows, so there is nothing to do.
+        """
+        pass
+
+
+class NativeLoader(OrmLoader):
+    """
+    Loader that spools rows to a tab separated file and ingests the file using
+    the databases bulk load statement, bypassing the construction of a model
+    instance and the generation of INSERT statements for every row. Values
+    are converted using each fields get_db_prep_save method, so the stored
+    values match those written by the ORM.
+    """
+    name = LOADER_NATIVE
+
+    def __init__(self, batch_size, connection=default_connection):
+        super(NativeLoader, self).__init__(batch_size, connection)
+        # Spools keyed by (key, model), each holding the open spool file,
+        # model fields, and number of rows spooled
+        self.spools = {}
+        self.reject_nul = connection.vendor == 'postgresql'
+        self.escapes = POSTGRESQL_SPOOL_ESCAPES if self.reject_nul else SPOOL_ESCAPES
+
+    @staticmethod
+    def supports(connection):
+        """
+        :return: True if the native loader supports the supplied connection.
+        """
+        return connection.vendor in ('mysql', 'postgresql')
+
+    def add(self, key, model, fields, rows):
+        """
+        Spool rows to be loaded into the models table, loading the spool once
+        it contains NATIVE_SPOOL_ROWS rows.
+        :raises ValueError: If a value holds a NUL character on PostgreSQL,
+                            as the ORM does.
+        """
+        start = time.monotonic()
+        spool_key = (key, model)
+        if spool_key not in self.spools:
+            spool_file = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', newline='', suffix='.tsv',
+                                                     delete=False)
+            model_fields = [model._meta.get_field(field) for field in fields]
+            self.spools[spool_key] = [spool_file, model_fields, 0]
+        spool = self.spools[spool_key]
+        spool_file, model_fields = spool[0], spool[1]
+
+        lines = []
+        for row in rows:
+            values = []
+            for field, value in zip(model_fields, row):
+                value = field.get_db_prep_save(value, self.connection)
+                if value is None:
+                    values.append(SPOOL_NULL)
+                elif isinstance(value, bool):
+                    values.append('1' if value else '0')
+                else:
+                    value = str(value)
+                    if self.reject_nul and '\0' in value:
+                        raise ValueError("value of " + field.name + " contains NUL (0x00) characters, which PostgreSQL "
+                                         "text cannot hold")
+                    values.append(value.translate(self.escapes))
+            lines.append('\t'.join(values))
+        if lines:
+            spool_file.write('\n'.join(lines))
+            spool_file.write('\n')
+        spool[2] = spool[2] + len(rows)
+        self._record_time(key, start)
+
+        if spool[2] >= NATIVE_SPOOL_ROWS:
+            self._load(spool_key)
+
+    def flush(self, key=None):
+        """
+        Load spooled rows, in the order their tables were first added.
+        :param key: If supplied, only rows added with this key are loaded.
+        """
+        for spool_key in list(self.spools):
+            if key is None or spool_key[0] == key:
+                self._load(spool_key)
+
+    def discard(self):
+        """
+        Close and remove every spool file not yet loaded, discarding its rows.
+        Called once the import has finished or failed, so that spools are not
+        left behind in the temporary directory when it fails before loading
+        them all.
+        """
+        while self.spools:
+            spool_key, spool = self.spools.popitem()
+            spool_file = spool[0]
+            try:
+                spool_file.close()
+            except OSError:
+                # The spool is being removed, so failing to flush it is of no consequence
+                pass
+            if os.path.exists(spool_file.name):
+                os.remove(spool_file.name)
+
+    def _load(self, spool_key):
+        """
+        Load the identified spool into its table and discard the spool.
+        """
+        key, model = spool_key
+        spool_file, model_fields, row_count = self.spools.pop(spool_key)
+        start = time.monotonic()
+        try:
+            spool_file.close()
+            if row_count == 0:
+                return
+            quote_name = self.connection.ops.quote_name
+            table = quote_name(model._meta.db_table)
+            columns = ', '.join(quote_name(field.column) for field in model_fields)
+            with self.connection.cursor() as cursor:
+                if self.connection.vendor == 'mysql':
+                    cursor.execute("LOAD DATA LOCAL INFILE %s INTO TABLE " + table + " CHARACTER SET utf8mb4 "
+                                   "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                                   "(" + columns + ")", [spool_file.name])
+                else:
+                    with open(spool_file.name, 'r', encoding='utf-8') as spool_data:
+                        cursor.cursor.copy_expert("COPY " + table + " (" + columns + ") FROM STDIN", spool_data)
+        finally:
+            os.remove(spool_file.name)
+            self._record_time(key, start)
+
+
+def get_loader(batch_size, name=None, connection=default_connection):
+    """
+    Return the loader to use for bulk importing rows.
+    :param batch_size: Number of rows to create per database hit by the ORM.
+    :param name: Name of the loader to use, defaults to the IMPORT_BULK_LOADER
+                 setting.
+    :param connection: Database connection to load rows through.
+    :return: The selected loader, or an OrmLoader if the selected loader does
+             not support the database in use (ie SQLite).
+    """
+    name = name or getattr(settings, 'IMPORT_BULK_LOADER', LOADER_ORM)
+    if name == LOADER_NATIVE and NativeLoader.supports(connection):
+        return NativeLoader(batch_size, connection)
+    return OrmLoader(batch_size, connection)
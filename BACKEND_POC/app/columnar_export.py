@@ -0,0 +1,208 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import io
+import json
+import numpy as np
+from app.graph_export import iter_values
+from app.models import AttribTypeChoice, attrib_str_to_value
+from app.models import GraphAttribDefVertex, GraphAttribDefTrans, Vertex, VertexAttrib, Transaction, TransactionAttrib
+from app.serializers import get_graph_json, get_vertex_attrs_json, get_transaction_attrs_json
+
+
+# <editor-fold Constants">
+# Version of the columnar format, recorded in its metadata.
+COLUMNAR_FORMAT_VERSION = 1
+
+# Name of the array holding the UTF-8 encoded JSON metadata of the export.
+META_ARRAY = 'meta'
+
+# Numpy types of attribute columns, by AttribTypeChoice. STRING and DICT
+# columns are stored as UTF-8 data with offsets (DICT values as JSON text).
+COLUMN_DTYPES = {
+    AttribTypeChoice.BOOL.value: np.bool_,
+    AttribTypeChoice.FLOAT.value: np.float64,
+    AttribTypeChoice.INTEGER.value: np.int64,
+}
+# </editor-fold>
+
+
+# <editor-fold Common functions">
+def _string_arrays(values):
+    """
+    Encode a list of strings (or None) as the offsets and data arrays of a
+    string column, the UTF-8 bytes of value i being data[offsets[i]:offsets[i + 1]].
+    :return: Tuple of (offsets, data) arrays.
+    """
+    encoded = [value.encode('utf-8') if value is not None else b'' for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def _attribute_column(raw_type, rows, count):
+    """
+    Build the arrays of an attribute column.
+    :param raw_type: AttribTypeChoice value of the attribute.
+    :param rows: List of (row index, value_str) tuples of the attribute.
+    :param count: Number of rows in the column.
+    :return: Dictionary of arrays keyed by suffix, being 'valid' (True where
+             the row has a value) and either 'values', or 'offsets' and
+             'data' for STRING and DICT columns.
+    """
+    valid = np.zeros(count, dtype=np.bool_)
+    dtype = COLUMN_DTYPES.get(raw_type)
+    if dtype is None:
+        values = [None] * count
+        for index, value_str in rows:
+            values[index] = value_str
+            valid[index] = True
+        offsets, data = _string_arrays(values)
+        return {'valid': valid, 'offsets': offsets, 'data': data}
+
+    values = np.full(count, np.nan if dtype is np.float64 else 0, dtype=dtype)
+    for index, value_str in rows:
+        value = attrib_str_to_value(raw_type, value_str)
+        if value is not None:
+            values[index] = value
+            valid[index] = True
+    return {'valid': valid, 'values': values}
+
+
+def _element_columns(prefix, attribute_def_model, attribute_model, fk_name, row_indexes, graph):
+    """
+    Build the attribute columns of a graphs vertexes or transactions.
+    :param prefix: Prefix of the array names ('vertex' or 'transaction').
+    :param attribute_def_model: GraphAttribDefVertex or GraphAttribDefTrans.
+    :param attribute_model: VertexAttrib or TransactionAttrib.
+    :param fk_name: Name of the attribute models FK to its element.
+    :param row_indexes: Dictionary of element primary key to row index.
+    :param graph: Parent Graph object.
+    :return: Tuple of the dictionary of arrays and list of column metadata.
+    """
+    attribute_defs = list(attribute_def_model.objects.filter(graph_fk=graph.id).select_related('type_fk')
+                          .order_by('id'))
+    rows = {attribute_def.id: [] for attribute_def in attribute_defs}
+    queryset = attribute_model.objects.filter(**{fk_name + '__graph_fk': graph.id})\
+        .values_list(fk_name + '_id', 'attrib_fk_id', 'value_str')
+    for element_id, attribute_def_id, value_str in iter_values(queryset, flat=False):
+        rows[attribute_def_id].append((row_indexes[element_id], value_str))
+
+    arrays = {}
+    columns = []
+    for attribute_def in attribute_defs:
+        raw_type = attribute_def.type_fk.raw_type
+        column = _attribute_column(raw_type, rows.pop(attribute_def.id), len(row_indexes))
+        for suffix, array in column.items():
+            arrays[prefix + '.' + attribute_def.label + '.' + suffix] = array
+        columns.append({'label': attribute_def.label, 'type': attribute_def.type_fk.label,
+                        'raw_type': AttribTypeChoice(raw_type).name,
+                        'arrays': sorted(prefix + '.' + attribute_def.label + '.' + suffix for suffix in column)})
+    return arrays, columns
+# </editor-fold>
+
+
+def build_graph_columns(graph):
+    """
+    Build the columnar representation of a graph. Vertexes and transactions
+    each have one column per attribute definition, typed from the
+    definitions AttribTypeChoice, alongside their IDs (and for transactions,
+    the vx_id of their source and destination vertexes and their direction),
+    all in order of creation. The graph attributes and attribute definitions
+    are included in the JSON metadata, as per the legacy JSON format.
+    :param graph: Graph object.
+    :return: Dictionary of numpy arrays keyed by name.
+    """
+    vertexes = list(iter_values(Vertex.objects.filter(graph_fk=graph.id).order_by('id').values_list('id', 'vx_id'),
+                                flat=False))
+    vertex_indexes = {vertex_id: index for index, (vertex_id, vx_id) in enumerate(vertexes)}
+    arrays = {'vertex.vx_id': np.array([vx_id for vertex_id, vx_id in vertexes], dtype=np.int64)}
+    vx_ids = dict(vertexes)
+    del vertexes
+    vertex_arrays, vertex_columns = _element_columns('vertex', GraphAttribDefVertex, VertexAttrib, 'vertex_fk',
+                                                     vertex_indexes, graph)
+    arrays.update(vertex_arrays)
+    del vertex_indexes
+
+    transactions = list(iter_values(Transaction.objects.filter(graph_fk=graph.id).order_by('id')
+                                    .values_list('id', 'tx_id', 'vx_src_id', 'vx_dst_id', 'tx_dir'), flat=False))
+    transaction_indexes = {transaction[0]: index for index, transaction in enumerate(transactions)}
+    arrays['transaction.tx_id'] = np.array([transaction[1] for transaction in transactions], dtype=np.int64)
+    arrays['transaction.vx_src'] = np.array([vx_ids[transaction[2]] for transaction in transactions], dtype=np.int64)
+    arrays['transaction.vx_dst'] = np.array([vx_ids[transaction[3]] for transaction in transactions], dtype=np.int64)
+    arrays['transaction.tx_dir'] = np.array([transaction[4] for transaction in transactions], dtype=np.bool_)
+    del transactions
+    transaction_arrays, transaction_columns = _element_columns('transaction', GraphAttribDefTrans,
+                                                               TransactionAttrib, 'transaction_fk',
+                                                               transaction_indexes, graph)
+    arrays.update(transaction_arrays)
+
+    meta = {
+        'format_version': COLUMNAR_FORMAT_VERSION,
+        'schema': str(graph.schema_fk.label) if graph.schema_fk_id is not None else None,
+        'graph': get_graph_json(graph),
+        'vertex': {'count': len(arrays['vertex.vx_id']), 'attrs': get_vertex_attrs_json(graph),
+                   'columns': vertex_columns},
+        'transaction': {'count': len(arrays['transaction.tx_id']), 'attrs': get_transaction_attrs_json(graph),
+                        'columns': transaction_columns},
+    }
+    arrays[META_ARRAY] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+    return arrays
+
+
+def iter_graph_npz(graph, compressed=False):
+    """
+    Export the columnar representation of a graph (refer to
+    build_graph_columns) as a numpy .npz archive, readable using numpy.load
+    and load_graph_npz.
+    :param graph: Graph object.
+    :param compressed: True to compress the archive.
+    :return: Generator of the archives bytes.
+    """
+    buffer = io.BytesIO()
+    if compressed:
+        np.savez_compressed(buffer, **build_graph_columns(graph))
+    else:
+        np.savez(buffer, **build_graph_columns(graph))
+    yield buffer.getvalue()
+
+
+def load_graph_npz(file):
+    """
+    Load a graph exported by iter_graph_npz.
+    :param file: Path or file object of the .npz archive.
+    :return: Tuple of the metadata dictionary and dictionary of arrays.
+    """
+    with np.load(file, allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    meta = json.loads(arrays.pop(META_ARRAY).tobytes().decode('utf-8'))
+    return meta, arrays
+
+
+def column_strings(arrays, name):
+    """
+    Decode the strings of a STRING or DICT column loaded by load_graph_npz.
+    :param arrays: Dictionary of arrays.
+    :param name: Array name prefix of the column, ie 'vertex.Identifier'.
+    :return: List of strings, with None where a row has no value.
+    """
+    offsets = arrays[name + '.offsets']
+    data = arrays[name + '.data'].tobytes()
+    valid = arrays[name + '.valid']
+    return [data[offsets[index]:offsets[index + 1]].decode('utf-8') if valid[index] else None
+            for index in range(len(valid))]
@@ -0,0 +1,81 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# <editor-fold Constants">
+# Suffix of lookups accepting a comma separated list of values, ie ?vx_id__in=1,2,3
+IN_SUFFIX = '__in'
+IN_SEPARATOR = ','
+# </editor-fold>
+
+
+class FieldFilterBackend(BaseFilterBackend):
+    """
+    Filter the records of list endpoints by field values supplied as query
+    parameters, ie vertex_attributes/?graph_fk=12&attrib_fk__label=x. The
+    parameters accepted by a view are listed in its filter_fields attribute,
+    either as a tuple of ORM lookups used as parameter names, or as a
+    dictionary mapping parameter names to ORM lookups. Lookups ending in
+    __in take a comma separated list of values. Other query parameters are
+    ignored, and invalid values are rejected with 400 Bad Request. Filter on
+    indexed (ie foreign key) fields, so that pages of filtered records are
+    read using an index (refer to app/pagination.py).
+    """
+
+    @staticmethod
+    def get_filter_fields(view):
+        """
+        :return: Dictionary mapping query parameter names to ORM lookups.
+        """
+        filter_fields = getattr(view, 'filter_fields', ())
+        if isinstance(filter_fields, dict):
+            return filter_fields
+        return {lookup: lookup for lookup in filter_fields}
+
+    def filter_queryset(self, request, queryset, view):
+        filters = {}
+        for parameter, lookup in self.get_filter_fields(view).items():
+            value = request.query_params.get(parameter)
+            if value is None:
+                continue
+            if lookup.endswith(IN_SUFFIX):
+                value = [item for item in value.split(IN_SEPARATOR) if item != '']
+            filters[lookup] = value
+        if not filters:
+            return queryset
+        try:
+            return queryset.filter(**filters)
+        except (ValueError, TypeError, DjangoValidationError) as ex:
+            raise ValidationError({'filter': str(ex)})
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [coreapi.Field(name=parameter, required=False, location='query',
+                              schema=coreschema.String(description='Filter by ' + lookup))
+                for parameter, lookup in self.get_filter_fields(view).items()]
+
+    def get_schema_operation_parameters(self, view):
+        return [{'name': parameter, 'required': False, 'in': 'query', 'description': 'Filter by ' + lookup,
+                 'schema': {'type': 'string'}}
+                for parameter, lookup in self.get_filter_fields(view).items()]
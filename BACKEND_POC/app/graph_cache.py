@@ -0,0 +1,286 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F
+from app.models import GraphJsonVersion
+from websockets.suppression import suppress
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# <editor-fold Constants">
+# Defaults of the GRAPH_JSON_CACHE setting, refer to settings.py
+DEFAULT_MAX_DOCUMENTS = 16
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_REDIS_TIMEOUT = 60 * 60
+
+# Prefix of the Redis keys of cached documents
+REDIS_KEY_PREFIX = 'graph_json:'
+
+# ID of the GraphJsonVersion row holding the generation of all documents, not
+# the ID of any graph
+GENERATION_GRAPH_ID = 0
+# </editor-fold>
+
+
+class _PendingBumps:
+    """
+    Graphs changed within a transaction, whose versions are bumped once when
+    it commits.
+    """
+
+    def __init__(self, cache, connection):
+        self.cache = cache
+        self.graph_ids = set()
+        # The commit hook, registered once, and its position in the
+        # connections list of hooks. The hook is discarded by Django if the
+        # transaction (or savepoint) it was registered in rolls back, along
+        # with the changes made within it.
+        self.callback = self.bump
+        transaction.on_commit(self.callback, using=connection.alias)
+        self.connection = connection
+        self.index = len(connection.run_on_commit) - 1
+
+    def is_pending(self):
+        """
+        :return: True if the commit hook is still registered, ie the
+                 transaction it was registered in has neither committed nor
+                 been rolled back.
+        """
+        run_on_commit = self.connection.run_on_commit
+        return len(run_on_commit) > self.index and run_on_commit[self.index][1] is self.callback
+
+    def bump(self):
+        self.cache._bump(self.graph_ids, self.connection.alias)
+
+
+class GraphJsonCache:
+    """
+    Cache of serialized graph JSON documents (refer to the GraphJson views).
+    Each graph has a version counter, stored in the database (refer to
+    app/models.py:GraphJsonVersion) so that every process sees changes made
+    by any process, which is bumped, via the receivers in
+    websockets/consumers.py, whenever a record of the graph changes. Writes
+    made with those receivers suppressed, or without signals (refer to
+    app/attribute_json.py), call graph_changed themselves after writing. A
+    document is cached against the version of its graph at the time it was
+    built, so changes never need to find and evict the documents they
+    affect; stale documents are simply never looked up again and age out of
+    the LRU. A global generation counter, bumped by invalidate_all, covers
+    changes affecting every graph (ie attribute types).
+    Documents are held in an in-process LRU bounded by both document count
+    and total size. If a Redis URL is configured, documents are also shared
+    between processes through Redis.
+    """
+
+    def __init__(self, max_documents=DEFAULT_MAX_DOCUMENTS, max_bytes=DEFAULT_MAX_BYTES, redis_url=None,
+                 redis_timeout=DEFAULT_REDIS_TIMEOUT):
+        """
+        :param max_documents: Maximum number of documents held in process.
+        :param max_bytes: Maximum total size of documents held in process,
+                          larger documents are not held.
+        :param redis_url: Optional URL of a Redis database to share
+                          documents through.
+        :param redis_timeout: Seconds documents are kept in Redis for.
+        """
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.redis_timeout = redis_timeout
+        self.redis = None
+        if redis_url:
+            if redis is None:
+                logger.warning('The redis package is not installed, graph JSON caching will be per process')
+            else:
+                self.redis = redis.Redis.from_url(redis_url)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.documents = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # <editor-fold Versioning">
+    def version(self, graph_id, using=DEFAULT_DB_ALIAS):
+        """
+        :return: Tuple identifying the current version of the graphs
+                 documents, being the generation and the graphs version.
+        """
+        versions = dict(GraphJsonVersion.objects.using(using).filter(
+            graph_id__in=(GENERATION_GRAPH_ID, graph_id)).values_list('graph_id', 'version'))
+        return versions.get(GENERATION_GRAPH_ID, 0), versions.get(graph_id, 0)
+
+    def graph_changed(self, graph_id, using=DEFAULT_DB_ALIAS):
+        """
+        Bump the version of a graph whose records have changed. If called
+        within a transaction the version is bumped once it commits, so a
+        document built from uncommitted data is never cached against the new
+        version, and only once however many records of the graph changed.
+        """
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            self._bump([graph_id], using)
+            return
+        if not hasattr(self.local, 'pending'):
+            self.local.pending = {}
+        pending = self.local.pending.get(using)
+        if pending is None or not pending.is_pending():
+            pending = _PendingBumps(self, connection)
+            self.local.pending[using] = pending
+        pending.graph_ids.add(graph_id)
+
+    @contextmanager
+    def suppress_changes(self, graph_id, *receivers, using=DEFAULT_DB_ALIAS):
+        """
+        Context manager suppressing the supplied receivers for the writes to a
+        graph within it (refer to websockets/suppression.py:suppress). The
+        suppressed receivers would have bumped the graphs version, so it is
+        bumped once the writes complete instead.
+        :param graph_id: ID of the graph written.
+        :param receivers: Receivers to suppress.
+        :param using: Alias of the database written.
+        """
+        with suppress(*receivers):
+            yield
+        self.graph_changed(graph_id, using)
+
+    def invalidate_all(self, using=DEFAULT_DB_ALIAS):
+        """
+        Bump the generation counter, invalidating the documents of all
+        graphs once the current transaction (if any) commits.
+        """
+        self.graph_changed(GENERATION_GRAPH_ID, using)
+
+    @staticmethod
+    def _bump(graph_ids, using):
+        """
+        Bump the versions of graphs, in graph ID order so that concurrent
+        bumps of the same graphs cannot deadlock.
+        """
+        versions = GraphJsonVersion.objects.using(using)
+        for graph_id in sorted(graph_ids):
+            if versions.filter(graph_id=graph_id).update(version=F('version') + 1):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    versions.create(graph_id=graph_id, version=1)
+            except IntegrityError:
+                # Created by a concurrent bump
+                versions.filter(graph_id=graph_id).update(version=F('version') + 1)
+    # </editor-fold>
+
+    # <editor-fold Documents">
+    def get_or_build(self, part, graph_id, build):
+        """
+        Return a graph document, building and caching it if the current
+        version of the document is not cached.
+        :param part: Name of the part of the graph the document represents.
+        :param graph_id: ID of the Graph.
+        :param build: Callable returning the document as bytes, only invoked
+                      if the document is not cached. Exceptions are passed
+                      through without anything being cached.
+        :return: Document bytes.
+        """
+        # The version is read before building, so if the graph changes while
+        # building, the document is cached against the now stale version
+        key = (part, graph_id) + self.version(graph_id)
+        document = self._get(key)
+        if document is not None:
+            return document
+        with self.lock:
+            self.misses = self.misses + 1
+        document = build()
+        self._put(key, document)
+        return document
+
+    def stats(self):
+        """
+        :return: Dictionary of statistics of the in process cache.
+        """
+        with self.lock:
+            return {'documents': len(self.documents), 'bytes': self.total_bytes, 'hits': self.hits,
+                    'misses': self.misses}
+
+    def clear(self):
+        """
+        Discard all documents held in process.
+        """
+        with self.lock:
+            self.documents.clear()
+            self.total_bytes = 0
+
+    def _get(self, key):
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                self.hits = self.hits + 1
+                return document
+        if self.redis is None:
+            return None
+        document = self.redis.get(self._redis_key(key))
+        if document is not None:
+            self._put(key, document, share=False)
+            with self.lock:
+                self.hits = self.hits + 1
+        return document
+
+    def _put(self, key, document, share=True):
+        if share and self.redis is not None:
+            self.redis.set(self._redis_key(key), document, ex=self.redis_timeout)
+        if len(document) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.documents:
+                return
+            self.documents[key] = document
+            self.total_bytes = self.total_bytes + len(document)
+            while len(self.documents) > self.max_documents or self.total_bytes > self.max_bytes:
+                evicted_key, evicted = self.documents.popitem(last=False)
+                self.total_bytes = self.total_bytes - len(evicted)
+
+    @staticmethod
+    def _redis_key(key):
+        return REDIS_KEY_PREFIX + 'document:' + ':'.join(str(component) for component in key)
+    # </editor-fold>
+
+
+def _create_cache():
+    """
+    Create the cache as configured by the GRAPH_JSON_CACHE setting.
+    """
+    config = getattr(settings, 'GRAPH_JSON_CACHE', {})
+    return GraphJsonCache(max_documents=config.get('MAX_DOCUMENTS', DEFAULT_MAX_DOCUMENTS),
+                          max_bytes=config.get('MAX_BYTES', DEFAULT_MAX_BYTES),
+                          redis_url=config.get('REDIS_URL'),
+                          redis_timeout=config.get('REDIS_TIMEOUT', DEFAULT_REDIS_TIMEOUT))
+
+
+# The cache shared by the process
+graph_json_cache = _create_cache()
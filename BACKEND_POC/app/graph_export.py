@@ -0,0 +1,184 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.db import connection
+from django.db.models import Func, TextField
+from rest_framework.renderers import JSONRenderer
+from app.models import Vertex, Transaction
+from app.serializers import get_graph_json, get_vertex_attrs_json, get_transaction_attrs_json
+
+
+# <editor-fold Constants">
+# Number of rows fetched from the database, and joined into each chunk of
+# output, at a time.
+EXPORT_CHUNK_SIZE = 2000
+
+# Keys listed in the "key" entry of the vertex and transaction blocks, as per
+# get_vertex_json and get_transaction_json.
+VERTEX_KEYS = ['Identifier', 'Type']
+TRANSACTION_KEYS = ['Identifier', 'Type']
+
+# Text output for rows without any attribute JSON.
+EMPTY_ROW = '{}'
+# </editor-fold>
+
+
+class AttributeJsonText(Func):
+    """
+    Expression returning the JSON text of the object held in an attribute_json
+    field, without it being decoded. The functions used return objects as
+    their JSON text, and unquote a JSON string holding the JSON text of an
+    object (as attribute_json was stored prior to migration 0006).
+    """
+    function = 'JSON_UNQUOTE'
+    output_field = TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="(%(expressions)s #>> '{}')", **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="json_extract(%(expressions)s, '$')", **extra_context)
+
+
+def _render(data):
+    """
+    Render data as JSON text, matching the output of the GraphJson serializers.
+    """
+    if data is None:
+        # Rendered by JSONRenderer as an empty document
+        return 'null'
+    return JSONRenderer().render(data).decode('utf-8')
+
+
+def iter_values(queryset, chunk_size=EXPORT_CHUNK_SIZE, flat=True):
+    """
+    Iterate the values of a values_list queryset, fetching chunk_size
+    rows at a time using a server-side cursor so that memory use does not
+    grow with the number of rows. Django uses server-side cursors for
+    iterator() on PostgreSQL, but not on MySQL/MariaDB where the whole result
+    is otherwise buffered by the client, so an unbuffered SSCursor is used
+    there.
+    :param queryset: values_list queryset.
+    :param chunk_size: Number of rows fetched at a time.
+    :param flat: True if the queryset is flat (values_list(flat=True)).
+    :return: Generator of values, or of row tuples if not flat.
+    """
+    if connection.vendor != 'mysql':
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+
+    from MySQLdb.cursors import SSCursor
+    sql, params = queryset.query.sql_with_params()
+    connection.ensure_connection()
+    cursor = connection.connection.cursor(SSCursor)
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchmany(chunk_size)
+        while rows:
+            for row in rows:
+                yield row[0] if flat else row
+            rows = cursor.fetchmany(chunk_size)
+    finally:
+        # Closing an unbuffered cursor discards any unread rows
+        cursor.close()
+
+
+def iter_attribute_json(model, graph, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the attribute_json text of a graphs vertexes or transactions, as
+    comma separated JSON text ready to be spliced into a JSON list.
+    :param model: Vertex or Transaction.
+    :param graph: Parent Graph object.
+    :param chunk_size: Number of rows fetched and joined at a time.
+    :return: Generator of strings.
+    """
+    rows = iter_values(model.objects.filter(graph_fk=graph.id).order_by('id')
+                       .values_list(AttributeJsonText('attribute_json'), flat=True), chunk_size)
+    chunk = []
+    separator = ''
+    for text in rows:
+        chunk.append(text or EMPTY_ROW)
+        if len(chunk) >= chunk_size:
+            yield separator + ','.join(chunk)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + ','.join(chunk)
+
+
+def iter_block_json(model, graph, attrs, keys, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream a vertex or transaction block of a graph JSON representation,
+    being a list of its attribute definitions and rows.
+    :param model: Vertex or Transaction.
+    :param graph: Parent Graph object.
+    :param attrs: List of attribute definitions.
+    :param keys: List of key attribute labels.
+    :param chunk_size: Number of rows fetched and joined at a time.
+    :return: Generator of strings.
+    """
+    yield '[' + _render({'attrs': attrs, 'key': keys}) + ',{"data":['
+    for text in iter_attribute_json(model, graph, chunk_size):
+        yield text
+    yield ']}]'
+
+
+def iter_graph_json(graph, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the JSON representation of a graph, as returned by
+    GraphJsonSerializer, splicing the stored attribute_json of each vertex and
+    transaction into the output rather than decoding and re-encoding it.
+    :param graph: Graph object.
+    :param chunk_size: Number of rows fetched and joined at a time.
+    :return: Generator of bytes.
+    """
+    schema = str(graph.schema_fk.label) if graph.schema_fk_id is not None else None
+    yield ('{"schema":' + _render(schema) + ',"graph":' + _render(get_graph_json(graph)) +
+           ',"vertex":').encode('utf-8')
+    for text in iter_block_json(Vertex, graph, get_vertex_attrs_json(graph), VERTEX_KEYS, chunk_size):
+        yield text.encode('utf-8')
+    yield b',"transaction":'
+    for text in iter_block_json(Transaction, graph, get_transaction_attrs_json(graph), TRANSACTION_KEYS,
+                                chunk_size):
+        yield text.encode('utf-8')
+    yield b'}'
+
+
+def iter_graph_vertex_json(graph, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the vertex component of a graphs JSON representation, as returned
+    by GraphJsonVertexesSerializer.
+    :return: Generator of bytes.
+    """
+    yield b'{"vertex":'
+    for text in iter_block_json(Vertex, graph, get_vertex_attrs_json(graph), VERTEX_KEYS, chunk_size):
+        yield text.encode('utf-8')
+    yield b'}'
+
+
+def iter_graph_transaction_json(graph, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the transaction component of a graphs JSON representation, as
+    returned by GraphJsonTransactionsSerializer.
+    :return: Generator of bytes.
+    """
+    yield b'{"transaction":'
+    for text in iter_block_json(Transaction, graph, get_transaction_attrs_json(graph), TRANSACTION_KEYS,
+                                chunk_size):
+        yield text.encode('utf-8')
+    yield b'}'
@@ -0,0 +1,613 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+import time
+import zipfile
+import ijson
+from django.conf import settings
+from django.db import transaction
+from app.bulkload import get_loader, deferred_checks
+from app.models import AttribType, AttribTypeChoice
+from app.models import Schema, Graph, GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex, GraphAttribDefTrans
+from app.models import Vertex, VertexAttrib, Transaction, TransactionAttrib
+from app.purge import purge_graphs
+from websockets.consumers import graph_attribute_def_graph_saved, graph_attribute_def_vertex_saved
+from websockets.consumers import graph_attribute_def_transaction_saved
+from websockets.suppression import suppress
+
+
+# <editor-fold Constants">
+# Configuration of how many records (ie vertexes, transactions, vertex
+# attributes, or transaction attributes) should be sent in a hit to the
+# database for creation. This also bounds the number of parsed vertexes or
+# transactions held in memory at any one time.
+IMPORT_BATCH_SIZE = 2000
+
+# Minimum number of seconds between progress reports made by the importer.
+IMPORT_PROGRESS_INTERVAL = 1.0
+
+# Name of the file within a .star archive that holds the graph JSON.
+STAR_GRAPH_MEMBER = 'graph.txt'
+
+# The graph JSON is a list of single key 'blocks' (version, graph, vertex,
+# transaction and meta). These are the ijson prefixes of the components of
+# those blocks that are processed by the importer. Data prefixes identify
+# individual records, which are streamed one at a time.
+PREFIX_SCHEMA = 'item.schema'
+PREFIX_GRAPH_ATTRS = 'item.graph.item.attrs'
+PREFIX_GRAPH_DATA = 'item.graph.item.data.item'
+PREFIX_VERTEX_ATTRS = 'item.vertex.item.attrs'
+PREFIX_VERTEX_DATA = 'item.vertex.item.data.item'
+PREFIX_TRANSACTION_ATTRS = 'item.transaction.item.attrs'
+PREFIX_TRANSACTION_DATA = 'item.transaction.item.data.item'
+ATTRS_PREFIXES = (PREFIX_GRAPH_ATTRS, PREFIX_VERTEX_ATTRS, PREFIX_TRANSACTION_ATTRS)
+
+# Keys of vertex and transaction records that identify the record rather than
+# holding an attribute value.
+VERTEX_ID_KEY = 'vx_id_'
+TRANSACTION_ID_KEY = 'tx_id_'
+TRANSACTION_SRC_KEY = 'vx_src_'
+TRANSACTION_DST_KEY = 'vx_dst_'
+TRANSACTION_DIR_KEY = 'tx_dir_'
+TRANSACTION_KEYS = (TRANSACTION_ID_KEY, TRANSACTION_SRC_KEY, TRANSACTION_DST_KEY, TRANSACTION_DIR_KEY)
+
+# Fields of the rows passed to the bulk loader for each imported model.
+GRAPH_ATTRIB_FIELDS = ('graph_fk_id', 'attrib_fk_id', 'value_str')
+VERTEX_FIELDS = ('graph_fk_id', 'vx_id', 'attribute_json')
+VERTEX_ATTRIB_FIELDS = ('vertex_fk_id', 'attrib_fk_id', 'value_str')
+TRANSACTION_FIELDS = ('graph_fk_id', 'tx_id', 'vx_src_id', 'vx_dst_id', 'tx_dir', 'attribute_json')
+TRANSACTION_ATTRIB_FIELDS = ('transaction_fk_id', 'attrib_fk_id', 'value_str')
+# </editor-fold>
+
+
+# <editor-fold Common functions">
+class StarImportError(Exception):
+    """
+    Bespoke exception thrown if the content of a star file cannot be imported.
+    """
+    pass
+
+
+def iter_star_elements(json_file, prefixes):
+    """
+    Incrementally parse the graph JSON of a star file, yielding each complete
+    value found at one of the requested prefixes as a (prefix, value) tuple.
+    Values are built one at a time from the parser events, so memory use is
+    bounded by the largest single value rather than the size of the file.
+    :param json_file: Binary file object containing the graph JSON.
+    :param prefixes: Collection of ijson prefixes to extract.
+    :return: Generator of (prefix, value) tuples in file order.
+    """
+    builder = None
+    builder_prefix = None
+    depth = 0
+    for prefix, event, value in ijson.parse(json_file, use_float=True):
+        if builder is None:
+            if prefix not in prefixes:
+                continue
+            if event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+                builder_prefix = prefix
+                builder.event(event, value)
+                depth = 1
+            elif event not in ('map_key', 'end_map', 'end_array'):
+                yield prefix, value
+            continue
+
+        builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth = depth + 1
+        elif event in ('end_map', 'end_array'):
+            depth = depth - 1
+            if depth == 0:
+                yield builder_prefix, builder.value
+                builder = None
+
+
+class _CountingReader:
+    """
+    Minimal wrapper of a binary file object that counts the bytes read from
+    it, used to report how far through the graph JSON the parser has reached.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read = self.bytes_read + len(data)
+        return data
+
+
+def transaction_attribute_rows(transaction_ids, attribute_values):
+    """
+    Build TransactionAttrib rows for a batch of created transactions.
+    :param transaction_ids: Primary keys of the transactions in the batch, as
+                            returned by the loaders add_with_ids.
+    :param attribute_values: List of the attribute values of each transaction,
+                             as lists of (definition ID, value) tuples.
+    :return: List of rows matching TRANSACTION_ATTRIB_FIELDS.
+    """
+    rows = []
+    for offset, values in enumerate(attribute_values):
+        for attribute_def_id, value in values:
+            rows.append((transaction_ids[offset], attribute_def_id, value))
+    return rows
+
+
+def delete_graphs(**filters):
+    """
+    Delete the Graphs matching the supplied filters along with all of their
+    records, publishing a single update for each deleted Graph rather than
+    one for each deleted record (refer to app/purge.py).
+    :param filters: Keyword filters identifying the Graphs to delete.
+    :return: Dictionary of the number of records deleted, keyed by record type.
+    """
+    return purge_graphs(Graph.objects.filter(**filters).values_list('pk', flat=True))
+# </editor-fold>
+
+
+class StarFileImporter:
+    """
+    Streaming importer of legacy star files. The graph JSON is read straight
+    out of the star (zip) archive and parsed incrementally, with vertexes and
+    transactions (and their attributes) written to the database in batches of
+    IMPORT_BATCH_SIZE records as they are parsed. Beyond the current batch,
+    the only per-record state retained is a map of vx_id to Vertex primary key,
+    which is needed to link transactions to their vertexes. Primary keys are
+    obtained as each batch is written (refer to OrmLoader.add_with_ids), so
+    the created rows never need to be read back to link their attributes.
+    By default (refer to the IMPORT_ATOMIC setting) the whole import, including
+    the deletion of any graph it replaces, is performed in a single transaction
+    with constraint checks deferred, so a failed import leaves the database
+    untouched.
+    Rows are written by a bulk loader (refer to app.bulkload), which either
+    creates them through the ORM or using the databases native bulk load
+    statement.
+    """
+
+    def __init__(self, star_filename, title, batch_size=IMPORT_BATCH_SIZE, progress=None, loader=None,
+                 atomic=None):
+        """
+        :param star_filename: Path of the star file to import.
+        :param title: Title of the Graph to create. Any existing Graph with
+                      this title is replaced.
+        :param batch_size: Number of records to create per database hit.
+        :param progress: Optional callable, invoked at most every
+                         IMPORT_PROGRESS_INTERVAL seconds as the import
+                         progresses with the arguments (importer, percent).
+        :param loader: Name of the bulk loader to use, defaults to the
+                       IMPORT_BULK_LOADER setting.
+        :param atomic: True to perform the import in a single transaction,
+                       defaults to the IMPORT_ATOMIC setting.
+        """
+        self.star_filename = star_filename
+        self.title = title
+        self.batch_size = batch_size
+        self.progress = progress
+        self.loader = get_loader(batch_size, loader)
+        self.atomic = getattr(settings, 'IMPORT_ATOMIC', True) if atomic is None else atomic
+        self.reader = None
+        self.json_size = 0
+        self.last_progress = 0.0
+        self.graph = None
+        self.schema = None
+        self.attr_types = {}
+        self.graph_attribute_defs = {}
+        self.vertex_attribute_defs = {}
+        self.transaction_attribute_defs = {}
+        self.vertex_ids = {}
+        self.pending_vertexes = []
+        self.pending_transactions = []
+        self.max_vx_id = 0
+        self.max_tx_id = 0
+        self.counts = {'graph_attributes': 0, 'vertexes': 0, 'vertex_attributes': 0,
+                       'transactions': 0, 'transaction_attributes': 0}
+        # Wall-clock seconds spent on each phase of the import, being 'load'
+        # (parsing and writing records), 'commit' for atomic imports, and the
+        # time from starting to finishing writing each record type, keyed as
+        # per counts
+        self.timings = {}
+        self.phase_starts = {}
+
+    def _open_graph_json(self):
+        """
+        Open the graph JSON member of the star file without extracting it to
+        disk.
+        :return: Tuple of the open ZipFile and binary file object of its
+                 graph JSON member, both of which need closing by the caller.
+        """
+        try:
+            zip_ref = zipfile.ZipFile(self.star_filename, 'r')
+        except zipfile.BadZipFile:
+            raise StarImportError("supplied file is not a valid star file")
+        try:
+            self.json_size = zip_ref.getinfo(STAR_GRAPH_MEMBER).file_size
+            return zip_ref, zip_ref.open(STAR_GRAPH_MEMBER)
+        except KeyError:
+            zip_ref.close()
+            raise StarImportError("supplied star file does not contain " + STAR_GRAPH_MEMBER)
+
+    def _iter_elements(self, prefixes):
+        """
+        Stream the requested elements of the star files graph JSON.
+        :param prefixes: Collection of ijson prefixes to extract.
+        :return: Generator of (prefix, value) tuples in file order.
+        """
+        zip_ref, json_file = self._open_graph_json()
+        self.reader = _CountingReader(json_file)
+        try:
+            for prefix, value in iter_star_elements(self.reader, prefixes):
+                yield prefix, value
+        except ijson.JSONError as e:
+            raise StarImportError("graph JSON could not be parsed: " + str(e))
+        finally:
+            json_file.close()
+            zip_ref.close()
+
+    def find_missing_attribute_types(self):
+        """
+        Ensure all attribute types are already defined. Because the import
+        cannot deduce the 'raw type' of defined attribute types, the user
+        needs to make sure all the attribute types are known before the
+        import. Only the (small) attribute definition blocks are retained
+        while scanning the file, and the scan stops once the transaction
+        attribute definitions, the last of them, have been read, so the
+        transaction data is never decompressed or parsed.
+        :return: Set of attribute type labels that are not defined.
+        """
+        known_types = set(AttribType.objects.all().values_list('label', flat=True))
+        missing_attribute_types = set()
+        for prefix, attrs in self._iter_elements(ATTRS_PREFIXES):
+            for attr in attrs:
+                if attr['type'] not in known_types:
+                    missing_attribute_types.add(attr['type'])
+            if prefix == PREFIX_TRANSACTION_ATTRS:
+                break
+        return missing_attribute_types
+
+    def run(self):
+        """
+        Perform the import, replacing any existing Graph with the same title.
+        :return: Dictionary of counts of the records created.
+        """
+        try:
+            if not self.atomic:
+                return self._timed_load()
+
+            with transaction.atomic():
+                with deferred_checks():
+                    self._timed_load()
+                # Deferred constraint checks and index maintenance happen on commit
+                start = time.monotonic()
+            self.timings['commit'] = time.monotonic() - start
+            return self.counts
+        finally:
+            # Remove any rows left spooled by a failed import
+            self.loader.discard()
+
+    def _timed_load(self):
+        """
+        Parse the star file and write its records, timing the 'load' phase.
+        :return: Dictionary of counts of the records created.
+        """
+        start = time.monotonic()
+        self._load()
+        self.timings['load'] = time.monotonic() - start
+        return self.counts
+
+    def _load(self):
+        """
+        Parse the star file and write its records.
+        """
+        self.attr_types = {attr.label: attr for attr in AttribType.objects.all()}
+        handlers = {
+            PREFIX_SCHEMA: self._handle_schema,
+            PREFIX_GRAPH_ATTRS: self._handle_graph_attrs,
+            PREFIX_GRAPH_DATA: self._handle_graph_data,
+            PREFIX_VERTEX_ATTRS: self._handle_vertex_attrs,
+            PREFIX_VERTEX_DATA: self._handle_vertex,
+            PREFIX_TRANSACTION_ATTRS: self._handle_transaction_attrs,
+            PREFIX_TRANSACTION_DATA: self._handle_transaction,
+        }
+        for prefix, value in self._iter_elements(handlers):
+            handlers[prefix](value)
+
+        # Create any leftover records
+        self._flush_vertexes()
+        self._flush_transactions()
+        for key in self.counts:
+            started = time.time()
+            loading_time = self.loader.timings.get(key)
+            self.loader.flush(key)
+            if self.loader.timings.get(key) != loading_time:
+                self._record_phase(key, started, time.time())
+
+        # Update graph counters
+        graph = self._get_graph()
+        graph.next_vertex_id = self.max_vx_id + 1
+        graph.next_transaction_id = self.max_tx_id + 1
+        graph.save()
+
+    def percent_complete(self):
+        """
+        Estimate how much of the import has been performed, based on how far
+        through the graph JSON the parser has read.
+        :return: Percentage of the graph JSON processed.
+        """
+        if self.reader is None or self.json_size == 0:
+            return 0.0
+        return min(100.0, 100.0 * self.reader.bytes_read / self.json_size)
+
+    def rates(self):
+        """
+        :return: Dictionary of rows written per second for each record type
+                 that has been written so far, keyed as per counts.
+        """
+        timings = self.loader.timings
+        return {key: round(self.counts[key] / timings[key], 1)
+                for key in self.counts if timings.get(key, 0) > 0}
+
+    def _report_progress(self):
+        """
+        Invoke the progress callback, if one was supplied and it has not been
+        invoked within the last IMPORT_PROGRESS_INTERVAL seconds.
+        """
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if now - self.last_progress >= IMPORT_PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.progress(self, self.percent_complete())
+
+    def _record_phase(self, key, started, finished):
+        """
+        Extend the wall-clock time of the phase writing the record type
+        identified by key to cover a write made between started and finished,
+        as given by time.time().
+        """
+        started = self.phase_starts.setdefault(key, started)
+        self.timings[key] = max(self.timings.get(key, 0.0), finished - started)
+
+    def _load_rows(self, key, model, fields, rows):
+        """
+        Pass rows to the bulk loader, counting them against the record type
+        identified by key.
+        """
+        started = time.time()
+        self.loader.add(key, model, fields, rows)
+        self.counts[key] = self.counts[key] + len(rows)
+        self._record_phase(key, started, time.time())
+
+    def _load_rows_with_ids(self, key, model, fields, rows):
+        """
+        Write rows straight away, obtaining their primary keys.
+        :return: Range of the primary keys assigned to the rows, in row order.
+        """
+        started = time.time()
+        ids = self.loader.add_with_ids(key, model, fields, rows)
+        self.counts[key] = self.counts[key] + len(rows)
+        self._record_phase(key, started, time.time())
+        return ids
+
+    def _get_graph(self):
+        """
+        Return the Graph being imported into, creating it on first use. If a
+        graph already exists in DB with the same title, all its records are
+        deleted so it can be recreated.
+        :return: Graph object being imported into.
+        """
+        if self.graph is not None:
+            return self.graph
+
+        delete_graphs(title=self.title)
+        self.graph = Graph.objects.create(title=self.title, schema_fk=self.schema,
+                                          next_vertex_id=1, next_transaction_id=1)
+        return self.graph
+
+    def _create_attribute_defs(self, model, receiver, attrs):
+        """
+        Create the supplied attribute definitions for the imported graph.
+        :param model: GraphAttribDef model to create.
+        :param receiver: The post_save receiver of the model, which is
+                         suppressed while creating the definitions.
+        :param attrs: List of attribute definitions from the star file.
+        :return: Dictionary of (created definition ID, is DICT type) tuples
+                 keyed by label, for quick lookup when processing records.
+        """
+        graph = self._get_graph()
+        with suppress(receiver):
+            for attr in attrs:
+                model.objects.create(graph_fk=graph, label=attr['label'], type_fk=self.attr_types[attr['type']],
+                                     descr=attr.get('descr'), default_str=attr.get('default'))
+
+        attribute_defs = {}
+        for attr in model.objects.filter(graph_fk=graph).select_related('type_fk'):
+            attribute_defs[attr.label] = (attr.id, attr.type_fk.raw_type == AttribTypeChoice.DICT.value)
+        return attribute_defs
+
+    @staticmethod
+    def _attribute_value(attribute_defs, label, value):
+        """
+        Look up the definition of an attribute and convert its value for
+        storage.
+        :param attribute_defs: Definitions as returned by _create_attribute_defs.
+        :param label: Attribute label.
+        :param value: Attribute value from the star file.
+        :return: Tuple of the attribute definition ID and value to store.
+        """
+        if label not in attribute_defs:
+            raise StarImportError("attribute '" + str(label) + "' used without a definition")
+        attribute_def_id, is_dict = attribute_defs[label]
+        # TODO: sometime string is either string or json, in this
+        # TODO: case, if its json, better to convert to double
+        # TODO: quote JSON with json.dumps
+        if is_dict:
+            value = json.dumps(value)
+        return attribute_def_id, value
+
+    # <editor-fold Block handlers">
+    def _handle_schema(self, schema_name):
+        """
+        Handle processing of schema, create a corresponding schema if one
+        doesn't exist.
+        """
+        self.schema = Schema.objects.filter(label=schema_name).last()
+        if self.schema is None:
+            self.schema = Schema.objects.create(label=schema_name)
+
+    def _handle_graph_attrs(self, attrs):
+        """
+        Process graph attribute definitions.
+        """
+        self.graph_attribute_defs = self._create_attribute_defs(GraphAttribDefGraph,
+                                                                graph_attribute_def_graph_saved, attrs)
+
+    def _handle_graph_data(self, graph_data):
+        """
+        Process the graph attribute values.
+        """
+        graph_id = self._get_graph().id
+        rows = []
+        for label in graph_data:
+            attribute_def_id, value = self._attribute_value(self.graph_attribute_defs, label, graph_data[label])
+            rows.append((graph_id, attribute_def_id, value))
+        self._load_rows('graph_attributes', GraphAttrib, GRAPH_ATTRIB_FIELDS, rows)
+
+    def _handle_vertex_attrs(self, attrs):
+        """
+        Process vertex attribute definitions.
+        """
+        self.vertex_attribute_defs = self._create_attribute_defs(GraphAttribDefVertex,
+                                                                 graph_attribute_def_vertex_saved, attrs)
+
+    def _handle_vertex(self, vertex):
+        """
+        Queue a vertex for creation, creating the queued batch once it
+        reaches the batch size.
+        """
+        self.pending_vertexes.append(vertex)
+        if len(self.pending_vertexes) >= self.batch_size:
+            self._flush_vertexes()
+
+    def _handle_transaction_attrs(self, attrs):
+        """
+        Process transaction attribute definitions.
+        """
+        self.transaction_attribute_defs = self._create_attribute_defs(GraphAttribDefTrans,
+                                                                      graph_attribute_def_transaction_saved, attrs)
+
+    def _handle_transaction(self, transaction):
+        """
+        Queue a transaction for creation, creating the queued batch once it
+        reaches the batch size.
+        """
+        self.pending_transactions.append(transaction)
+        if len(self.pending_transactions) >= self.batch_size:
+            self._flush_transactions()
+    # </editor-fold>
+
+    # <editor-fold Batch creation">
+    def _flush_vertexes(self):
+        """
+        Create the queued vertexes, followed by their vertex attributes.
+        """
+        if not self.pending_vertexes:
+            return
+        graph_id = self._get_graph().id
+
+        # Vertex JSON is the rolled up set of all of the vertexes attributes
+        rows = []
+        for vtx in self.pending_vertexes:
+            vx_id = vtx[VERTEX_ID_KEY]
+            # Keep track of maximum ID to setup auto increment
+            self.max_vx_id = max(self.max_vx_id, vx_id)
+            rows.append((graph_id, vx_id, vtx))
+        ids = self._load_rows_with_ids('vertexes', Vertex, VERTEX_FIELDS, rows)
+
+        # Record the primary keys of the new vertexes, used to link vertex
+        # attributes and transactions
+        for vertex_id, row in zip(ids, rows):
+            self.vertex_ids[row[1]] = vertex_id
+
+        rows = []
+        for vtx in self.pending_vertexes:
+            vertex_id = self.vertex_ids[vtx[VERTEX_ID_KEY]]
+            for attr in vtx:
+                if attr != VERTEX_ID_KEY:
+                    attribute_def_id, value = self._attribute_value(self.vertex_attribute_defs, attr, vtx[attr])
+                    rows.append((vertex_id, attribute_def_id, value))
+        self._write_vertex_attributes(rows)
+        self.pending_vertexes = []
+        self._report_progress()
+
+    def _flush_transactions(self):
+        """
+        Create the queued transactions, followed by their transaction
+        attributes.
+        """
+        if not self.pending_transactions:
+            return
+        graph_id = self._get_graph().id
+        # Transactions can only be linked once all vertexes are created
+        self._flush_vertexes()
+
+        rows = []
+        for trans in self.pending_transactions:
+            tx_id = trans[TRANSACTION_ID_KEY]
+            try:
+                vx_src_id = self.vertex_ids[trans[TRANSACTION_SRC_KEY]]
+                vx_dst_id = self.vertex_ids[trans[TRANSACTION_DST_KEY]]
+            except KeyError as e:
+                raise StarImportError("transaction " + str(tx_id) + " references unknown vertex " + str(e))
+            # Keep track of maximum ID to setup auto increment
+            self.max_tx_id = max(self.max_tx_id, tx_id)
+            rows.append((graph_id, tx_id, vx_src_id, vx_dst_id, trans[TRANSACTION_DIR_KEY], trans))
+
+        # Attribute values of each transaction, as (definition ID, value)
+        # tuples, which are linked once the transactions primary key is known
+        attribute_values = []
+        for trans in self.pending_transactions:
+            values = []
+            for attr in trans:
+                if attr not in TRANSACTION_KEYS:
+                    values.append(self._attribute_value(self.transaction_attribute_defs, attr, trans[attr]))
+            attribute_values.append(values)
+        self._write_transactions(rows, attribute_values)
+        self.pending_transactions = []
+        self._report_progress()
+
+    def _write_vertex_attributes(self, rows):
+        """
+        Write a batch of vertex attribute rows.
+        """
+        self._load_rows('vertex_attributes', VertexAttrib, VERTEX_ATTRIB_FIELDS, rows)
+
+    def _write_transactions(self, rows, attribute_values):
+        """
+        Write a batch of transaction rows, followed by their attributes.
+        :param rows: List of transaction rows.
+        :param attribute_values: List of the attribute values of each row, as
+                                 lists of (definition ID, value) tuples.
+        """
+        ids = self._load_rows_with_ids('transactions', Transaction, TRANSACTION_FIELDS, rows)
+        self._load_rows('transaction_attributes', TransactionAttrib, TRANSACTION_ATTRIB_FIELDS,
+                        transaction_attribute_rows(ids, attribute_values))
+    # </editor-fold>
@@ -0,0 +1,113 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import io
+import os
+import json
+import time
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from app.benchmark import BENCHMARK_TITLE_PREFIX, write_synthetic_star
+from app.columnar_export import iter_graph_npz, load_graph_npz
+from app.graph_export import iter_graph_json
+from app.importer import StarFileImporter, delete_graphs
+from app.models import Graph
+from app.serializers import GraphJsonSerializer
+
+
+class Command(BaseCommand):
+    """
+    Compare the time taken to build the graph JSON of a graph using
+    GraphJsonSerializer, which decodes and re-encodes the attribute_json of
+    every vertex and transaction, and iter_graph_json, which splices the
+    stored text into the output, ie:
+    python manage.py benchmark_export --vertexes 1000000
+    The size, encode and decode times of the JSON are also compared against
+    the columnar .npz export, uncompressed and compressed.
+    A synthetic graph is imported (and deleted once complete) unless an
+    existing graph is identified with --graph.
+    """
+    help = 'Benchmark graph JSON export using GraphJsonSerializer and attribute_json splicing, and .npz export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', type=int, help='ID of an existing graph to export')
+        parser.add_argument('--vertexes', type=int, default=1000000, help='Vertexes in the synthetic graph')
+        parser.add_argument('--transactions', type=int, default=None,
+                            help='Transactions in the synthetic graph, defaults to the number of vertexes')
+        parser.add_argument('--repeat', type=int, default=1, help='Exports to perform with each method')
+        parser.add_argument('--verify', action='store_true',
+                            help='Check the methods produce the same JSON, and the same vertexes and transactions')
+
+    def handle(self, *args, **options):
+        if options['graph'] is not None:
+            graph = Graph.objects.filter(id=options['graph']).select_related('schema_fk').first()
+            if graph is None:
+                raise CommandError("graph " + str(options['graph']) + " does not exist")
+            self._benchmark(graph, options['repeat'], options['verify'])
+            return
+
+        transactions = options['transactions']
+        if transactions is None:
+            transactions = options['vertexes']
+        star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+        try:
+            write_synthetic_star(star_filename, options['vertexes'], transactions)
+            self.stdout.write('Importing synthetic graph of ' + str(options['vertexes']) + ' vertexes and ' +
+                              str(transactions) + ' transactions')
+            importer = StarFileImporter(star_filename, BENCHMARK_TITLE_PREFIX + 'export')
+            importer.run()
+            graph = Graph.objects.select_related('schema_fk').get(id=importer.graph.id)
+            self._benchmark(graph, options['repeat'], options['verify'])
+        finally:
+            os.remove(star_filename)
+            delete_graphs(title__startswith=BENCHMARK_TITLE_PREFIX)
+
+    def _benchmark(self, graph, repeat, verify):
+        """
+        Export the graph using each method and report the size of the
+        document and the time taken to encode and decode it.
+        """
+        documents = {}
+        decoded = {}
+        methods = [('serializer', lambda: JSONRenderer().render(GraphJsonSerializer(graph).data), json.loads),
+                   ('splice', lambda: b''.join(iter_graph_json(graph)), json.loads),
+                   ('npz', lambda: b''.join(iter_graph_npz(graph)), lambda data: load_graph_npz(io.BytesIO(data))),
+                   ('npz compressed', lambda: b''.join(iter_graph_npz(graph, compressed=True)),
+                    lambda data: load_graph_npz(io.BytesIO(data)))]
+        for name, export, decode in methods:
+            for run in range(repeat):
+                start = time.monotonic()
+                documents[name] = export()
+                encoded = time.monotonic()
+                decoded[name] = decode(documents[name])
+                elapsed = time.monotonic() - encoded
+                self.stdout.write(name + ': ' + str(len(documents[name])) + ' bytes, encoded in ' +
+                                  str(round(encoded - start, 2)) + 's, decoded in ' + str(round(elapsed, 2)) + 's')
+        if verify:
+            if decoded['serializer'] != decoded['splice']:
+                raise CommandError('The methods produced different JSON')
+            vertexes = decoded['splice']['vertex'][1]['data']
+            transactions = decoded['splice']['transaction'][1]['data']
+            for name in ('npz', 'npz compressed'):
+                meta, arrays = decoded[name]
+                if (arrays['vertex.vx_id'].tolist() != [vertex['vx_id_'] for vertex in vertexes] or
+                        arrays['transaction.tx_id'].tolist() != [transaction['tx_id_'] for transaction in transactions]
+                        or arrays['transaction.vx_src'].tolist() != [transaction['vx_src_'] for transaction in transactions]):
+                    raise CommandError(name + ' produced different vertexes or transactions to the JSON')
+            self.stdout.write(self.style.SUCCESS('All methods produced the same graph'))
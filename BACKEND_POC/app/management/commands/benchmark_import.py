@@ -0,0 +1,110 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import os
+import time
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from app.benchmark import BENCHMARK_TITLE_PREFIX, write_synthetic_star
+from app.bulkload import LOADER_ORM, LOADER_NATIVE, NativeLoader
+from app.importer import IMPORT_BATCH_SIZE, delete_graphs
+from app.parallel_importer import create_importer
+
+
+# Import modes compared by the benchmark
+MODE_AUTOCOMMIT = 'autocommit'
+MODE_ATOMIC = 'atomic'
+
+
+class Command(BaseCommand):
+    """
+    Compare the time taken to import a star file using each of the bulk
+    loaders, both committing each batch as it is written (autocommit) and in
+    a single transaction (atomic), and optionally using several worker
+    processes, ie: python manage.py benchmark_import --vertexes 100000 --workers 1 2 4
+    Graphs created by the benchmark are deleted once it completes.
+    """
+    help = 'Benchmark star file imports using the orm and native bulk loaders, in autocommit and atomic modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--star', help='Star file to import, defaults to a generated synthetic graph')
+        parser.add_argument('--vertexes', type=int, default=10000, help='Vertexes in the synthetic graph')
+        parser.add_argument('--transactions', type=int, default=None,
+                            help='Transactions in the synthetic graph, defaults to twice the vertexes')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--repeat', type=int, default=1, help='Imports to perform with each loader')
+        parser.add_argument('--loaders', nargs='+', default=[LOADER_ORM, LOADER_NATIVE],
+                            choices=[LOADER_ORM, LOADER_NATIVE])
+        parser.add_argument('--modes', nargs='+', default=[MODE_AUTOCOMMIT, MODE_ATOMIC],
+                            choices=[MODE_AUTOCOMMIT, MODE_ATOMIC])
+        parser.add_argument('--workers', nargs='+', type=int, default=[1],
+                            help='Worker process counts to benchmark, imports using more than one are autocommit')
+
+    def handle(self, *args, **options):
+        star_filename = options['star']
+        generated = star_filename is None
+        if generated:
+            transactions = options['transactions']
+            if transactions is None:
+                transactions = 2 * options['vertexes']
+            star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+            write_synthetic_star(star_filename, options['vertexes'], transactions)
+        elif not os.path.isfile(star_filename):
+            raise CommandError("star file '" + star_filename + "' does not exist")
+
+        if LOADER_NATIVE in options['loaders'] and not NativeLoader.supports(connection):
+            self.stdout.write(self.style.WARNING("The native loader does not support the '" + connection.vendor +
+                                                 "' database, it will fall back to the orm loader"))
+        try:
+            for name in options['loaders']:
+                for workers in options['workers']:
+                    # Parallel imports are always autocommit
+                    modes = options['modes'] if workers == 1 else [MODE_AUTOCOMMIT]
+                    for mode in modes:
+                        for run in range(options['repeat']):
+                            self._benchmark(star_filename, name, mode == MODE_ATOMIC, workers, options['batch_size'])
+        finally:
+            start = time.monotonic()
+            counts = delete_graphs(title__startswith=BENCHMARK_TITLE_PREFIX)
+            self.stdout.write('Deleted ' + str(sum(counts.values())) + ' benchmark rows in ' +
+                              str(round(time.monotonic() - start, 2)) + 's')
+            if generated:
+                os.remove(star_filename)
+
+    def _benchmark(self, star_filename, name, atomic, workers, batch_size):
+        """
+        Import the star file using the named loader and report the time taken.
+        """
+        importer = create_importer(star_filename, BENCHMARK_TITLE_PREFIX + name, workers=workers,
+                                   batch_size=batch_size, loader=name, atomic=atomic)
+        start = time.monotonic()
+        counts = importer.run()
+        elapsed = time.monotonic() - start
+
+        rows = sum(counts.values())
+        mode = MODE_ATOMIC if atomic else MODE_AUTOCOMMIT
+        self.stdout.write(importer.loader.name + ' loader, ' + mode + ', ' + str(getattr(importer, 'workers', 1)) +
+                          ' worker(s): ' +
+                          str(rows) + ' rows in ' + str(round(elapsed, 2)) + 's (' + str(round(rows / elapsed, 1)) +
+                          ' rows/s)')
+        for phase, seconds in importer.timings.items():
+            self.stdout.write('    ' + phase + ' phase: ' + str(round(seconds, 3)) + 's wall-clock')
+        for key, rate in importer.rates().items():
+            self.stdout.write('    ' + key + ': ' + str(counts[key]) + ' rows, ' +
+                              str(round(importer.loader.timings[key], 2)) + 's loading (' + str(rate) + ' rows/s)')
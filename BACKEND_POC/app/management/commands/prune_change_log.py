@@ -0,0 +1,37 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.core.management.base import BaseCommand
+from websockets.changelog import prune_change_log
+
+
+class Command(BaseCommand):
+    """
+    Delete graph changes logged more than --days days ago (defaulting to the
+    CHANGE_LOG RETENTION_DAYS setting), ie from a daily cron job:
+    python manage.py prune_change_log --days 7
+    Subscribers asking to replay pruned changes are told to reload the graph.
+    """
+    help = 'Delete logged graph changes older than the change log retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None, help='Age in days of the changes to delete')
+
+    def handle(self, *args, **options):
+        deleted = prune_change_log(options['days'])
+        self.stdout.write('Deleted ' + str(deleted) + ' logged changes')
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-17 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_importjob_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graph_id', models.IntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('payload', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogSequence',
+            fields=[
+                ('graph_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='changelogentry',
+            constraint=models.UniqueConstraint(fields=('graph_id', 'seq'), name='unique seq per graph'),
+        ),
+    ]
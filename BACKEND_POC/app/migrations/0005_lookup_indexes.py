@@ -0,0 +1,90 @@
+# Generated by Django 3.1.14 on 2026-10-17 12:19
+
+from django.db import IntegrityError, migrations, models
+from django.db.models import Count, Max
+
+
+# Number of duplicates listed when refusing to add a unique constraint
+MAX_REPORTED_DUPLICATES = 10
+
+
+def duplicates(model, fields, using):
+    """
+    :return: Queryset of the values of fields shared by more than one row of
+             the model, with the number of rows sharing them (as 'count') and
+             the highest primary key among them (as 'last_id').
+    """
+    return model.objects.using(using).values(*fields).annotate(count=Count('pk'), last_id=Max('pk'))\
+        .filter(count__gt=1).order_by(*fields)
+
+
+def prepare_unique_constraints(apps, schema_editor):
+    """
+    Prepare for the unique constraints added below:
+     - Vertexes sharing a vx_id, or transactions sharing a tx_id, within a
+       graph are linked to other records, so cannot be chosen between
+       safely. They are listed and the migration fails, leaving the database
+       unchanged, until they are deleted or renumbered.
+     - A transaction holding an attribute more than once keeps its newest
+       (highest ID) value, the others being deleted, as the newest is the one
+       last written to the transactions attribute_json.
+    """
+    using = schema_editor.connection.alias
+    problems = []
+    for model_name, id_field in (('Vertex', 'vx_id'), ('Transaction', 'tx_id')):
+        model = apps.get_model('app', model_name)
+        found = list(duplicates(model, ('graph_fk', id_field), using)[:MAX_REPORTED_DUPLICATES + 1])
+        for duplicate in found[:MAX_REPORTED_DUPLICATES]:
+            ids = model.objects.using(using).filter(graph_fk=duplicate['graph_fk'], **{id_field: duplicate[id_field]})\
+                .order_by('pk').values_list('pk', flat=True)
+            problems.append("graph " + str(duplicate['graph_fk']) + " has " + model_name + " records " +
+                            ", ".join(str(pk) for pk in ids) + " sharing " + id_field + " " + str(duplicate[id_field]))
+        if len(found) > MAX_REPORTED_DUPLICATES:
+            problems.append("(more " + model_name + " duplicates not listed)")
+    if problems:
+        raise IntegrityError("Cannot add unique vx_id/tx_id per graph constraints. Delete the duplicate records, or "
+                             "give them unused IDs (ie the graphs next_vertex_id/next_transaction_id), then run "
+                             "migrate again:\n  " + "\n  ".join(problems))
+
+    TransactionAttrib = apps.get_model('app', 'TransactionAttrib')
+    for duplicate in duplicates(TransactionAttrib, ('transaction_fk', 'attrib_fk'), using).iterator():
+        TransactionAttrib.objects.using(using).filter(transaction_fk=duplicate['transaction_fk'],
+                                                      attrib_fk=duplicate['attrib_fk'])\
+            .exclude(pk=duplicate['last_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_changelog'),
+    ]
+
+    operations = [
+        # First, so that nothing is changed if duplicates prevent adding the
+        # constraints (DDL is not transactional on MySQL)
+        migrations.RunPython(prepare_unique_constraints, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='graphattribdefgraph',
+            index=models.Index(fields=['graph_fk', 'label'], name='graphattribdefgraph_label_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='graphattribdeftrans',
+            index=models.Index(fields=['graph_fk', 'label'], name='graphattribdeftrans_label_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='graphattribdefvertex',
+            index=models.Index(fields=['graph_fk', 'label'], name='graphattribdefvertex_label_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('graph_fk', 'tx_id'), name='unique tx_id per graph'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionattrib',
+            constraint=models.UniqueConstraint(fields=('transaction_fk', 'attrib_fk'), name='unique attrib per transaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='vertex',
+            constraint=models.UniqueConstraint(fields=('graph_fk', 'vx_id'), name='unique vx_id per graph'),
+        ),
+    ]
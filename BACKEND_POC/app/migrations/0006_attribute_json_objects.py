@@ -0,0 +1,74 @@
+# Generated by Django 3.1.14 on 2026-10-17 12:45
+
+import json
+from django.db import migrations
+
+
+# Tables holding an attribute_json column
+ATTRIBUTE_JSON_MODELS = ('Graph', 'Vertex', 'Transaction')
+
+# Statements converting an attribute_json holding a JSON string (the JSON text
+# of the object, as written by json.dumps) to the object itself, and back,
+# keyed by database vendor.
+DECODE_SQL = {
+    'mysql': "UPDATE {table} SET attribute_json = JSON_UNQUOTE(attribute_json) "
+             "WHERE JSON_TYPE(attribute_json) = 'STRING'",
+    'postgresql': "UPDATE {table} SET attribute_json = (attribute_json #>> '{{}}')::jsonb "
+                  "WHERE jsonb_typeof(attribute_json) = 'string'",
+    'sqlite': "UPDATE {table} SET attribute_json = json_extract(attribute_json, '$') "
+              "WHERE json_type(attribute_json) = 'text'",
+}
+ENCODE_SQL = {
+    'mysql': "UPDATE {table} SET attribute_json = JSON_QUOTE(CAST(attribute_json AS CHAR)) "
+             "WHERE JSON_TYPE(attribute_json) = 'OBJECT'",
+    'postgresql': "UPDATE {table} SET attribute_json = to_jsonb(attribute_json::text) "
+                  "WHERE jsonb_typeof(attribute_json) = 'object'",
+    'sqlite': "UPDATE {table} SET attribute_json = json_quote(attribute_json) "
+              "WHERE json_type(attribute_json) = 'object'",
+}
+
+
+def convert(apps, schema_editor, statements, convert_value):
+    """
+    Convert the attribute_json of every row using the statement for the
+    database in use, or row by row where there is none.
+    """
+    connection = schema_editor.connection
+    for model_name in ATTRIBUTE_JSON_MODELS:
+        model = apps.get_model('app', model_name)
+        if connection.vendor in statements:
+            table = connection.ops.quote_name(model._meta.db_table)
+            schema_editor.execute(statements[connection.vendor].format(table=table))
+            continue
+        manager = model.objects.using(connection.alias)
+        for pk, attribute_json in manager.values_list('pk', 'attribute_json').iterator():
+            converted = convert_value(attribute_json)
+            if converted is not attribute_json:
+                manager.filter(pk=pk).update(attribute_json=converted)
+
+
+def decode_attribute_json(apps, schema_editor):
+    convert(apps, schema_editor, DECODE_SQL,
+            lambda attribute_json: json.loads(attribute_json) if isinstance(attribute_json, str) else attribute_json)
+
+
+def encode_attribute_json(apps, schema_editor):
+    convert(apps, schema_editor, ENCODE_SQL,
+            lambda attribute_json: json.dumps(attribute_json) if isinstance(attribute_json, dict) else attribute_json)
+
+
+class Migration(migrations.Migration):
+    """
+    attribute_json was written as a JSON string holding the JSON text of the
+    object (json.dumps of the attribute dictionary). Store the objects
+    themselves, so attributes can be updated in place using the databases
+    JSON functions (refer to app/attribute_json.py).
+    """
+
+    dependencies = [
+        ('app', '0005_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(decode_attribute_json, encode_attribute_json),
+    ]
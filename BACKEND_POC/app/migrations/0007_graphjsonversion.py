@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_attribute_json_objects'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphJsonVersion',
+            fields=[
+                ('graph_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -41,8 +41,10 @@ def attrib_str_to_value(value_type, value_str):
     string into the identified type (when possible).
     :param value_type: The type to treat the value_string value as.
     :param value_str: The string to convert.
-    :return: Converted value_str value.
+    :return: Converted value_str value, or None if there is no value.
     """
+    if value_str is None:
+        return None
     if value_type == AttribTypeChoice.BOOL.value:
         try:
             if value_str.upper() == "TRUE":
@@ -155,21 +157,36 @@ class GraphAttribDefGraph(GraphBaseAttribDef):
     """
     A Graph attribute object defined for a parent Graph object.
     """
-    pass
+
+    class Meta:
+        # Attribute definitions are looked up by graph and label
+        indexes = [
+            models.Index(fields=['graph_fk', 'label'], name='graphattribdefgraph_label_idx')
+        ]
 
 
 class GraphAttribDefVertex(GraphBaseAttribDef):
     """
     A Vertex attribute object defined for a parent Graph object.
     """
-    pass
+
+    class Meta:
+        # Attribute definitions are looked up by graph and label
+        indexes = [
+            models.Index(fields=['graph_fk', 'label'], name='graphattribdefvertex_label_idx')
+        ]
 
 
 class GraphAttribDefTrans(GraphBaseAttribDef):
     """
     A Transaction attribute object defined for a parent Graph object.
     """
-    pass
+
+    class Meta:
+        # Attribute definitions are looked up by graph and label
+        indexes = [
+            models.Index(fields=['graph_fk', 'label'], name='graphattribdeftrans_label_idx')
+        ]
 # </editor-fold>
 
 
@@ -240,6 +257,11 @@ class Vertex(models.Model):
     def __str__(self):
         return "Graph:" + str(self.graph_fk) + ",  Vertex:" + str(self.vx_id)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['graph_fk', 'vx_id'], name='unique vx_id per graph')
+        ]
+
 
 class VertexAttrib(models.Model):
     """
@@ -275,6 +297,11 @@ class Transaction(models.Model):
     def __str__(self):
         return str(self.id)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['graph_fk', 'tx_id'], name='unique tx_id per graph')
+        ]
+
 
 # TODO: class TransactionAttrib
 class TransactionAttrib(models.Model):
@@ -284,4 +311,102 @@ class TransactionAttrib(models.Model):
     transaction_fk = models.ForeignKey(Transaction, on_delete=models.CASCADE)
     attrib_fk = models.ForeignKey(GraphAttribDefTrans, on_delete=models.CASCADE)
     value_str = models.TextField(blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transaction_fk', 'attrib_fk'], name='unique attrib per transaction')
+        ]
+# </editor-fold>
+
+
+# <editor-fold ImportJob model">
+class ImportJobStatusChoice(enum.Enum):
+    """
+    Lifecycle states of an ImportJob.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    COMPLETE = 'COMPLETE'
+    FAILED = 'FAILED'
+
+
+class ImportJob(models.Model):
+    """
+    Tracks the progress of a star file import being run as a background task
+    by a celery worker. The job is saved as the import progresses, with
+    progress_rates capturing rows per second for each record type written so
+    far, counts capturing the number of records created and timings capturing
+    the seconds spent on each phase of the import (ie load and commit).
+    """
+    filename = models.CharField(max_length=256, blank=False)
+    graph_fk = models.ForeignKey(Graph, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=[(tag.value, tag.name) for tag in ImportJobStatusChoice],
+                              default=ImportJobStatusChoice.PENDING.value)
+    percent_complete = models.FloatField(default=0.0)
+    progress_rates = models.JSONField(blank=True, default=dict)
+    counts = models.JSONField(blank=True, default=dict)
+    timings = models.JSONField(blank=True, default=dict)
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "ImportJob:" + str(self.id) + ", " + self.filename + " (" + self.status + ")"
+# </editor-fold>
+
+
+# <editor-fold Change log models">
+class ChangeLogSequence(models.Model):
+    """
+    Last change sequence number allocated to a graph. Each change to a graph
+    is numbered from a per graph sequence, allowing subscribers to detect
+    missed changes and replay them from the change log. Graphs are referenced
+    by ID rather than foreign key so that the sequence (and log) of a deleted
+    graph outlives it.
+    """
+    graph_id = models.IntegerField(primary_key=True)
+    last_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return "ChangeLogSequence:" + str(self.graph_id) + ", " + str(self.last_seq)
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append only log of the change notifications sent for a graph, keyed by
+    the graph and change sequence number, allowing reconnecting subscribers
+    to fetch the changes they missed rather than reloading the graph. The
+    payload is the change notification as sent.
+    """
+    graph_id = models.IntegerField()
+    seq = models.BigIntegerField()
+    payload = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return "ChangeLogEntry:" + str(self.graph_id) + "/" + str(self.seq)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['graph_id', 'seq'], name='unique seq per graph')
+        ]
+# </editor-fold>
+
+
+# <editor-fold Graph JSON cache models">
+class GraphJsonVersion(models.Model):
+    """
+    Version of the cached JSON documents of a graph (refer to
+    app/graph_cache.py), bumped whenever a record of the graph changes so
+    that every process, including the celery worker importing and purging
+    graphs, sees the change. The row of graph ID 0, never the ID of a graph,
+    holds the generation of the documents of every graph. Graphs are
+    referenced by ID rather than foreign key so that the version of a deleted
+    graph outlives it.
+    """
+    graph_id = models.IntegerField(primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return "GraphJsonVersion:" + str(self.graph_id) + ", " + str(self.version)
 # </editor-fold>
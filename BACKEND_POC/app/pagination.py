@@ -0,0 +1,36 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination of list endpoints on the primary key. Each page is read
+    with WHERE id > <last id of the previous page> ORDER BY id LIMIT <page
+    size>, walking the primary key (or the foreign key index of a filtered
+    list, which InnoDB orders by primary key) rather than counting past the
+    rows of earlier pages, so the cost of a page does not grow with its
+    depth or the size of the table. Responses are of the form:
+        {"next": "<url of the next page>", "previous": "<url>", "results": [ .. ]}
+    Follow next until it is null. Supply ?page_size= to change the number of
+    records per page, up to max_page_size.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
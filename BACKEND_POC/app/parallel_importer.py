@@ -0,0 +1,195 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connection, connections
+from app.bulkload import get_loader
+from app.importer import StarFileImporter, delete_graphs, transaction_attribute_rows
+from app.importer import VERTEX_ATTRIB_FIELDS, TRANSACTION_FIELDS, TRANSACTION_ATTRIB_FIELDS
+from app.models import VertexAttrib, Transaction, TransactionAttrib
+
+
+logger = logging.getLogger(__name__)
+
+
+# <editor-fold Constants">
+# Number of batches that may be queued per worker process before the parser
+# waits for a batch to complete. This bounds the memory used by parsed rows
+# waiting to be written.
+IMPORT_QUEUED_BATCHES_PER_WORKER = 2
+# </editor-fold>
+
+
+# <editor-fold Worker functions">
+# These run in the worker processes, each of which opens its own database
+# connection on first use. Each returns a list of (key, row count, loading
+# seconds, started, finished) tuples for the record types it wrote.
+def _write_vertex_attributes(loader_name, batch_size, rows):
+    """
+    Write a batch of vertex attribute rows.
+    """
+    started = time.time()
+    loader = get_loader(batch_size, loader_name)
+    try:
+        loader.add('vertex_attributes', VertexAttrib, VERTEX_ATTRIB_FIELDS, rows)
+        loader.flush()
+    finally:
+        loader.discard()
+    return [('vertex_attributes', len(rows), loader.timings.get('vertex_attributes', 0.0), started, time.time())]
+
+
+def _write_transactions(loader_name, batch_size, rows, attribute_values):
+    """
+    Write a batch of transaction rows followed by their attributes.
+    """
+    started = time.time()
+    loader = get_loader(batch_size, loader_name)
+    try:
+        ids = loader.add_with_ids('transactions', Transaction, TRANSACTION_FIELDS, rows)
+        transactions_finished = time.time()
+        attribute_rows = transaction_attribute_rows(ids, attribute_values)
+        loader.add('transaction_attributes', TransactionAttrib, TRANSACTION_ATTRIB_FIELDS, attribute_rows)
+        loader.flush()
+    finally:
+        loader.discard()
+    return [('transactions', len(rows), loader.timings.get('transactions', 0.0), started, transactions_finished),
+            ('transaction_attributes', len(attribute_rows), loader.timings.get('transaction_attributes', 0.0),
+             transactions_finished, time.time())]
+# </editor-fold>
+
+
+class ParallelStarFileImporter(StarFileImporter):
+    """
+    Star file importer that fans the writing of rows out across a pool of
+    worker processes. The file is parsed, and vertexes are created, in the
+    calling process as they are needed to link everything else. Once a batch
+    of vertexes has its primary keys, its vertex attributes are written by a
+    worker, as are each batch of transactions and their attributes, so these
+    phases run concurrently with each other and with parsing.
+    Workers cannot share a transaction, so each batch is committed as it is
+    written and, if the import fails, the partially imported graph is deleted.
+    Per record type wall-clock times (see timings) can be used to size the
+    number of workers.
+    """
+
+    def __init__(self, star_filename, title, workers=None, **kwargs):
+        """
+        :param workers: Number of worker processes, defaults to the
+                        IMPORT_WORKERS setting.
+        Refer to StarFileImporter for the remaining parameters, noting that
+        parallel imports are never atomic.
+        """
+        kwargs['atomic'] = False
+        super(ParallelStarFileImporter, self).__init__(star_filename, title, **kwargs)
+        self.workers = workers or getattr(settings, 'IMPORT_WORKERS', 1)
+        self.executor = None
+        self.futures = []
+
+    def run(self):
+        """
+        Perform the import, replacing any existing Graph with the same title.
+        :return: Dictionary of counts of the records created.
+        """
+        try:
+            return super(ParallelStarFileImporter, self).run()
+        except Exception:
+            for future in self.futures:
+                future.cancel()
+            self._shutdown()
+            if self.graph is not None:
+                delete_graphs(id=self.graph.id)
+            raise
+        finally:
+            self._shutdown()
+
+    def _load(self):
+        """
+        Parse the star file and write its records, waiting for all batches
+        queued to the workers to complete.
+        """
+        super(ParallelStarFileImporter, self)._load()
+        self._wait(0)
+
+    def _shutdown(self):
+        """
+        Shut down the worker processes, if they were started.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def _submit(self, function, *args):
+        """
+        Queue a batch to be written by a worker, starting the workers on first
+        use and waiting for earlier batches if too many are queued.
+        """
+        if self.executor is None:
+            # Workers are forked from this process, so close its connections
+            # rather than have the workers inherit them
+            connections.close_all()
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.futures.append(self.executor.submit(function, self.loader.name, self.batch_size, *args))
+        self._wait(self.workers * IMPORT_QUEUED_BATCHES_PER_WORKER)
+
+    def _wait(self, queued):
+        """
+        Wait for the oldest queued batches to complete, until no more than the
+        supplied number remain queued, recording their counts and timings.
+        """
+        while len(self.futures) > queued:
+            future = self.futures.pop(0)
+            for key, count, seconds, started, finished in future.result():
+                self.counts[key] = self.counts[key] + count
+                # Loader timings accumulate across workers, so rates are per
+                # worker rather than overall
+                self.loader.timings[key] = self.loader.timings.get(key, 0.0) + seconds
+                self._record_phase(key, started, finished)
+
+    def _write_vertex_attributes(self, rows):
+        self._submit(_write_vertex_attributes, rows)
+
+    def _write_transactions(self, rows, attribute_values):
+        self._submit(_write_transactions, rows, attribute_values)
+
+
+def create_importer(star_filename, title, workers=None, **kwargs):
+    """
+    Create the importer to use for a star file, being a
+    ParallelStarFileImporter if more than one worker is requested and a
+    StarFileImporter otherwise.
+    :param workers: Number of worker processes, defaults to the
+                    IMPORT_WORKERS setting.
+    Refer to StarFileImporter for the remaining parameters.
+    :return: The importer.
+    """
+    workers = workers or getattr(settings, 'IMPORT_WORKERS', 1)
+    if workers > 1 and multiprocessing.current_process().daemon:
+        # ie when run by a celery prefork worker, which is daemonic
+        logger.warning('Daemonic processes cannot start import workers, importing ' + title + ' in one process')
+        workers = 1
+    if workers > 1 and connection.vendor == 'sqlite':
+        # SQLite only allows one writer at a time
+        logger.warning('SQLite does not support concurrent writers, importing ' + title + ' in one process')
+        workers = 1
+    if workers > 1:
+        return ParallelStarFileImporter(star_filename, title, workers=workers, **kwargs)
+    return StarFileImporter(star_filename, title, **kwargs)
@@ -0,0 +1,99 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from app.models import Graph, GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex, GraphAttribDefTrans
+from app.models import Vertex, VertexAttrib, Transaction, TransactionAttrib
+
+
+# <editor-fold Constants">
+# Records belonging to a graph, in the order they are purged (children before
+# their parents), each identified by the name reported in purge counts, the
+# model and its foreign key to the graph, or to the parent record belonging
+# to the graph.
+PURGE_ORDER = (
+    ('transaction_attributes', TransactionAttrib, 'transaction_fk'),
+    ('transactions', Transaction, 'graph_fk'),
+    ('vertex_attributes', VertexAttrib, 'vertex_fk'),
+    ('vertexes', Vertex, 'graph_fk'),
+    ('graph_attributes', GraphAttrib, 'graph_fk'),
+    ('graph_attribute_defs', GraphAttribDefGraph, 'graph_fk'),
+    ('vertex_attribute_defs', GraphAttribDefVertex, 'graph_fk'),
+    ('transaction_attribute_defs', GraphAttribDefTrans, 'graph_fk'),
+)
+# </editor-fold>
+
+
+def purge_sql(connection, model, foreign_key, count):
+    """
+    Return the statement deleting the records of a model belonging to count
+    graphs, taking the primary key of each graph as a parameter:
+     - DELETE FROM <table> WHERE graph_fk_id IN (%s, ..)
+     - DELETE FROM <table> WHERE <parent>_fk_id IN
+           (SELECT id FROM <parent table> WHERE graph_fk_id IN (%s, ..))
+    :param connection: Database connection.
+    :param model: Model of the records.
+    :param foreign_key: Name of the models foreign key to the graph or to
+                        its parent record.
+    :param count: Number of graphs.
+    :return: SQL of the statement.
+    """
+    quote_name = connection.ops.quote_name
+    field = model._meta.get_field(foreign_key)
+    graph_ids_sql = "(" + ", ".join(["%s"] * count) + ")"
+    parent = field.related_model
+    if parent is not Graph:
+        graph_ids_sql = "(SELECT " + quote_name(parent._meta.pk.column) + " FROM " + \
+                        quote_name(parent._meta.db_table) + " WHERE " + \
+                        quote_name(parent._meta.get_field('graph_fk').column) + " IN " + graph_ids_sql + ")"
+    return "DELETE FROM " + quote_name(model._meta.db_table) + " WHERE " + quote_name(field.column) + " IN " + \
+        graph_ids_sql
+
+
+def purge_graphs(graph_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Delete graphs along with all of their records. Rather than letting the
+    delete collector load every vertex, transaction and attribute to send its
+    post_delete signal (and to cascade to its own children), each table is
+    emptied of the graphs records using a single set based DELETE (refer to
+    purge_sql), children before parents so that no foreign key is left
+    dangling. The graphs themselves are then deleted through the ORM, sending
+    one Graph DELETE notification per graph and clearing their cached JSON.
+    No notification is sent for the purged records.
+    :param graph_ids: Primary keys of the graphs to delete.
+    :param using: Alias of the database to delete from.
+    :return: Dictionary of the number of records deleted, keyed by record
+             type (refer to PURGE_ORDER) and 'graphs'.
+    """
+    graph_ids = list(graph_ids)
+    counts = dict.fromkeys((name for name, model, foreign_key in PURGE_ORDER), 0)
+    if not graph_ids:
+        counts['graphs'] = 0
+        return counts
+    connection = connections[using]
+    batch_size = connection.ops.bulk_batch_size(['pk'], graph_ids)
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            for start in range(0, len(graph_ids), batch_size):
+                batch = graph_ids[start:start + batch_size]
+                for name, model, foreign_key in PURGE_ORDER:
+                    cursor.execute(purge_sql(connection, model, foreign_key, len(batch)), batch)
+                    counts[name] = counts[name] + cursor.rowcount
+        graphs_deleted, graph_counts = Graph.objects.using(using).filter(pk__in=graph_ids).delete()
+        counts['graphs'] = graph_counts.get(Graph._meta.label, 0)
+    return counts
@@ -0,0 +1,60 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when the code run within a QueryBudget makes more queries than
+    budgeted.
+    """
+    pass
+
+
+class QueryBudget(CaptureQueriesContext):
+    """
+    Context manager asserting that the code run within it makes no more than
+    a budgeted number of database queries, catching code that queries once
+    per record (ie following a foreign key of each row serialized) rather
+    than using select_related/prefetch_related, ie:
+        with QueryBudget(3, 'vertexes/'):
+            client.get('/vertexes/?graph_fk=12')
+    QueryBudgetExceeded is raised on exit if the budget is exceeded, listing
+    the queries made. Queries are captured even when DEBUG is False.
+    """
+
+    def __init__(self, budget, name=None, using=DEFAULT_DB_ALIAS):
+        """
+        :param budget: Maximum number of queries allowed.
+        :param name: Name of the code being checked, ie an endpoint, used in
+                     the exception message.
+        :param using: Alias of the database whose queries are counted.
+        """
+        super(QueryBudget, self).__init__(connections[using])
+        self.budget = budget
+        self.name = name
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super(QueryBudget, self).__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None or len(self) <= self.budget:
+            return
+        raise QueryBudgetExceeded((self.name or 'Code') + ' made ' + str(len(self)) + ' queries, over its budget of ' +
+                                  str(self.budget) + ':\n' +
+                                  '\n'.join('  ' + query['sql'] for query in self.captured_queries))
@@ -0,0 +1,258 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+import os
+import tempfile
+from django.db import DEFAULT_DB_ALIAS, connections
+from app.benchmark import BENCHMARK_TITLE_PREFIX, write_synthetic_star
+from app.importer import StarFileImporter
+from app.models import Schema, SchemaAttribDefGraph, SchemaAttribDefVertex, SchemaAttribDefTrans
+from app.models import GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex, GraphAttribDefTrans
+from app.models import Vertex, VertexAttrib, Transaction, TransactionAttrib
+
+
+# <editor-fold Constants">
+# Lookups and endpoints made by the application, checked by the tests in
+# app/tests/test_query_plans.py and app/tests/test_query_budgets.py against
+# synthetic graphs (refer to create_graph).
+
+# Attribute labels of the synthetic graphs used by the checks (refer to
+# app/benchmark.py:write_synthetic_star).
+GRAPH_LABEL = 'title'
+VERTEX_LABEL = 'x'
+TRANSACTION_LABEL = 'weight'
+
+# The lookups made by the application when editing and exporting graphs,
+# none of which may scan a table. Each is identified by a name and built from
+# the IDs of a synthetic graph (refer to graph_ids).
+LOOKUPS = (
+    ('vertex by graph and vx_id', lambda ids: Vertex.objects.filter(graph_fk_id=ids['graph'], vx_id=ids['vx_id'])),
+    ('transaction by graph and tx_id',
+     lambda ids: Transaction.objects.filter(graph_fk_id=ids['graph'], tx_id=ids['tx_id'])),
+    ('transactions by graph', lambda ids: Transaction.objects.filter(graph_fk=ids['graph']).order_by('id')),
+    ('vertexes by graph', lambda ids: Vertex.objects.filter(graph_fk=ids['graph']).order_by('id')),
+    ('vertex attribute by vertex and label',
+     lambda ids: VertexAttrib.objects.filter(vertex_fk=ids['vertex'], attrib_fk__label=VERTEX_LABEL)),
+    ('transaction attribute by transaction and label',
+     lambda ids: TransactionAttrib.objects.filter(transaction_fk=ids['transaction'],
+                                                  attrib_fk__label=TRANSACTION_LABEL)),
+    ('graph attribute by graph and label',
+     lambda ids: GraphAttrib.objects.filter(graph_fk=ids['graph'], attrib_fk__label=GRAPH_LABEL)),
+    ('graph attribute definition by graph and label',
+     lambda ids: GraphAttribDefGraph.objects.filter(graph_fk=ids['graph'], label=GRAPH_LABEL)),
+    ('vertex attribute definition by graph and label',
+     lambda ids: GraphAttribDefVertex.objects.filter(graph_fk=ids['graph'], label=VERTEX_LABEL)),
+    ('transaction attribute definition by graph and label',
+     lambda ids: GraphAttribDefTrans.objects.filter(graph_fk=ids['graph'], label=TRANSACTION_LABEL)),
+    # Lookups of batch edits, refer to app/batch_edit.py
+    ('vertexes by graph and vx_ids',
+     lambda ids: Vertex.objects.filter(graph_fk_id=ids['graph'], vx_id__in=[ids['vx_id'], ids['vx_id'] + 1])),
+    ('transactions by graph and tx_ids',
+     lambda ids: Transaction.objects.filter(graph_fk_id=ids['graph'], tx_id__in=[ids['tx_id'], ids['tx_id'] + 1])),
+    ('vertex attributes by vertexes and definitions',
+     lambda ids: VertexAttrib.objects.filter(
+         vertex_fk_id__in=[ids['vertex']],
+         attrib_fk_id__in=list(GraphAttribDefVertex.objects.filter(graph_fk=ids['graph'])
+                               .values_list('id', flat=True)))),
+    ('transaction attributes by transactions and definitions',
+     lambda ids: TransactionAttrib.objects.filter(
+         transaction_fk_id__in=[ids['transaction']],
+         attrib_fk_id__in=list(GraphAttribDefTrans.objects.filter(graph_fk=ids['graph'])
+                               .values_list('id', flat=True)))),
+)
+
+# Endpoints checked, as URL templates formatted with the IDs of a synthetic
+# graph, along with the tables they may scan (ie an unfiltered list walking
+# the primary key of a table a page at a time) and their query budget, being
+# the most queries they may make (refer to app/query_budget.py). Graphs used
+# by the checks hold fewer records than a page, so that queries made per
+# record also show up as a difference in the number of queries made for two
+# graphs of different sizes.
+ENDPOINTS = (
+    ('attrib_types/', ('app_attribtype',), 1),
+    ('schemas/', ('app_schema',), 1),
+    ('schema_graph_attrib_defs/?schema_fk={schema}', (), 1),
+    ('schema_vertex_attrib_defs/?schema_fk={schema}', (), 1),
+    ('schema_trans_attrib_defs/?schema_fk={schema}', (), 1),
+    ('graphs/', ('app_graph',), 1),
+    ('graphs/{graph}', (), 1),
+    ('graphs/{graph}/json', (), 8),
+    ('graphs/{graph}/json/vertexes', (), 4),
+    ('graphs/{graph}/json/transactions', (), 4),
+    ('graphs/{graph}/json/stream', (), 7),
+    ('graphs/{graph}/npz', (), 12),
+    ('graphs/{graph}/changes?since=0', (), 2),
+    ('graph_attributes/?graph_fk={graph}', (), 1),
+    ('graph_attrib_defs/?graph_fk={graph}', (), 1),
+    ('vertex_attrib_defs/?graph_fk={graph}&label=' + VERTEX_LABEL, (), 1),
+    ('trans_attrib_defs/?graph_fk={graph}&label=' + TRANSACTION_LABEL, (), 1),
+    ('vertexes/?graph_fk={graph}', (), 1),
+    ('vertexes/{vertex}', (), 1),
+    ('vertex_attributes/?graph_fk={graph}', (), 1),
+    ('vertex_attributes/?vertex_fk={vertex}&attrib_fk__label=' + VERTEX_LABEL, (), 1),
+    ('transactions/?graph_fk={graph}', (), 1),
+    ('transactions/{transaction}', (), 1),
+    ('transaction_attributes/?graph_fk={graph}', (), 1),
+    ('transaction_attributes/?transaction_fk={transaction}&attrib_fk__label=' + TRANSACTION_LABEL, (), 1),
+    ('import_jobs/', ('app_importjob',), 1),
+)
+
+# Plan nodes scanning a whole table (or index), by database vendor.
+MYSQL_SCAN_ACCESS_TYPES = ('ALL', 'index')
+POSTGRESQL_SCAN_NODE_TYPES = ('Seq Scan',)
+# </editor-fold>
+
+
+def create_graph(name, vertexes):
+    """
+    Import a synthetic graph with the supplied number of vertexes and
+    transactions, and add as many graph attributes and schema attribute
+    definitions (refer to add_attributes).
+    :param name: Name of the graph, and of its schema.
+    :param vertexes: Number of vertexes, and of transactions, to create.
+    :return: IDs of the graph records (refer to graph_ids).
+    """
+    star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+    try:
+        write_synthetic_star(star_filename, vertexes, vertexes)
+        importer = StarFileImporter(star_filename, BENCHMARK_TITLE_PREFIX + name)
+        importer.run()
+        schema = add_attributes(importer.graph, BENCHMARK_TITLE_PREFIX + name, vertexes)
+        return graph_ids(importer.graph, schema)
+    finally:
+        os.remove(star_filename)
+
+
+def add_attributes(graph, schema_label, count):
+    """
+    Add graph attributes to a graph imported from a synthetic star file, and
+    create a schema holding attribute definitions, so that the endpoints
+    serializing them are checked with several records.
+    :param graph: Graph imported from a synthetic star file.
+    :param schema_label: Label of the schema to create.
+    :param count: Number of graph attributes, and of each type of schema
+                  attribute definition, to create.
+    :return: The created Schema.
+    """
+    attrib_type = GraphAttribDefGraph.objects.filter(graph_fk=graph).select_related('type_fk').first().type_fk
+    labels = ['attribute ' + str(index) for index in range(count)]
+    attribute_defs = GraphAttribDefGraph.objects.bulk_create([
+        GraphAttribDefGraph(graph_fk=graph, label=label, type_fk=attrib_type) for label in labels])
+    if attribute_defs[0].pk is None:
+        attribute_defs = list(GraphAttribDefGraph.objects.filter(graph_fk=graph, label__in=labels))
+    GraphAttrib.objects.bulk_create([GraphAttrib(graph_fk=graph, attrib_fk=attribute_def, value_str=label)
+                                     for attribute_def, label in zip(attribute_defs, labels)])
+    schema = Schema.objects.create(label=schema_label)
+    for model in (SchemaAttribDefGraph, SchemaAttribDefVertex, SchemaAttribDefTrans):
+        model.objects.bulk_create([model(schema_fk=schema, label=label, type_fk=attrib_type) for label in labels])
+    return schema
+
+
+def graph_ids(graph, schema):
+    """
+    :param graph: Graph imported from a synthetic star file.
+    :param schema: Schema created by add_attributes.
+    :return: Dictionary of the IDs of the graph and one of its vertexes and
+             transactions, and of the schema, used to build lookups and
+             endpoint URLs.
+    """
+    vertex = Vertex.objects.filter(graph_fk=graph).order_by('id').first()
+    transaction = Transaction.objects.filter(graph_fk=graph).order_by('id').first()
+    return {'graph': graph.id, 'vertex': vertex.id, 'vx_id': vertex.vx_id,
+            'transaction': transaction.id, 'tx_id': transaction.tx_id, 'schema': schema.id}
+
+
+def explain(sql, params=None, using=DEFAULT_DB_ALIAS):
+    """
+    Return the plan chosen by the database for a query. PostgreSQL is asked
+    to avoid sequential scans where an index could be used, as it prefers
+    them for the small tables of a check regardless of the indexes present.
+    :param sql: SQL of the query.
+    :param params: Parameters of the query, or None if they are inlined.
+    :param using: Alias of the database.
+    :return: Plan, as a list of the plan rows of SQLite, or as decoded JSON
+             of MySQL and PostgreSQL. None for other databases.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN FORMAT=JSON ' + sql, params)
+            return json.loads(cursor.fetchone()[0])
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+            return json.loads(plan) if isinstance(plan, str) else plan
+    return None
+
+
+def _plan_nodes(plan):
+    """
+    :return: Generator of the dictionaries nested within a JSON plan.
+    """
+    if isinstance(plan, dict):
+        yield plan
+        plan = list(plan.values())
+    if isinstance(plan, list):
+        for item in plan:
+            for node in _plan_nodes(item):
+                yield node
+
+
+def scanned_tables(plan, using=DEFAULT_DB_ALIAS):
+    """
+    :param plan: Plan returned by explain.
+    :param using: Alias of the database the plan was made by.
+    :return: Sorted list of the tables the plan scans in full, rather than
+             reading using an index.
+    """
+    vendor = connections[using].vendor
+    tables = set()
+    if vendor == 'sqlite':
+        for detail in plan or []:
+            words = detail.split()
+            if words and words[0] == 'SCAN':
+                table = words[2] if words[1] == 'TABLE' else words[1]
+                if not table.startswith('('):
+                    tables.add(table)
+    elif vendor == 'mysql':
+        for node in _plan_nodes(plan):
+            if node.get('access_type') in MYSQL_SCAN_ACCESS_TYPES and 'table_name' in node:
+                tables.add(node['table_name'])
+    elif vendor == 'postgresql':
+        for node in _plan_nodes(plan):
+            if node.get('Node Type') in POSTGRESQL_SCAN_NODE_TYPES:
+                tables.add(node['Relation Name'])
+    return sorted(tables)
+
+
+def lookup_sql(build, ids, using=DEFAULT_DB_ALIAS):
+    """
+    :param build: Callable building a lookup (refer to LOOKUPS).
+    :param ids: IDs of a synthetic graph (refer to graph_ids).
+    :param using: Alias of the database.
+    :return: Tuple of the SQL and parameters of the lookup.
+    """
+    return build(ids).using(using).query.get_compiler(using).as_sql()
@@ -16,17 +16,19 @@
  *
 """
 
-import json
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
-from django.db.models import signals
+from django.db import transaction
 from django.http.request import QueryDict
+from app.attribute_json import set_attributes
+from app.graph_cache import graph_json_cache
 from app.models import AttribType, AttribTypeChoice, attrib_str_to_value
 from app.models import Schema, SchemaAttribDefGraph, SchemaAttribDefVertex, SchemaAttribDefTrans
 from app.models import Graph, GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex, GraphAttribDefTrans
 from app.models import Vertex, VertexAttrib
 from app.models import Transaction, TransactionAttrib
-from websockets.consumers import graph_saved, vertex_saved, vertex_attribute_saved, transaction_saved, transaction_attribute_saved
+from app.models import ImportJob
+from websockets.consumers import graph_saved, vertex_attribute_saved, transaction_attribute_saved
 
 # <editor-fold Common functions">
 
@@ -48,7 +50,7 @@ def get_graph_json(obj):
              Graph object via FKs.
     """
     attrs_list = []
-    for attr in GraphAttribDefGraph.objects.filter(graph_fk=obj.id):
+    for attr in GraphAttribDefGraph.objects.filter(graph_fk=obj.id).select_related('type_fk'):
         attr_data = GraphAttribJsonSerializer(attr).data
         # Remove "default" fields that do not have a value, as per
         # example legacy JSON
@@ -57,11 +59,47 @@ def get_graph_json(obj):
         attrs_list.append(attr_data)
 
     data_dict = {}
-    for attr in GraphAttrib.objects.filter(graph_fk=obj.id):
+    for attr in GraphAttrib.objects.filter(graph_fk=obj.id).select_related('attrib_fk__type_fk'):
         data_dict[attr.attrib_fk.label] = \
             attrib_str_to_value(attr.attrib_fk.type_fk.raw_type, attr.value_str)
     return [{"attrs": attrs_list}, {"data": [data_dict]}]
 
+def get_vertex_attrs_json(obj):
+    """
+    returns the "attrs" list of the "vertex" component of a graph JSON
+    representation, being the vertex attribute definitions of the graph.
+    :param obj: Parent Graph object.
+    :return: List of vertex attribute definitions.
+    """
+    attrs_list = []
+    for attr in GraphAttribDefVertex.objects.filter(graph_fk=obj.id).select_related('type_fk'):
+        attr_data = VertexAttribJsonSerializer(attr).data
+        # Remove "default" fields that do not have a value, as per
+        # example legacy JSON
+        if attr_data['default'] is None:
+            attr_data.pop('default')
+        attrs_list.append(attr_data)
+    return attrs_list
+
+
+def get_transaction_attrs_json(obj):
+    """
+    returns the "attrs" list of the "transaction" component of a graph JSON
+    representation, being the transaction attribute definitions of the graph.
+    :param obj: Parent Graph object.
+    :return: List of transaction attribute definitions.
+    """
+    attrs_list = []
+    for attr in GraphAttribDefTrans.objects.filter(graph_fk=obj.id).select_related('type_fk'):
+        attr_data = TransactionAttribJsonSerializer(attr).data
+        # Remove "default" fields that do not have a value, as per
+        # example legacy JSON
+        if attr_data['default'] is None:
+            attr_data.pop('default')
+        attrs_list.append(attr_data)
+    return attrs_list
+
+
 def get_vertex_json(obj):
     """
     returns "vertex" component of a graph JSON representation. This
@@ -88,14 +126,7 @@ def get_vertex_json(obj):
     # Extract list of vertex attribute types that are available for the
     # graph, these are used to populate the "attrs" list found in the
     # returned dictionary.
-    attrs_list = []
-    for attr in GraphAttribDefVertex.objects.filter(graph_fk=obj.id):
-        attr_data = VertexAttribJsonSerializer(attr).data
-        # Remove "default" fields that do not have a value, as per
-        # example legacy JSON
-        if attr_data['default'] is None:
-            attr_data.pop('default')
-        attrs_list.append(attr_data)
+    attrs_list = get_vertex_attrs_json(obj)
 
     # Extract list of actual vertexes that exist for the graph. In the DB
     # the vertexes are made up of a Vertex object and for each of these
@@ -107,7 +138,7 @@ def get_vertex_json(obj):
     vertexes = Vertex.objects.filter(graph_fk=obj.id)
     vertex_list = []
     for vertex in vertexes:
-        vertex_list.append(json.loads(vertex.attribute_json))
+        vertex_list.append(vertex.attribute_json)
 
     return [{"attrs": attrs_list, "key": ["Identifier", "Type"]}, {"data": vertex_list}]
 
@@ -138,15 +169,7 @@ def get_transaction_json(obj):
     # Extract list of transaction attribute types that are available for the
     # graph, these are used to populate the "attrs" list found in the
     # returned dictionary.
-    attrs_list = []
-
-    for attr in GraphAttribDefTrans.objects.filter(graph_fk=obj.id):
-        attr_data = TransactionAttribJsonSerializer(attr).data
-        # Remove "default" fields that do not have a value, as per
-        # example legacy JSON
-        if attr_data['default'] is None:
-            attr_data.pop('default')
-        attrs_list.append(attr_data)
+    attrs_list = get_transaction_attrs_json(obj)
 
     # Extract list of actual transactions that exist for the graph. In the
     # DB the transactions are made up of a Transaction object and for each
@@ -157,8 +180,8 @@ def get_transaction_json(obj):
     # data driven.
     transactions = Transaction.objects.filter(graph_fk=obj.id)
     transaction_list = []
-    for transaction in transactions:
-        transaction_list.append(json.loads(transaction.attribute_json))
+    for trans in transactions:
+        transaction_list.append(trans.attribute_json)
 
     return [{"attrs": attrs_list, "key": ["Identifier", "Type"]}, {"data": transaction_list}]
 # </editor-fold>
@@ -204,7 +227,7 @@ class SchemaAttribDefGraphSerializer(serializers.ModelSerializer):
         ]
 
     def get_schema(self, obj):
-        return str(obj.schema_fk) + ":" + str(self.label)
+        return str(obj.schema_fk) + ":" + str(obj.label)
 
 
 class SchemaAttribDefVertexSerializer(serializers.ModelSerializer):
@@ -224,7 +247,7 @@ class SchemaAttribDefVertexSerializer(serializers.ModelSerializer):
         ]
 
     def get_schema(self, obj):
-        return str(obj.schema_fk) + ":" + str(self.label)
+        return str(obj.schema_fk) + ":" + str(obj.label)
 
 
 class SchemaAttribDefTransSerializer(serializers.ModelSerializer):
@@ -244,7 +267,7 @@ class SchemaAttribDefTransSerializer(serializers.ModelSerializer):
         ]
 
     def get_schema(self, obj):
-        return str(obj.schema_fk) + ":" + str(self.label)
+        return str(obj.schema_fk) + ":" + str(obj.label)
 
 
 class GraphAttribDefGraphSerializer(serializers.ModelSerializer):
@@ -346,18 +369,15 @@ class GraphAttribSerializer(serializers.ModelSerializer):
         """
         Common code to handle the propagation of to a GraphAttrib object
         (Create or Delete) up into the parent Graph objects json field.
+        Only the attributes key of the stored JSON is written (refer to
+        app/attribute_json.py).
 
         :param graph: Parent Graph object to update
         :param attrib_label: Attribute label being updated
         :param attrib_type: The type of the attribute being updated
         :param attrib_value_str: String value of the attribute being updated
         """
-        graph_attribute_json = json.loads(str(graph.attribute_json))
-        graph_attribute_json[attrib_label] = attrib_str_to_value(attrib_type, attrib_value_str)
-        graph.attribute_json = json.dumps(graph_attribute_json)
-        signals.post_save.disconnect(graph_saved, sender=Graph)
-        graph.save()
-        signals.post_save.connect(graph_saved, sender=Graph)
+        set_attributes(graph, {attrib_label: attrib_str_to_value(attrib_type, attrib_value_str)})
 
     def create(self, validated_data):
         """
@@ -369,9 +389,10 @@ class GraphAttribSerializer(serializers.ModelSerializer):
         :return: Created object instance
         """
         print("GraphAttribSerializer.create: validated_data=" + str(validated_data))
-        instance = super(GraphAttribSerializer, self).create(validated_data)
-        self.update_graph_attrib(instance.graph_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type,
-                                 instance.value_str)
+        with transaction.atomic():
+            instance = super(GraphAttribSerializer, self).create(validated_data)
+            self.update_graph_attrib(instance.graph_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type,
+                                     instance.value_str)
         return instance
 
     def update(self, instance, validated_data):
@@ -384,9 +405,10 @@ class GraphAttribSerializer(serializers.ModelSerializer):
         :return: Created object instance
         """
         print("GraphAttribSerializer.update: validated_data=" + str(validated_data))
-        instance = super(GraphAttribSerializer, self).update(instance, validated_data)
-        self.update_graph_attrib(instance.graph_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type,
-                                  instance.value_str)
+        with transaction.atomic():
+            instance = super(GraphAttribSerializer, self).update(instance, validated_data)
+            self.update_graph_attrib(instance.graph_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type,
+                                     instance.value_str)
         return instance
 # </editor-fold>
 
@@ -609,7 +631,7 @@ class VertexSerializer(serializers.ModelSerializer):
         """
         Return JSON version of vertex data including all linked attributes.
         """
-        return json.loads(obj.attribute_json)
+        return obj.attribute_json
     
     def to_internal_value(self, data):
         """
@@ -657,18 +679,15 @@ class VertexSerializer(serializers.ModelSerializer):
             validated_data['vx_id'] = graph.next_vertex_id
 
         graph.next_vertex_id = graph.next_vertex_id + 1
-        signals.post_save.disconnect(graph_saved, sender=Graph)
-        graph.save()
-        signals.post_save.connect(graph_saved, sender=Graph)
-
-        # Now loop through and create any VertexAttribute objects based on GraphVtxAttrib linked to parent Graph object
-        # that have default values
-        graph_vertex_attributes = graph.graphattribdefvertex_set.exclude(default_str__isnull=True)
-        signals.post_save.disconnect(vertex_attribute_saved, sender=VertexAttrib)
-        for vertex_object in graph_vertex_attributes:
-            vertex_attrib = VertexAttrib(vertex_fk=instance, attrib_fk=vertex_object, value_str=vertex_object.default_str)
-            vertex_attrib.save()
-        signals.post_save.connect(vertex_attribute_saved, sender=VertexAttrib)
+        with graph_json_cache.suppress_changes(graph.id, graph_saved, vertex_attribute_saved):
+            graph.save()
+
+            # Now loop through and create any VertexAttribute objects based on GraphVtxAttrib linked to parent Graph
+            # object that have default values
+            graph_vertex_attributes = graph.graphattribdefvertex_set.exclude(default_str__isnull=True)
+            for vertex_object in graph_vertex_attributes:
+                vertex_attrib = VertexAttrib(vertex_fk=instance, attrib_fk=vertex_object, value_str=vertex_object.default_str)
+                vertex_attrib.save()
         return instance
 
     def update(self, instance, validated_data):
@@ -715,19 +734,14 @@ class VertexAttribSerializer(serializers.ModelSerializer):
     def update_vertex_attrib(vertex, attrib_label, attrib_type, attrib_value_str):
         """
         Common code to handle the propagation of to a VertexAttrib object (Create or Delete) up into the parent Vertex
-        objects json field.
+        objects json field. Only the attributes key of the stored JSON is written (refer to app/attribute_json.py).
 
         :param vertex: Parent Vertex object to update
         :param attrib_label: Attribute label being updated
         :param attrib_type: The type of the attribute being updated
         :param attrib_value_str: String value of the attribute being updated
         """
-        vertex_attribute_json = json.loads(str(vertex.attribute_json))
-        vertex_attribute_json[attrib_label] = attrib_str_to_value(attrib_type, attrib_value_str)
-        vertex.attribute_json = json.dumps(vertex_attribute_json)
-        signals.post_save.disconnect(vertex_saved, sender=Vertex)
-        vertex.save()
-        signals.post_save.connect(vertex_saved, sender=Vertex)
+        set_attributes(vertex, {attrib_label: attrib_str_to_value(attrib_type, attrib_value_str)})
 
     def create(self, validated_data):
         """
@@ -737,8 +751,10 @@ class VertexAttribSerializer(serializers.ModelSerializer):
         :param validated_data: Validated data capturing the creation details.
         :return: Created object instance
         """
-        instance = super(VertexAttribSerializer, self).create(validated_data)
-        self.update_vertex_attrib(instance.vertex_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type, instance.value_str)
+        with transaction.atomic():
+            instance = super(VertexAttribSerializer, self).create(validated_data)
+            self.update_vertex_attrib(instance.vertex_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type,
+                                      instance.value_str)
         return instance
 
     def update(self, instance, validated_data):
@@ -749,8 +765,10 @@ class VertexAttribSerializer(serializers.ModelSerializer):
         :param validated_data: Validated data capturing the creation details.
         :return: Created object instance
         """
-        instance = super(VertexAttribSerializer, self).update(instance, validated_data)
-        self.update_vertex_attrib(instance.vertex_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type, instance.value_str)
+        with transaction.atomic():
+            instance = super(VertexAttribSerializer, self).update(instance, validated_data)
+            self.update_vertex_attrib(instance.vertex_fk, instance.attrib_fk.label, instance.attrib_fk.type_fk.raw_type,
+                                      instance.value_str)
         return instance
 # </editor-fold>
 
@@ -785,7 +803,7 @@ class TransactionSerializer(serializers.ModelSerializer):
         """
         Return JSON version of vertex data including all linked attributes.
         """
-        return json.loads(obj.attribute_json)
+        return obj.attribute_json
 
     def to_internal_value(self, data):
         """
@@ -827,20 +845,17 @@ class TransactionSerializer(serializers.ModelSerializer):
         # incrementing the next_transaction_id value
         graph = instance.graph_fk
         graph.next_transaction_id = graph.next_transaction_id + 1
-        signals.post_save.disconnect(graph_saved, sender=Graph)
-        graph.save()
-        signals.post_save.connect(graph_saved, sender=Graph)
-
-        # Now loop through and create any TransactionAttribute objects based on
-        # GraphTransactionAttrib linked to parent Graph object that have
-        # default values
-        graph_transaction_attributes = graph.graphattribdeftrans_set.exclude(default_str__isnull=True)
-        signals.post_save.disconnect(transaction_attribute_saved, sender=TransactionAttrib)
-        for transaction_object in graph_transaction_attributes:
-            transaction_attrib = TransactionAttrib(transaction_fk=instance, attrib_fk=transaction_object,
-                                                   value_str=transaction_object.default_str)
-            transaction_attrib.save()
-        signals.post_save.connect(transaction_attribute_saved, sender=TransactionAttrib)
+        with graph_json_cache.suppress_changes(graph.id, graph_saved, transaction_attribute_saved):
+            graph.save()
+
+            # Now loop through and create any TransactionAttribute objects
+            # based on GraphTransactionAttrib linked to parent Graph object
+            # that have default values
+            graph_transaction_attributes = graph.graphattribdeftrans_set.exclude(default_str__isnull=True)
+            for transaction_object in graph_transaction_attributes:
+                transaction_attrib = TransactionAttrib(transaction_fk=instance, attrib_fk=transaction_object,
+                                                       value_str=transaction_object.default_str)
+                transaction_attrib.save()
         return instance
 
     def update(self, instance, validated_data):
@@ -889,18 +904,15 @@ class TransactionAttribSerializer(serializers.ModelSerializer):
         """
         Common code to handle the propagation of to a TransactionAttrib object
         (Create or Delete) up into the parent Transaction objects json field.
+        Only the attributes key of the stored JSON is written (refer to
+        app/attribute_json.py).
 
         :param transaction: Parent Transaction object to update
         :param attrib_label: Attribute label being updated
         :param attrib_type: The type of the attribute being updated
         :param attrib_value_str: String value of the attribute being updated
         """
-        transaction_attribute_json = json.loads(str(transaction.attribute_json))
-        transaction_attribute_json[attrib_label] = attrib_str_to_value(attrib_type, attrib_value_str)
-        transaction.attribute_json = json.dumps(transaction_attribute_json)
-        signals.post_save.disconnect(transaction_saved, sender=Transaction)
-        transaction.save()
-        signals.post_save.connect(transaction_saved, sender=Transaction)
+        set_attributes(transaction, {attrib_label: attrib_str_to_value(attrib_type, attrib_value_str)})
 
     def create(self, validated_data):
         """
@@ -912,9 +924,10 @@ class TransactionAttribSerializer(serializers.ModelSerializer):
         :return: Created object instance
         """
         print("TransactionAttribSerializer.create: validated_data=" + str(validated_data))
-        instance = super(TransactionAttribSerializer, self).create(validated_data)
-        self.update_transaction_attrib(instance.transaction_fk, instance.attrib_fk.label,
-                                       instance.attrib_fk.type_fk.raw_type, instance.value_str)
+        with transaction.atomic():
+            instance = super(TransactionAttribSerializer, self).create(validated_data)
+            self.update_transaction_attrib(instance.transaction_fk, instance.attrib_fk.label,
+                                           instance.attrib_fk.type_fk.raw_type, instance.value_str)
         return instance
 
     def update(self, instance, validated_data):
@@ -927,8 +940,24 @@ class TransactionAttribSerializer(serializers.ModelSerializer):
         :return: Created object instance
         """
         print("TransactionAttribSerializer.update: validated_data=" + str(validated_data))
-        instance = super(TransactionAttribSerializer, self).update(instance, validated_data)
-        self.update_transaction_attrib(instance.transaction_fk, instance.attrib_fk.label,
-                                       instance.attrib_fk.type_fk.raw_type, instance.value_str)
+        with transaction.atomic():
+            instance = super(TransactionAttribSerializer, self).update(instance, validated_data)
+            self.update_transaction_attrib(instance.transaction_fk, instance.attrib_fk.label,
+                                           instance.attrib_fk.type_fk.raw_type, instance.value_str)
         return instance
-# </editor-fold>
\ No newline at end of file
+# </editor-fold>
+
+
+# <editor-fold ImportJob serializer">
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Serialization of ImportJob model. Jobs are created by the import endpoint
+    and updated by the celery worker performing the import, so all fields are
+    read only.
+    """
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'filename', 'graph_fk', 'status', 'percent_complete', 'progress_rates', 'counts', 'timings',
+                  'error', 'created', 'updated']
+        read_only_fields = fields
+# </editor-fold>
@@ -0,0 +1,189 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import importlib
+import json
+from unittest import mock
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from app import attribute_json
+from app.attribute_json import bulk_set_attributes, remove_attributes, set_attributes
+from app.models import AttribType, Graph, GraphAttribDefVertex, Vertex, VertexAttrib
+from app.tests.test_query_plans import NO_SILK_MIDDLEWARE
+
+# Migration converting attribute_json from JSON strings to objects
+attribute_json_objects = importlib.import_module('app.migrations.0006_attribute_json_objects')
+
+# Label that cannot be quoted in a JSON path, so is updated through the ORM
+QUOTED_LABEL = 'say "hi"\\'
+
+
+class AttributeJsonTests(TestCase):
+    """
+    Check that attributes are set and removed within the stored attribute_json,
+    using the databases JSON functions and through the ORM (refer to
+    app/attribute_json.py).
+    """
+
+    def setUp(self):
+        self.graph = Graph.objects.create(title='attribute json', attribute_json={'title': 'a'})
+        self.vertexes = [Vertex.objects.create(graph_fk=self.graph, vx_id=vx_id,
+                                               attribute_json={'x': vx_id, 'label': 'v' + str(vx_id)})
+                         for vx_id in range(3)]
+
+    def stored(self, instance):
+        """
+        :return: attribute_json of the stored row of a model instance.
+        """
+        return instance.__class__.objects.values_list('attribute_json', flat=True).get(pk=instance.pk)
+
+    def orm_only(self):
+        """
+        :return: Context in which no database JSON functions are used.
+        """
+        return mock.patch.object(attribute_json, 'NATIVE_JSON_VENDORS', ())
+
+    def check_set_attributes(self):
+        vertex = self.vertexes[0]
+        set_attributes(vertex, {'x': 1.5, 'color': {'red': 1}})
+        self.assertEqual(self.stored(vertex), {'x': 1.5, 'label': 'v0', 'color': {'red': 1}})
+        self.assertEqual(vertex.attribute_json, self.stored(vertex))
+        # Other rows are untouched
+        self.assertEqual(self.stored(self.vertexes[1]), {'x': 1, 'label': 'v1'})
+
+    def test_set_attributes(self):
+        self.assertTrue(attribute_json.supports_native_update(connection, ['x', 'color']))
+        self.check_set_attributes()
+
+    def test_set_attributes_orm(self):
+        with self.orm_only():
+            self.check_set_attributes()
+
+    def test_set_attributes_quoted_label(self):
+        self.assertFalse(attribute_json.supports_native_update(connection, [QUOTED_LABEL]))
+        set_attributes(self.graph, {QUOTED_LABEL: 'quoted', 'title': 'b'})
+        self.assertEqual(self.stored(self.graph), {QUOTED_LABEL: 'quoted', 'title': 'b'})
+
+    def check_remove_attributes(self, labels):
+        vertex = self.vertexes[0]
+        remove_attributes(vertex, labels)
+        self.assertEqual(self.stored(vertex), {'label': 'v0'})
+        self.assertEqual(vertex.attribute_json, {'label': 'v0'})
+
+    def test_remove_attributes(self):
+        # Labels not held are ignored
+        self.check_remove_attributes(['x', 'missing'])
+
+    def test_remove_attributes_orm(self):
+        with self.orm_only():
+            self.check_remove_attributes(['x', 'missing'])
+
+    def test_remove_attributes_quoted_label(self):
+        set_attributes(self.vertexes[0], {QUOTED_LABEL: 1})
+        self.check_remove_attributes(['x', QUOTED_LABEL])
+
+    def check_bulk_set_attributes(self, label):
+        rows = [(vertex.pk, {'x': -vertex.vx_id, label: vertex.vx_id}) for vertex in self.vertexes]
+        rows.append((self.vertexes[0].pk, {}))
+        # One row per statement, so rows are updated across batches
+        bulk_set_attributes(Vertex, self.graph.id, rows, 1)
+        self.assertEqual([self.stored(vertex) for vertex in self.vertexes],
+                         [{'x': -vx_id, 'label': 'v' + str(vx_id), label: vx_id} for vx_id in range(3)])
+
+    def test_bulk_set_attributes(self):
+        self.check_bulk_set_attributes('size')
+
+    def test_bulk_set_attributes_orm(self):
+        with self.orm_only():
+            self.check_bulk_set_attributes('size')
+
+    def test_bulk_set_attributes_quoted_label(self):
+        self.check_bulk_set_attributes(QUOTED_LABEL)
+
+
+@override_settings(MIDDLEWARE=NO_SILK_MIDDLEWARE)
+class EditAttributeTests(TestCase):
+    """
+    Check that editing a single attribute updates the owners attribute_json
+    and notifies subscribers of both the attribute and owner UPDATEs.
+    """
+    fixtures = [str(settings.BASE_DIR / 'attribtype.json')]
+
+    def setUp(self):
+        self.graph = Graph.objects.create(title='edit attribute')
+        self.vertex = Vertex.objects.create(graph_fk=self.graph, vx_id=0, attribute_json={'x': 1.0, 'label': 'a'})
+        attribute_def = GraphAttribDefVertex.objects.create(graph_fk=self.graph, label='x',
+                                                            type_fk=AttribType.objects.get(label='float'))
+        VertexAttrib.objects.create(vertex_fk=self.vertex, attrib_fk=attribute_def, value_str='1.0')
+
+    def test_edit_vertex_attribute(self):
+        with mock.patch('websockets.consumers.change_outbox') as change_outbox:
+            response = APIClient().post('/edit_vertex_attrib/', {'graph_id': self.graph.id, 'vx_id': 0, 'label': 'x',
+                                                                 'value': 2.5}, format='json')
+        self.assertEqual(response.json()['Info'], 'Found all keys')
+        self.assertEqual(Vertex.objects.get(pk=self.vertex.pk).attribute_json, {'x': 2.5, 'label': 'a'})
+        self.assertEqual(VertexAttrib.objects.get(vertex_fk=self.vertex).value_str, '2.5')
+        self.assertEqual([(model_name, payload['operation'])
+                          for model_name, payload, using in (call.args for call in change_outbox.add.call_args_list)],
+                         [('VertexAttrib', 'UPDATE'), ('Vertex', 'UPDATE')])
+
+
+class AttributeJsonMigrationTests(TestCase):
+    """
+    Check that migration 0006 converts attribute_json held as JSON strings
+    to objects, and back when reversed, using the databases JSON functions
+    and row by row.
+    """
+
+    def setUp(self):
+        self.graph = Graph.objects.create(title='migration', attribute_json='{"title": "a"}')
+        self.vertex = Vertex.objects.create(graph_fk=self.graph, vx_id=0, attribute_json='{"x": 1, "y": "\\"q\\""}')
+        self.converted = Vertex.objects.create(graph_fk=self.graph, vx_id=1, attribute_json={'x': 2})
+
+    def migrate(self, function):
+        # The schema editor is not entered, as SQLite does not allow that
+        # within the transaction of a test
+        function(apps, connection.schema_editor())
+
+    def stored(self):
+        """
+        :return: attribute_json of the graph and vertexes.
+        """
+        return [Graph.objects.values_list('attribute_json', flat=True).get(pk=self.graph.pk)] + \
+            list(Vertex.objects.order_by('vx_id').values_list('attribute_json', flat=True))
+
+    def check_migration(self):
+        decoded = [{'title': 'a'}, {'x': 1, 'y': '"q"'}, {'x': 2}]
+        self.migrate(attribute_json_objects.decode_attribute_json)
+        self.assertEqual(self.stored(), decoded)
+        # Reversing leaves every row holding a JSON string
+        self.migrate(attribute_json_objects.encode_attribute_json)
+        self.assertEqual([json.loads(value) for value in self.stored()], decoded)
+        self.migrate(attribute_json_objects.decode_attribute_json)
+        self.assertEqual(self.stored(), decoded)
+
+    def test_migration(self):
+        self.check_migration()
+
+    def test_migration_row_by_row(self):
+        with mock.patch.dict(attribute_json_objects.DECODE_SQL, clear=True), \
+                mock.patch.dict(attribute_json_objects.ENCODE_SQL, clear=True):
+            self.check_migration()
@@ -0,0 +1,216 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import os
+import tempfile
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from app.benchmark import write_synthetic_star
+from app.importer import StarFileImporter
+from app.models import AttribType, Graph, GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex
+from app.models import Vertex, VertexAttrib, Transaction, TransactionAttrib, attrib_str_to_value
+from app.tests.test_query_plans import NO_SILK_MIDDLEWARE
+
+# Elements of the edited graph, as (model, attribute model, attribute foreign
+# key, field identifying the element within the graph) tuples.
+ELEMENTS = (
+    (Graph, GraphAttrib, 'graph_fk', 'id'),
+    (Vertex, VertexAttrib, 'vertex_fk', 'vx_id'),
+    (Transaction, TransactionAttrib, 'transaction_fk', 'tx_id'),
+)
+GRAPH, VERTEX, TRANSACTION = ELEMENTS
+
+
+@override_settings(MIDDLEWARE=NO_SILK_MIDDLEWARE)
+class BatchEditTests(TestCase):
+    """
+    Check that the edit_attribs endpoint applies a batch of edits supplied
+    as rows and columns, leaving attribute_json agreeing with the attributes,
+    and changes nothing if any part of the batch is invalid (refer to
+    app/batch_edit.py).
+    """
+    fixtures = [str(settings.BASE_DIR / 'attribtype.json')]
+
+    @classmethod
+    def setUpTestData(cls):
+        star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+        try:
+            write_synthetic_star(star_filename, 5, 5)
+            importer = StarFileImporter(star_filename, 'batch edit')
+            importer.run()
+        finally:
+            os.remove(star_filename)
+        cls.graph_id = importer.graph.id
+        # Imports leave the attribute_json of the graph itself empty
+        Graph.objects.filter(pk=cls.graph_id).update(attribute_json=dict(
+            GraphAttrib.objects.filter(graph_fk=cls.graph_id).values_list('attrib_fk__label', 'value_str')))
+        # Labels without attributes, created by edits
+        string_type = AttribType.objects.get(label='string')
+        GraphAttribDefGraph.objects.create(graph_fk_id=cls.graph_id, label='notes', type_fk=string_type)
+        GraphAttribDefVertex.objects.create(graph_fk_id=cls.graph_id, label='color', type_fk=string_type)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def edit(self, body, expected_status=200):
+        """
+        Post a batch of edits, asserting the response status.
+        :return: Decoded response.
+        """
+        response = self.client.post('/edit_attribs/', dict(body, graph_id=body.get('graph_id', self.graph_id)),
+                                    format='json')
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.json()
+
+    def attributes(self, element):
+        """
+        :param element: Entry of ELEMENTS.
+        :return: Dictionary keyed by vx_id/tx_id (the graph ID for graph
+                 attributes) of the attribute values of each element of the
+                 graph, keyed by label.
+        """
+        model, attribute_model, attribute_fk, id_field = element
+        graph_field = attribute_fk if model is Graph else attribute_fk + '__graph_fk'
+        values = {}
+        for element_id, label, raw_type, value_str in attribute_model.objects.filter(
+                **{graph_field: self.graph_id}).values_list(
+                attribute_fk + '__' + id_field, 'attrib_fk__label', 'attrib_fk__type_fk__raw_type', 'value_str'):
+            values.setdefault(element_id, {})[label] = attrib_str_to_value(raw_type, value_str)
+        return values
+
+    def attribute_json(self, element):
+        """
+        :param element: Entry of ELEMENTS.
+        :return: Dictionary keyed by vx_id/tx_id (the graph ID for the graph)
+                 of the attribute_json of each element of the graph.
+        """
+        model, attribute_model, attribute_fk, id_field = element
+        graph_field = 'pk' if model is Graph else 'graph_fk'
+        return dict(model.objects.filter(**{graph_field: self.graph_id}).values_list(id_field, 'attribute_json'))
+
+    def snapshot(self):
+        """
+        :return: List of the attributes and attribute_json of each type of
+                 element of the graph.
+        """
+        return [(self.attributes(element), self.attribute_json(element)) for element in ELEMENTS]
+
+    def assertAttributeJsonAgrees(self):
+        """
+        Assert that the attribute_json of each element holds the value of each
+        of its attributes. Imported documents also hold the other fields of
+        the imported rows, ie vx_id_, which are ignored.
+        """
+        for element in ELEMENTS:
+            documents = self.attribute_json(element)
+            for element_id, values in self.attributes(element).items():
+                document = documents[element_id]
+                self.assertEqual(dict((label, document.get(label)) for label in values), values,
+                                 element[0].__name__ + ' ' + str(element_id) + ' attribute_json')
+
+    def test_columns(self):
+        response = self.edit({'vertexes': {'vx_id': [0, 1, 2], 'values': {'x': [1.5, 2.5, 3.5], 'selected': True}},
+                              'transactions': {'tx_id': [4], 'values': {'weight': [7], 'label': 'edited'}},
+                              'graph': {'title': 'Edited'}})
+        self.assertEqual(response['counts'], {'graph': {'elements': 1, 'updated': 1, 'created': 0},
+                                              'vertex': {'elements': 3, 'updated': 6, 'created': 0},
+                                              'transaction': {'elements': 1, 'updated': 2, 'created': 0}})
+        vertexes = self.attributes(VERTEX)
+        self.assertEqual([(vertexes[vx_id]['x'], vertexes[vx_id]['selected']) for vx_id in range(4)],
+                         [(1.5, True), (2.5, True), (3.5, True), (vertexes[3]['x'], False)])
+        transactions = self.attributes(TRANSACTION)
+        self.assertEqual((transactions[4]['weight'], transactions[4]['label']), (7, 'edited'))
+        self.assertEqual(self.attributes(GRAPH)[self.graph_id]['title'], 'Edited')
+        self.assertAttributeJsonAgrees()
+
+    def test_rows(self):
+        self.edit({'edits': [{'vx_id': 1, 'label': 'raw', 'value': {'rank': 10}},
+                             {'tx_id': 2, 'label': 'weight', 'value': 3},
+                             {'label': 'title', 'value': 'Edited'}]})
+        self.assertEqual(self.attributes(VERTEX)[1]['raw'], {'rank': 10})
+        self.assertEqual(self.attributes(TRANSACTION)[2]['weight'], 3)
+        self.assertEqual(self.attributes(GRAPH)[self.graph_id]['title'], 'Edited')
+        self.assertAttributeJsonAgrees()
+
+    def test_created_and_updated(self):
+        response = self.edit({'vertexes': {'vx_id': [0, 1], 'values': {'x': 4.0, 'color': ['red', 'blue']}},
+                              'graph': {'title': 'Edited', 'notes': 'Some notes'}})
+        self.assertEqual(response['counts'], {'graph': {'elements': 1, 'updated': 1, 'created': 1},
+                                              'vertex': {'elements': 2, 'updated': 2, 'created': 2}})
+        vertexes = self.attributes(VERTEX)
+        self.assertEqual((vertexes[0]['color'], vertexes[1]['color']), ('red', 'blue'))
+        self.assertNotIn('color', vertexes[2])
+        self.assertEqual(self.attributes(GRAPH)[self.graph_id]['notes'], 'Some notes')
+        self.assertAttributeJsonAgrees()
+        # Created attributes are updated by later edits
+        response = self.edit({'vertexes': {'vx_id': [0], 'values': {'color': 'green'}}})
+        self.assertEqual(response['counts'], {'vertex': {'elements': 1, 'updated': 1, 'created': 0}})
+        self.assertEqual(VertexAttrib.objects.filter(vertex_fk__graph_fk=self.graph_id, vertex_fk__vx_id=0,
+                                                     attrib_fk__label='color').count(), 1)
+        self.assertAttributeJsonAgrees()
+
+    def test_repeated_values(self):
+        response = self.edit({'vertexes': {'vx_id': [0, 1, 0], 'values': {'x': [1.0, 2.0, 3.0]}},
+                              'edits': [{'tx_id': 0, 'label': 'weight', 'value': 5},
+                                        {'tx_id': 0, 'label': 'weight', 'value': 6}]})
+        self.assertEqual(response['counts'], {'vertex': {'elements': 2, 'updated': 2, 'created': 0},
+                                              'transaction': {'elements': 1, 'updated': 1, 'created': 0}})
+        vertexes = self.attributes(VERTEX)
+        self.assertEqual((vertexes[0]['x'], vertexes[1]['x']), (3.0, 2.0))
+        self.assertEqual(self.attributes(TRANSACTION)[0]['weight'], 6)
+        self.assertAttributeJsonAgrees()
+
+    def test_columns_take_precedence_over_rows(self):
+        self.edit({'edits': [{'vx_id': 0, 'label': 'x', 'value': 1.0}, {'label': 'title', 'value': 'Row'}],
+                   'vertexes': {'vx_id': [0], 'values': {'x': [2.0]}},
+                   'graph': {'title': 'Column'}})
+        self.assertEqual(self.attributes(VERTEX)[0]['x'], 2.0)
+        self.assertEqual(self.attributes(GRAPH)[self.graph_id]['title'], 'Column')
+        self.assertAttributeJsonAgrees()
+
+    def test_invalid_changes_nothing(self):
+        valid = {'graph': {'title': 'Edited'}, 'vertexes': {'vx_id': [0, 1], 'values': {'x': [1.0, 2.0]}}}
+        invalid = (
+            # Column lengths do not match the listed IDs
+            {'vertexes': {'vx_id': [0, 1], 'values': {'x': [1.0]}}},
+            # Missing vertex, transaction and labels, edited after the valid
+            # graph and vertex edits
+            {'vertexes': {'vx_id': [0, 1, 99], 'values': {'x': [1.0, 2.0, 3.0]}}},
+            {'transactions': {'tx_id': [99], 'values': {'weight': 1}}},
+            {'edits': [{'tx_id': 0, 'label': 'missing', 'value': 1}]},
+            {'vertexes': {'vx_id': [0, 1], 'values': {'x': [1.0, 2.0], 'missing': 'a'}}},
+            # Malformed
+            {'edits': [{'vx_id': 'a', 'label': 'x', 'value': 1.0}]},
+            {'edits': [{'vx_id': 0, 'label': 'x'}]},
+            {'edits': {'vx_id': 0}},
+            {'vertexes': {'values': {'x': 1.0}}},
+            {'graph_id': 'a'},
+        )
+        before = self.snapshot()
+        for body in invalid:
+            with self.subTest(body):
+                response = self.edit(dict(valid, **body), 400)
+                self.assertIn('Error', response)
+                self.assertEqual(self.snapshot(), before)
+
+    def test_missing_graph(self):
+        response = self.edit({'graph_id': self.graph_id + 1000, 'graph': {'title': 'Edited'}}, 404)
+        self.assertIn('Error', response)
+        response = self.client.post('/edit_attribs/', {'graph': {'title': 'Edited'}}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,95 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from types import SimpleNamespace
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from app.bulkload import NativeLoader, OrmLoader, insert_rows, reserve_ids, update_rows
+from app.models import Graph, Schema, Vertex
+
+
+class BulkLoadTests(TestCase):
+    """
+    Check the bulk load helpers on SQLite (refer to app/bulkload.py).
+    """
+
+    def test_reserve_ids(self):
+        first_id = reserve_ids(Schema, 3)
+        self.assertEqual(reserve_ids(Schema, 2), first_id + 3)
+        # Rows inserted by the ORM take keys after the reserved ranges
+        self.assertEqual(Schema.objects.create(label='after').id, first_id + 5)
+        self.assertEqual(reserve_ids(Schema, 1), first_id + 6)
+
+    def test_add_with_ids(self):
+        loader = OrmLoader(2)
+        ids = loader.add_with_ids('schemas', Schema, ('label',), [('a',), ('b',), ('c',)])
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(list(Schema.objects.filter(pk__in=ids).order_by('pk').values_list('pk', 'label')),
+                         list(zip(ids, ['a', 'b', 'c'])))
+
+    def test_insert_rows(self):
+        # The keys are read back using MySQL's LAST_INSERT_ID(), so the
+        # cursor reports the keys MySQL would, spaced by an
+        # auto_increment_increment of 2
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (7, 2)
+        mysql_connection = SimpleNamespace(alias=connection.alias, cursor=lambda: cursor)
+        self.assertEqual(insert_rows(Schema, ('label',), [('a',), ('b',), ('c',)], mysql_connection), range(7, 13, 2))
+        self.assertEqual(set(Schema.objects.values_list('label', flat=True)), {'a', 'b', 'c'})
+
+    def test_update_rows(self):
+        graph = Graph.objects.create(title='update rows')
+        vertexes = [Vertex.objects.create(graph_fk=graph, vx_id=vx_id) for vx_id in range(3)]
+        rows = [(vertex.pk, {'x': vertex.vx_id, 'quote': "'\""}) for vertex in vertexes]
+        # Rows are updated two per statement
+        self.assertEqual(update_rows(Vertex, 'attribute_json', rows, 2), 3)
+        attribute_jsons = Vertex.objects.filter(graph_fk=graph).order_by('vx_id').values_list('attribute_json', flat=True)
+        self.assertEqual(list(attribute_jsons), [{'x': vx_id, 'quote': "'\""} for vx_id in range(3)])
+        self.assertEqual(update_rows(Vertex, 'vx_id', [], 2), 0)
+
+
+class NativeLoaderTests(TestCase):
+    """
+    Check the rows spooled by the native loader for MySQL and PostgreSQL.
+    """
+
+    def spooled(self, vendor, rows):
+        """
+        :return: Text of the spool of the supplied rows, as written for the
+                 database vendor.
+        """
+        loader = NativeLoader(10, SimpleNamespace(vendor=vendor, alias=connection.alias, ops=connection.ops))
+        self.addCleanup(loader.discard)
+        loader.add('schemas', Schema, ('id', 'label'), rows)
+        spool_file = loader.spools[('schemas', Schema)][0]
+        spool_file.flush()
+        with open(spool_file.name, 'r', encoding='utf-8', newline='') as spool_data:
+            return spool_data.read()
+
+    def test_escapes(self):
+        rows = [(1, 'tab\tnew line\nreturn\rback\\slash'), (2, None)]
+        self.assertEqual(self.spooled('postgresql', rows),
+                         '1\ttab\\tnew line\\nreturn\\rback\\\\slash\n2\t\\N\n')
+
+    def test_nul_mysql(self):
+        self.assertEqual(self.spooled('mysql', [(1, 'a\0b')]), '1\ta\\0b\n')
+
+    def test_nul_postgresql(self):
+        with self.assertRaises(ValueError):
+            self.spooled('postgresql', [(1, 'a\0b')])
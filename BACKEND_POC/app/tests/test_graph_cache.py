@@ -0,0 +1,159 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+from unittest import mock
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from app.graph_cache import GraphJsonCache, graph_json_cache
+from app.models import Graph, Schema, Vertex
+from app.tests.test_query_plans import NO_SILK_MIDDLEWARE
+from websockets.consumers import vertex_saved
+
+
+@override_settings(MIDDLEWARE=NO_SILK_MIDDLEWARE)
+class CachedGraphJsonTests(TestCase):
+    """
+    Check that the graph JSON endpoints serve cached documents only for
+    existing graphs, against versions shared by every process (refer to
+    app/views.py:CachedGraphJsonMixin).
+    """
+
+    def setUp(self):
+        graph_json_cache.clear()
+        self.client = APIClient()
+        self.graph = Graph.objects.create(title='cached', schema_fk=Schema.objects.create(label='cached'))
+        self.url = '/graphs/' + str(self.graph.id) + '/json'
+
+    def schema(self):
+        """
+        :return: Label of the schema of the graph, as returned by the JSON
+                 endpoint.
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['schema']
+
+    def test_deleted_graph_not_found(self):
+        self.assertEqual(self.schema(), 'cached')
+        # Deleted without bumping the version, as by another process
+        Graph.objects.filter(pk=self.graph.id).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_version_shared_between_processes(self):
+        self.assertEqual(self.schema(), 'cached')
+        Graph.objects.filter(pk=self.graph.id).update(schema_fk=Schema.objects.create(label='changed'))
+        self.assertEqual(self.schema(), 'cached')
+        # The cache of another process, ie the celery worker, bumps the
+        # version stored in the database
+        GraphJsonCache()._bump([self.graph.id], 'default')
+        self.assertEqual(self.schema(), 'changed')
+
+    def test_graph_without_schema(self):
+        Graph.objects.filter(pk=self.graph.id).update(schema_fk=None)
+        self.assertIsNone(self.schema())
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back a transaction.
+    """
+    pass
+
+
+class GraphJsonCacheTests(TransactionTestCase):
+    """
+    Check that documents are evicted least recently used first, and that
+    graph versions are bumped once the changes to a graph commit (refer to
+    app/graph_cache.py).
+    """
+
+    def setUp(self):
+        self.cache = GraphJsonCache(max_documents=2, max_bytes=10)
+        self.built = []
+
+    def get(self, graph_id, document=b'json'):
+        """
+        :return: Document of a graph, recording whether it was built.
+        """
+        def build():
+            self.built.append(graph_id)
+            return document
+        return self.cache.get_or_build('json', graph_id, build)
+
+    def test_evicts_by_count(self):
+        self.get(1)
+        self.get(2)
+        self.get(1)
+        self.get(3)
+        self.assertEqual(self.built, [1, 2, 3])
+        # The least recently used document was evicted
+        self.get(1)
+        self.get(2)
+        self.assertEqual(self.built, [1, 2, 3, 2])
+        self.assertEqual(self.cache.stats(), {'documents': 2, 'bytes': 8, 'hits': 2, 'misses': 4})
+
+    def test_evicts_by_bytes(self):
+        self.get(1, b'1234')
+        self.get(2, b'123456')
+        self.get(3, b'12')
+        self.assertEqual(list(self.cache.documents), [('json', 2, 0, 0), ('json', 3, 0, 0)])
+        self.assertEqual(self.cache.stats()['bytes'], 8)
+        # Documents larger than the cache are not held
+        self.get(4, b'12345678901')
+        self.assertEqual(self.cache.stats()['bytes'], 8)
+
+    def test_bumped_once_after_commit(self):
+        self.get(1)
+        with transaction.atomic():
+            self.cache.graph_changed(1)
+            self.cache.graph_changed(1)
+            self.assertEqual(self.cache.version(1), (0, 0))
+        self.assertEqual(self.cache.version(1), (0, 1))
+        self.get(1)
+        self.assertEqual(self.built, [1, 1])
+
+    def test_not_bumped_after_rollback(self):
+        with self.assertRaises(Rollback), transaction.atomic():
+            self.cache.graph_changed(1)
+            raise Rollback()
+        self.assertEqual(self.cache.version(1), (0, 0))
+        # Changes in the next transaction are still bumped
+        with transaction.atomic():
+            self.cache.graph_changed(1)
+        self.assertEqual(self.cache.version(1), (0, 1))
+
+    def test_invalidate_all(self):
+        self.get(1)
+        self.get(2)
+        self.cache.invalidate_all()
+        self.assertEqual(self.cache.version(1), (1, 0))
+        self.get(1)
+        self.get(2)
+        self.assertEqual(self.built, [1, 2, 1, 2])
+
+    def test_suppress_changes(self):
+        graph = Graph.objects.create(title='suppressed')
+        version = self.cache.version(graph.id)
+        with mock.patch('websockets.consumers.change_outbox') as change_outbox, transaction.atomic():
+            with self.cache.suppress_changes(graph.id, vertex_saved):
+                Vertex.objects.create(graph_fk=graph, vx_id=0)
+            self.assertEqual(self.cache.version(graph.id), version)
+        change_outbox.add.assert_not_called()
+        self.assertEqual(self.cache.version(graph.id), (version[0], version[1] + 1))
@@ -0,0 +1,155 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import io
+import json
+import os
+import tempfile
+import zipfile
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase
+from app import importer
+from app.importer import PREFIX_VERTEX_ATTRS, PREFIX_VERTEX_DATA, STAR_GRAPH_MEMBER
+from app.importer import StarFileImporter, StarImportError, _CountingReader, iter_star_elements
+from app.models import Graph, GraphAttrib, Vertex, VertexAttrib, Transaction, TransactionAttrib
+
+# Graph JSON of the small star file imported by the tests
+STAR_GRAPH_JSON = [
+    {'version': 1, 'schema': 'test'},
+    {'graph': [
+        {'attrs': [{'label': 'title', 'type': 'string', 'descr': 'Graph title'}]},
+        {'data': [{'title': 'Small graph'}]}]},
+    {'vertex': [
+        {'attrs': [{'label': 'Identifier', 'type': 'string', 'descr': 'Identifier'},
+                   {'label': 'x', 'type': 'float', 'descr': 'X position', 'default': '0.0'}]},
+        {'data': [{'vx_id_': vx_id, 'Identifier': 'vertex ' + str(vx_id), 'x': vx_id / 2} for vx_id in range(5)]}]},
+    {'transaction': [
+        {'attrs': [{'label': 'weight', 'type': 'integer', 'descr': 'Weight'}]},
+        {'data': [{'tx_id_': tx_id, 'vx_src_': tx_id, 'vx_dst_': tx_id + 1, 'tx_dir_': True, 'weight': tx_id * 10}
+                  for tx_id in range(4)]}]},
+    {'meta': []},
+]
+
+
+def write_star(graph_json_text):
+    """
+    Write a star file holding the supplied graph JSON text.
+    :return: Path of the star file, to be removed by the caller.
+    """
+    star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+    with zipfile.ZipFile(star_filename, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(STAR_GRAPH_MEMBER, graph_json_text)
+    return star_filename
+
+
+class StarParserTests(TestCase):
+    """
+    Check that the graph JSON of a star file is streamed element by element
+    (refer to app/importer.py:iter_star_elements).
+    """
+
+    def test_iter_star_elements(self):
+        json_file = io.BytesIO(json.dumps(STAR_GRAPH_JSON).encode())
+        elements = list(iter_star_elements(json_file, ('item.schema', PREFIX_VERTEX_ATTRS, PREFIX_VERTEX_DATA)))
+        attrs, data = STAR_GRAPH_JSON[2]['vertex']
+        self.assertEqual(elements, [('item.schema', 'test'), (PREFIX_VERTEX_ATTRS, attrs['attrs'])] +
+                         [(PREFIX_VERTEX_DATA, vertex) for vertex in data['data']])
+
+    def test_counting_reader(self):
+        reader = _CountingReader(io.BytesIO(b'0123456789'))
+        self.assertEqual(reader.read(4), b'0123')
+        self.assertEqual(reader.read(), b'456789')
+        self.assertEqual(reader.read(4), b'')
+        self.assertEqual(reader.bytes_read, 10)
+
+
+class StarFileImporterTests(TestCase):
+    """
+    Check that star files are imported in batches, reporting progress as
+    they are read (refer to app/importer.py:StarFileImporter).
+    """
+    fixtures = [str(settings.BASE_DIR / 'attribtype.json')]
+
+    def import_star(self, graph_json_text, **kwargs):
+        """
+        Import a star file holding the supplied graph JSON text.
+        :return: The importer.
+        """
+        star_filename = write_star(graph_json_text)
+        self.addCleanup(os.remove, star_filename)
+        star_importer = StarFileImporter(star_filename, 'small', **kwargs)
+        star_importer.run()
+        return star_importer
+
+    def test_import(self):
+        progress = []
+        with mock.patch.object(importer, 'IMPORT_PROGRESS_INTERVAL', 0):
+            star_importer = self.import_star(json.dumps(STAR_GRAPH_JSON), batch_size=2,
+                                             progress=lambda star_importer, percent: progress.append(percent))
+        self.assertEqual(star_importer.counts, {'graph_attributes': 1, 'vertexes': 5, 'vertex_attributes': 10,
+                                                'transactions': 4, 'transaction_attributes': 4})
+        graph = Graph.objects.get(title='small')
+        self.assertEqual((graph.schema_fk.label, graph.next_vertex_id, graph.next_transaction_id), ('test', 5, 4))
+        self.assertEqual(GraphAttrib.objects.get(graph_fk=graph).value_str, 'Small graph')
+        vertex = Vertex.objects.get(graph_fk=graph, vx_id=3)
+        self.assertEqual(vertex.attribute_json, {'vx_id_': 3, 'Identifier': 'vertex 3', 'x': 1.5})
+        attributes = VertexAttrib.objects.filter(vertex_fk=vertex).values_list('attrib_fk__label', 'value_str')
+        self.assertEqual(dict(attributes), {'Identifier': 'vertex 3', 'x': '1.5'})
+        transaction = Transaction.objects.get(graph_fk=graph, tx_id=2)
+        self.assertEqual((transaction.vx_src.vx_id, transaction.vx_dst.vx_id), (2, 3))
+        self.assertEqual(TransactionAttrib.objects.get(transaction_fk=transaction).value_str, '20')
+        # Progress is reported as each batch of 2 vertexes (3 batches) and
+        # transactions (2 batches) is written
+        self.assertEqual(len(progress), 5)
+        self.assertEqual(progress, sorted(progress))
+        self.assertTrue(0 < progress[0] and progress[-1] <= 100)
+        self.assertEqual(star_importer.percent_complete(), 100.0)
+
+    def test_find_missing_attribute_types(self):
+        graph_json = json.loads(json.dumps(STAR_GRAPH_JSON))
+        graph_json[2]['vertex'][0]['attrs'][0]['type'] = 'unknown'
+        graph_json[3]['transaction'][0]['attrs'][0]['type'] = 'also unknown'
+        star_filename = write_star(json.dumps(graph_json))
+        self.addCleanup(os.remove, star_filename)
+        self.assertEqual(StarFileImporter(star_filename, 'small').find_missing_attribute_types(),
+                         {'unknown', 'also unknown'})
+
+    def test_find_missing_attribute_types_stops_early(self):
+        # The transaction data is never parsed, so may be anything
+        graph_json_text = json.dumps(STAR_GRAPH_JSON)
+        graph_json_text = graph_json_text[:graph_json_text.index('{"data"', graph_json_text.index('"transaction"'))]
+        star_filename = write_star(graph_json_text + '{"data": [not json')
+        self.addCleanup(os.remove, star_filename)
+        star_importer = StarFileImporter(star_filename, 'small')
+        self.assertEqual(star_importer.find_missing_attribute_types(), set())
+        with self.assertRaises(StarImportError):
+            star_importer.run()
+
+    def test_undefined_attribute(self):
+        graph_json = json.loads(json.dumps(STAR_GRAPH_JSON))
+        graph_json[2]['vertex'][1]['data'][0]['undefined'] = 1
+        with self.assertRaises(StarImportError):
+            self.import_star(json.dumps(graph_json))
+        self.assertFalse(Graph.objects.filter(title='small').exists())
+
+    def test_not_a_star_file(self):
+        star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+        self.addCleanup(os.remove, star_filename)
+        with self.assertRaises(StarImportError):
+            StarFileImporter(star_filename, 'small').run()
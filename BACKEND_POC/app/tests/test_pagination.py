@@ -0,0 +1,90 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from app.models import Graph, Vertex
+from app.pagination import IdCursorPagination
+from app.tests.test_query_plans import NO_SILK_MIDDLEWARE
+
+
+@override_settings(MIDDLEWARE=NO_SILK_MIDDLEWARE)
+class PaginationTests(TestCase):
+    """
+    Check that list endpoints return pages keyed on the record ID, and that
+    their filters are validated (refer to app/pagination.py and
+    app/filters.py).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.graph = Graph.objects.create(title='paged')
+        Vertex.objects.bulk_create([Vertex(graph_fk=cls.graph, vx_id=vx_id) for vx_id in range(25)])
+        cls.other_graph = Graph.objects.create(title='other')
+        Vertex.objects.bulk_create([Vertex(graph_fk=cls.other_graph, vx_id=vx_id) for vx_id in range(3)])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url, expected_status=200):
+        """
+        :return: Decoded response of a GET request, capturing its queries
+                 in self.queries.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        self.queries = [query['sql'] for query in queries.captured_queries]
+        return response.json()
+
+    def test_pages(self):
+        url = '/vertexes/?graph_fk=' + str(self.graph.id) + '&page_size=10'
+        vx_ids = []
+        page_queries = []
+        while url is not None:
+            page = self.get(url)
+            self.assertEqual(set(page), {'next', 'previous', 'results'})
+            vx_ids.extend(vertex['vx_id'] for vertex in page['results'])
+            page_queries.append(self.queries)
+            url = page['next']
+        self.assertEqual(vx_ids, list(range(25)))
+        self.assertEqual(len(page_queries), 3)
+        # Later pages seek past the ID of the previous page rather than
+        # counting past its rows, in the same number of queries
+        self.assertEqual(len(set(len(queries) for queries in page_queries)), 1)
+        for queries in page_queries:
+            self.assertFalse(any('OFFSET' in sql for sql in queries), queries)
+        self.assertTrue(any('"id" >' in sql for sql in page_queries[-1]), page_queries[-1])
+
+    def test_page_size_capped(self):
+        with mock.patch.object(IdCursorPagination, 'max_page_size', 4):
+            page = self.get('/vertexes/?page_size=100')
+        self.assertEqual(len(page['results']), 4)
+
+    def test_filter(self):
+        page = self.get('/vertexes/?graph_fk=' + str(self.other_graph.id) + '&vx_id__in=0,2,')
+        self.assertEqual([vertex['vx_id'] for vertex in page['results']], [0, 2])
+        self.assertIsNone(page['next'])
+
+    def test_invalid_filter(self):
+        page = self.get('/vertex_attributes/?vertex_fk=abc', 400)
+        self.assertIn('filter', page)
+        self.get('/vertexes/?vx_id__in=1,x', 400)
@@ -0,0 +1,81 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import os
+import tempfile
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase
+from app.benchmark import write_synthetic_star
+from app.importer import StarFileImporter
+from app.models import Graph
+from app.purge import PURGE_ORDER, purge_graphs
+from websockets.outbox import DELETE
+
+
+class PurgeTests(TestCase):
+    """
+    Check that purging a graph deletes all of its records, sending a single
+    Graph DELETE notification (refer to app/purge.py).
+    """
+    fixtures = [str(settings.BASE_DIR / 'attribtype.json')]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.graph_ids = []
+        for title in ('purged', 'kept'):
+            star_filename = tempfile.NamedTemporaryFile(suffix='.star', delete=False).name
+            try:
+                write_synthetic_star(star_filename, 5, 4)
+                importer = StarFileImporter(star_filename, title)
+                importer.run()
+            finally:
+                os.remove(star_filename)
+            cls.graph_ids.append(importer.graph.id)
+
+    def graph_records(self, graph_id):
+        """
+        :return: Dictionary of the number of records of each type belonging
+                 to a graph, keyed by the names of PURGE_ORDER.
+        """
+        records = {}
+        for name, model, foreign_key in PURGE_ORDER:
+            lookup = foreign_key if foreign_key == 'graph_fk' else foreign_key + '__graph_fk'
+            records[name] = model.objects.filter(**{lookup: graph_id}).count()
+        return records
+
+    def test_purge(self):
+        purged_id, kept_id = self.graph_ids
+        purged = self.graph_records(purged_id)
+        kept = self.graph_records(kept_id)
+        self.assertTrue(all(purged[name] for name in ('vertexes', 'transactions', 'vertex_attributes',
+                                                      'transaction_attributes', 'vertex_attribute_defs')))
+        with mock.patch('websockets.consumers.change_outbox') as change_outbox:
+            counts = purge_graphs([purged_id])
+        self.assertEqual(counts, dict(purged, graphs=1))
+        self.assertEqual(self.graph_records(purged_id), dict.fromkeys(purged, 0))
+        self.assertFalse(Graph.objects.filter(pk=purged_id).exists())
+        # Other graphs are untouched
+        self.assertEqual(self.graph_records(kept_id), kept)
+        # A single notification, of the graph deletion
+        self.assertEqual([(call.args[0], call.args[1]['graph_id'], call.args[1]['operation'])
+                          for call in change_outbox.add.call_args_list], [('Graph', purged_id, DELETE)])
+
+    def test_purge_nothing(self):
+        self.assertEqual(purge_graphs([]), dict(dict.fromkeys((name for name, model, foreign_key in PURGE_ORDER), 0),
+                                                graphs=0))
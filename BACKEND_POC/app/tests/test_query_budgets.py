@@ -0,0 +1,74 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from app.graph_cache import graph_json_cache
+from app.models import Vertex
+from app.query_budget import QueryBudget, QueryBudgetExceeded
+from app.query_plans import ENDPOINTS, create_graph
+from app.tests.test_query_plans import NO_SILK_MIDDLEWARE, get
+
+
+@override_settings(MIDDLEWARE=NO_SILK_MIDDLEWARE)
+class QueryBudgetTests(TestCase):
+    """
+    Check that every list and detail endpoint stays within its query budget
+    (refer to app/query_plans.py:ENDPOINTS), and makes the same number of
+    queries for graphs of different sizes, catching queries made per record.
+    """
+    fixtures = [str(settings.BASE_DIR / 'attribtype.json')]
+
+    @classmethod
+    def setUpTestData(cls):
+        # Both graphs hold fewer records than a page, so that queries made per
+        # record show up as a difference in the number of queries.
+        cls.small = create_graph('budgets_small', 20)
+        cls.large = create_graph('budgets_large', 40)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def request(self, url, ids, budget):
+        """
+        Request an endpoint for a graph within its query budget, without
+        the graph JSON cached by an earlier request.
+        :return: Number of queries made.
+        """
+        url = '/' + url.format(**ids)
+        graph_json_cache.clear()
+        with QueryBudget(budget, url) as queries:
+            status, content = get(self.client, url)
+        self.assertLess(status, 400, url + ' returned ' + str(status) + ': ' + str(content[:200]))
+        return len(queries)
+
+    def test_endpoints_within_budget(self):
+        for url, allowed_scans, budget in ENDPOINTS:
+            with self.subTest(url):
+                small_count = self.request(url, self.small, budget)
+                large_count = self.request(url, self.large, budget)
+                self.assertEqual(small_count, large_count,
+                                 url + ' made ' + str(small_count) + ' queries for the smaller graph and ' +
+                                 str(large_count) + ' for the larger')
+
+    def test_budget_exceeded_by_query_per_record(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with QueryBudget(1, 'vertexes'):
+                for vertex in Vertex.objects.filter(graph_fk=self.small['graph']):
+                    vertex.graph_fk.title
@@ -0,0 +1,80 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from app.graph_cache import graph_json_cache
+from app.query_plans import ENDPOINTS, LOOKUPS, create_graph, explain, lookup_sql, scanned_tables
+
+# Silk records each request in the database, adding queries unrelated to the
+# endpoint being checked.
+NO_SILK_MIDDLEWARE = [middleware for middleware in settings.MIDDLEWARE if not middleware.startswith('silk.')]
+
+
+def get(client, url):
+    """
+    Request an endpoint, reading the whole of a streamed response so that
+    the queries made producing it are made within the request.
+    :return: Tuple of the response status code and the response content.
+    """
+    response = client.get(url)
+    if response.streaming:
+        return response.status_code, b''.join(response.streaming_content)
+    return response.status_code, response.content
+
+
+@override_settings(MIDDLEWARE=NO_SILK_MIDDLEWARE)
+class QueryPlanTests(TestCase):
+    """
+    Check, using EXPLAIN, that the lookups made when editing and exporting
+    graphs, and the queries made by every list and detail endpoint, read
+    using indexes rather than scanning tables (refer to app/query_plans.py).
+    """
+    fixtures = [str(settings.BASE_DIR / 'attribtype.json')]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.graph = create_graph('plans', 20)
+
+    def setUp(self):
+        graph_json_cache.clear()
+        self.client = APIClient()
+
+    def test_lookups_use_indexes(self):
+        for name, build in LOOKUPS:
+            with self.subTest(name):
+                sql, params = lookup_sql(build, self.graph)
+                plan = explain(sql, params)
+                self.assertEqual(scanned_tables(plan), [], name + ' plan: ' + str(plan))
+
+    def test_endpoints_use_indexes(self):
+        for url, allowed_scans, budget in ENDPOINTS:
+            url = '/' + url.format(**self.graph)
+            with self.subTest(url):
+                with CaptureQueriesContext(connection) as queries:
+                    status, content = get(self.client, url)
+                self.assertLess(status, 400, url + ' returned ' + str(status) + ': ' + str(content[:200]))
+                for query in queries.captured_queries:
+                    if not query['sql'].lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan = explain(query['sql'])
+                    scans = set(scanned_tables(plan)) - set(allowed_scans)
+                    self.assertEqual(scans, set(), query['sql'] + ' plan: ' + str(plan))
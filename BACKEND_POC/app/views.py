@@ -16,18 +16,26 @@
  *
 """
 
-import os
 import json
-import zipfile
 from os import path
-from django.db.models import signals
-from rest_framework import permissions, generics
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import permissions, generics, status
 from rest_framework.decorators import api_view
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from app.attribute_json import ATTRIBUTE_JSON_FIELD, set_attributes, remove_attributes
+from app.batch_edit import BatchEditError, parse_edits, apply_edits
+from app.columnar_export import iter_graph_npz
+from app.graph_cache import graph_json_cache
+from app.graph_export import iter_graph_json, iter_graph_vertex_json, iter_graph_transaction_json
 from app.models import AttribType, AttribTypeChoice, attrib_str_to_value
 from app.models import Schema, SchemaAttribDefGraph, SchemaAttribDefVertex, SchemaAttribDefTrans
 from app.models import Graph, GraphAttrib, GraphAttribDefGraph, GraphAttribDefVertex, GraphAttribDefTrans
 from app.models import Vertex, VertexAttrib, Transaction, TransactionAttrib
+from app.models import ImportJob
+from app.purge import purge_graphs
 from app.serializers import AttribTypeSerializer, SchemaSerializer
 from app.serializers import SchemaAttribDefGraphSerializer, SchemaAttribDefVertexSerializer, SchemaAttribDefTransSerializer
 from app.serializers import GraphSerializer, GraphJsonSerializer, GraphAttribSerializer
@@ -35,7 +43,11 @@ from app.serializers import GraphAttribDefGraphSerializer, GraphAttribDefVertexS
 from app.serializers import VertexSerializer, VertexAttribSerializer
 from app.serializers import TransactionSerializer, TransactionAttribSerializer
 from app.serializers import GraphJsonVertexesSerializer, GraphJsonTransactionsSerializer
+from app.serializers import ImportJobSerializer
+from worker.tasks import import_starfile_task, purge_graph_task
+from websockets.changelog import changes_since
 from websockets.consumers import *
+from websockets.suppression import suppress
 
 
 
@@ -45,11 +57,6 @@ ATTRIBUTE_EDITOR_KEY_VERTEX_ID = 'vx_id'  # Key used in POST body to identify ve
 ATTRIBUTE_EDITOR_KEY_TRANSACTION_ID = 'tx_id'  # Key used in POST body to identify transaction ID (per graph)
 # </editor-fold>
 
-# Configuration of how many records (ie vertexes, transactions, vertex
-# attributes, or transaction attributes) should be sent in a hit to the
-# database for creation.
-IMPORT_BATCH_SIZE = 2000
-
 
 # <editor-fold Common functions">
 class InvalidTypeException(Exception):
@@ -59,81 +66,72 @@ class InvalidTypeException(Exception):
     pass
 
 
+def __update_attribute(attribute, owner, value, notify_owner):
+    """
+    Update supplied attribute to the given value. Changes will also be
+    reflected back into the attribute_json of the graph, vertex or
+    transaction owning the attribute. The attribute and the JSON are written
+    in one transaction, so the graph JSON cache version is bumped and
+    subscribers notified once both are written.
+    :param attribute: GraphAttrib, VertexAttrib or TransactionAttrib to update
+    :param owner: Graph, Vertex or Transaction owning the attribute
+    :param value:  Value to use
+    :param notify_owner: True to notify subscribers of an UPDATE of the owner
+                         as well as of the attribute
+    """
+    attrib_type = attribute.attrib_fk.type_fk.raw_type
+    if attrib_type == AttribTypeChoice.DICT.value:
+        attribute.value_str = json.dumps(value)
+    else:
+        attribute.value_str = str(value)
+
+    with transaction.atomic():
+        attribute.save()
+        set_attributes(owner, {attribute.attrib_fk.label: attrib_str_to_value(attrib_type, attribute.value_str)})
+        if notify_owner:
+            # The owner is not saved, as that would write back its whole
+            # attribute_json, so its save is signalled instead
+            post_save.send(sender=owner.__class__, instance=owner, created=False, raw=False,
+                           using=owner._state.db, update_fields=frozenset([ATTRIBUTE_JSON_FIELD]))
+
+
 def __update_graph_attribute(graph_attribute, value):
     """
-    Update supplied graph attribute to the given value. Changes will also be
-    reflected back into enclosing graph JSON.
+    Update supplied graph attribute to the given value (refer to
+    __update_attribute). Subscribers are notified of the GraphAttrib UPDATE
+    only, not of an UPDATE of the enclosing graph.
     :param graph_attribute: Object to update
     :param value:  Value to use
     """
     if not isinstance(graph_attribute, GraphAttrib):
         raise InvalidTypeException("Supplied object is not GraphAttrib")
-
-    attrib_type = graph_attribute.attrib_fk.type_fk.raw_type
-    if attrib_type == AttribTypeChoice.DICT:
-        graph_attribute.value_str = json.dumps(value)
-    else:
-        graph_attribute.value_str = str(value)
-
-    graph_attribute.save()
-    graph = graph_attribute.graph_fk
-    graph_attribute_json = json.loads(graph.attribute_json)
-    graph_attribute_json[graph_attribute.attrib_fk.label] = \
-        attrib_str_to_value(attrib_type, value)
-    graph.attribute_json = json.dumps(graph_attribute_json)
-    signals.post_save.disconnect(graph_saved, sender=Graph)
-    graph.save()
-    signals.post_save.connect(graph_saved, sender=Graph)
+    __update_attribute(graph_attribute, graph_attribute.graph_fk, value, False)
 
 
 def __update_vertex_attribute(vertex_attribute, value):
     """
-    Update supplied vertex attribute to the given value. Changes will also be
-    reflected back into enclosing vertex JSON.
+    Update supplied vertex attribute to the given value (refer to
+    __update_attribute). Subscribers are notified of the VertexAttrib UPDATE
+    and of an UPDATE of the enclosing vertex.
     :param vertex_attribute: Object to update
     :param value:  Value to use
     """
     if not isinstance(vertex_attribute, VertexAttrib):
         raise InvalidTypeException("Supplied object is not VertexAttrib")
-
-    attrib_type = vertex_attribute.attrib_fk.type_fk.type
-    if attrib_type == AttribTypeChoice.DICT:
-        vertex_attribute.value_str = json.dumps(value)
-    else:
-        vertex_attribute.value_str = str(value)
-
-    vertex_attribute.save()
-    vertex = vertex_attribute.vertex_fk
-    vertex_attribute_json = json.loads(vertex.attribute_json)
-    vertex_attribute_json[vertex_attribute.attrib_fk.label] = \
-        attrib_str_to_value(attrib_type, value)
-    vertex.attribute_json = json.dumps(vertex_attribute_json)
-    vertex.save()
+    __update_attribute(vertex_attribute, vertex_attribute.vertex_fk, value, True)
 
 
 def __update_transaction_attribute(transaction_attribute, value):
     """
-    Update supplied transaction attribute to the given value. Changes will also
-    be reflected back into enclosing transaction JSON.
+    Update supplied transaction attribute to the given value (refer to
+    __update_attribute). Subscribers are notified of the TransactionAttrib
+    UPDATE and of an UPDATE of the enclosing transaction.
     :param transaction_attribute: Object to update
     :param value:  Value to use
     """
     if not isinstance(transaction_attribute, TransactionAttrib):
         raise InvalidTypeException("Supplied object is not TransactionAttrib")
-
-    attrib_type = transaction_attribute.attrib_fk.type_fk.type
-    if attrib_type == AttribTypeChoice.DICT:
-        transaction_attribute.value_str = json.dumps(value)
-    else:
-        transaction_attribute.value_str = str(value)
-
-    transaction_attribute.save()
-    transaction = transaction_attribute.transaction_fk
-    transaction_attribute_json = json.loads(transaction.attribute_json)
-    transaction_attribute_json[transaction_attribute.attrib_fk.label] = \
-        attrib_str_to_value(attrib_type, value)
-    transaction.attribute_json = json.dumps(transaction_attribute_json)
-    transaction.save()
+    __update_attribute(transaction_attribute, transaction_attribute.transaction_fk, value, True)
 # </editor-fold>
 
 
@@ -145,6 +143,7 @@ class AttribTypesView(generics.ListCreateAPIView):
     """
     queryset = AttribType.objects.all()
     serializer_class = AttribTypeSerializer
+    filter_fields = ('label', 'raw_type')
 
 
 class AttribTypeView(generics.RetrieveUpdateDestroyAPIView):
@@ -163,8 +162,9 @@ class SchemaAttribDefGraphsView(generics.ListCreateAPIView):
     Support Create and List operations of Graph attributes to be defined in a
     Schema.
     """
-    queryset = SchemaAttribDefGraph.objects.all()
+    queryset = SchemaAttribDefGraph.objects.select_related('schema_fk')
     serializer_class = SchemaAttribDefGraphSerializer
+    filter_fields = ('schema_fk', 'label', 'type_fk')
 
 
 class SchemaAttribDefGraphView(generics.RetrieveUpdateDestroyAPIView):
@@ -172,7 +172,7 @@ class SchemaAttribDefGraphView(generics.RetrieveUpdateDestroyAPIView):
     Support Read, Update, and Destroy operations of Graph attributes to be
     defined in a Schema.
     """
-    queryset = SchemaAttribDefGraph.objects.all()
+    queryset = SchemaAttribDefGraph.objects.select_related('schema_fk')
     serializer_class = SchemaAttribDefGraphSerializer
 
 
@@ -181,8 +181,9 @@ class SchemaAttribDefVertexesView(generics.ListCreateAPIView):
     Support Create and List operations of Vertex attributes to be defined in a
     Schema.
     """
-    queryset = SchemaAttribDefVertex.objects.all()
+    queryset = SchemaAttribDefVertex.objects.select_related('schema_fk')
     serializer_class = SchemaAttribDefVertexSerializer
+    filter_fields = ('schema_fk', 'label', 'type_fk')
 
 
 class SchemaAttribDefVertexView(generics.RetrieveUpdateDestroyAPIView):
@@ -190,7 +191,7 @@ class SchemaAttribDefVertexView(generics.RetrieveUpdateDestroyAPIView):
     Support Read, Update, and Destroy operations of Vertex attributes to be
     defined in a Schema.
     """
-    queryset = SchemaAttribDefVertex.objects.all()
+    queryset = SchemaAttribDefVertex.objects.select_related('schema_fk')
     serializer_class = SchemaAttribDefVertexSerializer
 
 
@@ -199,8 +200,9 @@ class SchemaAttribDefTransactionsView(generics.ListCreateAPIView):
     Support Create and List operations of Transaction attributes to be defined
     in a Schema.
     """
-    queryset = SchemaAttribDefTrans.objects.all()
+    queryset = SchemaAttribDefTrans.objects.select_related('schema_fk')
     serializer_class = SchemaAttribDefTransSerializer
+    filter_fields = ('schema_fk', 'label', 'type_fk')
 
 
 class SchemaAttribDefTransactionView(generics.RetrieveUpdateDestroyAPIView):
@@ -208,7 +210,7 @@ class SchemaAttribDefTransactionView(generics.RetrieveUpdateDestroyAPIView):
     Support Read, Update, and Destroy operations of Transaction attributes to
     be defined in a Schema.
     """
-    queryset = SchemaAttribDefTrans.objects.all()
+    queryset = SchemaAttribDefTrans.objects.select_related('schema_fk')
     serializer_class = SchemaAttribDefTransSerializer
 
 
@@ -219,6 +221,7 @@ class GraphAttribDefGraphsView(generics.ListCreateAPIView):
     """
     queryset = GraphAttribDefGraph.objects.all()
     serializer_class = GraphAttribDefGraphSerializer
+    filter_fields = ('graph_fk', 'label', 'type_fk')
 
 
 class GraphAttribDefGraphView(generics.RetrieveUpdateDestroyAPIView):
@@ -237,6 +240,7 @@ class GraphAttribDefVertexesView(generics.ListCreateAPIView):
     """
     queryset = GraphAttribDefVertex.objects.all()
     serializer_class = GraphAttribDefVertexSerializer
+    filter_fields = ('graph_fk', 'label', 'type_fk')
 
 
 class GraphAttribDefVertexView(generics.RetrieveUpdateDestroyAPIView):
@@ -255,6 +259,7 @@ class GraphAttribDefTransactionsView(generics.ListCreateAPIView):
     """
     queryset = GraphAttribDefTrans.objects.all()
     serializer_class = GraphAttribDefTransSerializer
+    filter_fields = ('graph_fk', 'label', 'type_fk')
 
 
 class GraphAttribDefTransactionView(generics.RetrieveUpdateDestroyAPIView):
@@ -275,6 +280,7 @@ class SchemasView(generics.ListCreateAPIView):
     """
     queryset = Schema.objects.all()
     serializer_class = SchemaSerializer
+    filter_fields = ('label',)
 
 
 class SchemaView(generics.RetrieveUpdateDestroyAPIView):
@@ -290,13 +296,9 @@ class SchemaView(generics.RetrieveUpdateDestroyAPIView):
         An graph is being deleted, only report this deletion, and not that of
         sub components.
         """
-        signals.post_delete.disconnect(schema_attribute_def_graph_deleted, sender=SchemaAttribDefGraph)
-        signals.post_delete.disconnect(schema_attribute_def_vertex_deleted, sender=SchemaAttribDefVertex)
-        signals.post_delete.disconnect(schema_attribute_def_transaction_deleted, sender=SchemaAttribDefTrans)
-        instance.delete()
-        signals.post_delete.connect(schema_attribute_def_graph_deleted, sender=SchemaAttribDefGraph)
-        signals.post_delete.connect(schema_attribute_def_vertex_deleted, sender=SchemaAttribDefVertex)
-        signals.post_delete.connect(schema_attribute_def_transaction_deleted, sender=SchemaAttribDefTrans)
+        with suppress(schema_attribute_def_graph_deleted, schema_attribute_def_vertex_deleted,
+                      schema_attribute_def_transaction_deleted):
+            instance.delete()
 # </editor-fold>
 
 
@@ -310,6 +312,7 @@ class GraphsView(generics.ListCreateAPIView):
     """
     queryset = Graph.objects.all()
     serializer_class = GraphSerializer
+    filter_fields = ('title', 'schema_fk')
 
     def create(self, request, *args, **kwargs):
         """
@@ -329,40 +332,36 @@ class GraphsView(generics.ListCreateAPIView):
         graph_record = Graph.objects.filter(title=request.data['title']).last()
 
         schema_graph_attribs = SchemaAttribDefGraph.objects.filter(schema_fk=schema_id)
-        signals.post_save.disconnect(graph_attribute_def_graph_saved, sender=GraphAttribDefGraph)
-        for schema_attrib in schema_graph_attribs:
-            graph_attrib = GraphAttribDefGraph(
-                graph_fk=graph_record,
-                label=schema_attrib.label,
-                type_fk=schema_attrib.type_fk,
-                descr=schema_attrib.descr,
-                default_str=schema_attrib.default_str)
-            graph_attrib.save()
-        signals.post_save.connect(graph_attribute_def_graph_saved, sender=GraphAttribDefGraph)
-
         schema_vtx_attribs = SchemaAttribDefVertex.objects.filter(schema_fk=schema_id)
-        signals.post_save.disconnect(graph_attribute_def_vertex_saved, sender=GraphAttribDefVertex)
-        for schema_attrib in schema_vtx_attribs:
-            graph_attrib = GraphAttribDefVertex(
-                graph_fk=graph_record,
-                label=schema_attrib.label,
-                type_fk=schema_attrib.type_fk,
-                descr=schema_attrib.descr,
-                default_str=schema_attrib.default_str)
-            graph_attrib.save()
-        signals.post_save.connect(graph_attribute_def_vertex_saved, sender=GraphAttribDefVertex)
-
         schema_trans_attribs = SchemaAttribDefTrans.objects.filter(schema_fk=schema_id)
-        signals.post_save.disconnect(graph_attribute_def_transaction_saved, sender=GraphAttribDefTrans)
-        for schema_attrib in schema_trans_attribs:
-            graph_attrib = GraphAttribDefTrans(
-                graph_fk=graph_record,
-                label=schema_attrib.label,
-                type_fk=schema_attrib.type_fk,
-                descr=schema_attrib.descr,
-                default_str=schema_attrib.default_str)
-            graph_attrib.save()
-        signals.post_save.connect(graph_attribute_def_transaction_saved, sender=GraphAttribDefTrans)
+        with graph_json_cache.suppress_changes(graph_record.id, graph_attribute_def_graph_saved,
+                                               graph_attribute_def_vertex_saved, graph_attribute_def_transaction_saved):
+            for schema_attrib in schema_graph_attribs:
+                graph_attrib = GraphAttribDefGraph(
+                    graph_fk=graph_record,
+                    label=schema_attrib.label,
+                    type_fk=schema_attrib.type_fk,
+                    descr=schema_attrib.descr,
+                    default_str=schema_attrib.default_str)
+                graph_attrib.save()
+
+            for schema_attrib in schema_vtx_attribs:
+                graph_attrib = GraphAttribDefVertex(
+                    graph_fk=graph_record,
+                    label=schema_attrib.label,
+                    type_fk=schema_attrib.type_fk,
+                    descr=schema_attrib.descr,
+                    default_str=schema_attrib.default_str)
+                graph_attrib.save()
+
+            for schema_attrib in schema_trans_attribs:
+                graph_attrib = GraphAttribDefTrans(
+                    graph_fk=graph_record,
+                    label=schema_attrib.label,
+                    type_fk=schema_attrib.type_fk,
+                    descr=schema_attrib.descr,
+                    default_str=schema_attrib.default_str)
+                graph_attrib.save()
         return graph
 
 
@@ -374,22 +373,26 @@ class GraphView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Graph.objects.all()
     serializer_class = GraphSerializer
 
+    def destroy(self, request, *args, **kwargs):
+        """
+        Delete the graph, or if ?background=true is supplied queue its
+        deletion as a background task performed by a celery worker, returning
+        immediately with 202 Accepted. A Graph DELETE notification is sent
+        once the graph has been deleted.
+        """
+        if request.query_params.get('background', '').lower() not in ('1', 'true', 'yes'):
+            return super(GraphView, self).destroy(request, *args, **kwargs)
+        instance = self.get_object()
+        purge_graph_task.delay(instance.id)
+        return Response({"message": "Queued delete", "graph_id": instance.id}, status=status.HTTP_202_ACCEPTED)
+
     def perform_destroy(self, instance):
         """
         An graph is being deleted, only report this deletion, and not that of
-        sub components.
+        sub components, which are purged using set based deletes rather than
+        being loaded to be deleted one by one (refer to app/purge.py).
         """
-        signals.post_delete.disconnect(graph_attribute_def_graph_deleted, sender=GraphAttribDefGraph)
-        signals.post_delete.disconnect(graph_attribute_def_vertex_deleted, sender=GraphAttribDefVertex)
-        signals.post_delete.disconnect(graph_attribute_def_transaction_deleted, sender=GraphAttribDefTrans)
-        signals.post_delete.disconnect(vertex_deleted, sender=Vertex)
-        signals.post_delete.disconnect(transaction_deleted, sender=Transaction)
-        instance.delete()
-        signals.post_delete.connect(graph_attribute_def_graph_deleted, sender=GraphAttribDefGraph)
-        signals.post_delete.connect(graph_attribute_def_vertex_deleted, sender=GraphAttribDefVertex)
-        signals.post_delete.connect(graph_attribute_def_transaction_deleted, sender=GraphAttribDefTrans)
-        signals.post_delete.connect(vertex_deleted, sender=Vertex)
-        signals.post_delete.connect(transaction_deleted, sender=Transaction)
+        purge_graphs([instance.id])
 
 
 class GraphAttributesView(generics.ListCreateAPIView):
@@ -398,6 +401,7 @@ class GraphAttributesView(generics.ListCreateAPIView):
     """
     queryset = GraphAttrib.objects.all()
     serializer_class = GraphAttribSerializer
+    filter_fields = ('graph_fk', 'attrib_fk', 'attrib_fk__label')
 
 
 class GraphAttributeView(generics.RetrieveUpdateDestroyAPIView):
@@ -412,49 +416,188 @@ class GraphAttributeView(generics.RetrieveUpdateDestroyAPIView):
         An attribute is being deleted from a graph. The parent graphs cached json needs to be updated to reflect it.
         :param instance: The attribute being deleted
         """
-        # Get parent graphs JSON, pop the attribute identified by its label and save to object
-        graph = instance.graph_fk
-        graph_attribute_json = json.loads(str(graph.attribute_json))
-
-        if instance.attrib_fk.label in graph_attribute_json:
-            graph_attribute_json.pop(instance.attrib_fk.label)
-        graph.attribute_json = json.dumps(graph_attribute_json)
-        signals.post_save.disconnect(graph_saved, sender=Graph)
-        graph.save()
-        signals.post_save.disconnect(graph_saved, sender=Graph)
-
-        # Delete the record
-        instance.delete()
+        # Remove the attribute identified by its label from the parent graphs JSON
+        with transaction.atomic():
+            remove_attributes(instance.graph_fk, [instance.attrib_fk.label])
+
+            # Delete the record
+            instance.delete()
+
+
+@api_view(['GET'])
+def GraphChanges(request, pk):
+    """
+    Return the changes made to a graph since the change numbered ?since=N,
+    allowing a subscriber that missed change notifications (ie while
+    disconnected) to catch up rather than reloading the graph. Every graph
+    change notification carries its graphs change sequence number as 'seq'.
+    An optional ?limit= caps the number of changes returned. Refer to
+    websockets/changelog.py:changes_since for the response format; if its
+    'reload' flag is set the changes are no longer available and the graph
+    needs to be reloaded.
+    """
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return Response({"Error": "since and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(changes_since(pk, since, limit))
 # </editor-fold>
 
 
 # <editor-fold Graph JSON creation views">
-class GraphJson(generics.RetrieveAPIView):
+class CachedGraphJsonMixin:
+    """
+    Retrieve the serialized JSON document of a graph through the graph JSON
+    cache (refer to app/graph_cache.py), so repeat reads of an unchanged
+    graph are served without touching the database. Documents are built by
+    splicing the stored attribute_json of each row into the output (refer to
+    app/graph_export.py), the serializer_class documenting the output and
+    being used if no export function is set. Documents are always rendered
+    as JSON, unless the view sets another content_type.
+    """
+    # Name of the part of the graph the view returns, used in cache keys
+    cache_part = None
+    # Function returning a generator of the documents bytes for a Graph
+    export_function = None
+    # Content type of the documents
+    content_type = 'application/json'
+
+    def get_cache_part(self):
+        """
+        :return: Name of the part of the graph the request returns, used in
+                 cache keys.
+        """
+        return self.cache_part
+
+    def export(self, graph):
+        """
+        :param graph: Graph object.
+        :return: Generator of the documents bytes.
+        """
+        return self.export_function(graph)
+
+    def retrieve(self, request, *args, **kwargs):
+        # The graph is looked up first so that a deleted graph returns 404
+        # rather than a cached document
+        graph = self.get_object()
+
+        def build():
+            if self.export_function is None:
+                return JSONRenderer().render(self.get_serializer(graph).data)
+            return b''.join(self.export(graph))
+        document = graph_json_cache.get_or_build(self.get_cache_part(), graph.id, build)
+        return HttpResponse(document, content_type=self.content_type)
+
+
+class GraphJson(CachedGraphJsonMixin, generics.RetrieveAPIView):
     """
     Generate a JSON representation of the selected graph.
     Refer to get_vertex_json and get_transaction_json serializer code for
     information on performance tuning.
     """
-    queryset = Graph.objects.prefetch_related('vertex_set', 'transaction_set')
+    queryset = Graph.objects.select_related('schema_fk')
     serializer_class = GraphJsonSerializer
+    cache_part = 'graph'
+    export_function = staticmethod(iter_graph_json)
 
 
-class GraphJsonVertexes(generics.RetrieveAPIView):
+class GraphJsonVertexes(CachedGraphJsonMixin, generics.RetrieveAPIView):
     """
     Generate a JSON representation of the vertex component of the selected
     graph.
     """
     queryset = Graph.objects.all()
     serializer_class = GraphJsonVertexesSerializer
+    cache_part = 'vertex'
+    export_function = staticmethod(iter_graph_vertex_json)
 
 
-class GraphJsonTransactions(generics.RetrieveAPIView):
+class GraphJsonTransactions(CachedGraphJsonMixin, generics.RetrieveAPIView):
     """
     Generate a JSON representation of the transaction component of the selected
     graph.
     """
     queryset = Graph.objects.all()
     serializer_class = GraphJsonTransactionsSerializer
+    cache_part = 'transaction'
+    export_function = staticmethod(iter_graph_transaction_json)
+
+
+class GraphNpz(CachedGraphJsonMixin, generics.RetrieveAPIView):
+    """
+    Generate a compact columnar representation of the selected graph as a
+    numpy .npz archive, holding one typed array per vertex and transaction
+    attribute (refer to app/columnar_export.py). Supply ?compress=true for a
+    compressed archive, trading CPU time for size.
+    """
+    queryset = Graph.objects.select_related('schema_fk')
+    serializer_class = GraphSerializer
+    cache_part = 'npz'
+    export_function = staticmethod(iter_graph_npz)
+    content_type = 'application/octet-stream'
+
+    def compressed(self):
+        """
+        :return: True if a compressed archive was requested.
+        """
+        return self.request.query_params.get('compress', '').lower() in ('1', 'true', 'yes')
+
+    def get_cache_part(self):
+        return self.cache_part + ('.compressed' if self.compressed() else '')
+
+    def export(self, graph):
+        return iter_graph_npz(graph, compressed=self.compressed())
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super(GraphNpz, self).retrieve(request, *args, **kwargs)
+        response['Content-Disposition'] = 'attachment; filename="graph_' + str(kwargs['pk']) + '.npz"'
+        return response
+
+
+class StreamedGraphJsonMixin:
+    """
+    Stream the JSON document of a graph to the client as it is produced,
+    rows being read from the database in chunks using server-side cursors
+    (refer to app/graph_export.py). Memory use stays flat regardless of the
+    size of the graph and clients can start parsing straight away. Streamed
+    documents bypass the graph JSON cache.
+    """
+    # Function returning a generator of the documents bytes for a Graph
+    export_function = None
+
+    def retrieve(self, request, *args, **kwargs):
+        return StreamingHttpResponse(self.export_function(self.get_object()), content_type='application/json')
+
+
+class GraphJsonStream(StreamedGraphJsonMixin, generics.RetrieveAPIView):
+    """
+    Stream a JSON representation of the selected graph.
+    """
+    queryset = Graph.objects.select_related('schema_fk')
+    serializer_class = GraphJsonSerializer
+    export_function = staticmethod(iter_graph_json)
+
+
+class GraphJsonVertexesStream(StreamedGraphJsonMixin, generics.RetrieveAPIView):
+    """
+    Stream a JSON representation of the vertex component of the selected
+    graph.
+    """
+    queryset = Graph.objects.all()
+    serializer_class = GraphJsonVertexesSerializer
+    export_function = staticmethod(iter_graph_vertex_json)
+
+
+class GraphJsonTransactionsStream(StreamedGraphJsonMixin, generics.RetrieveAPIView):
+    """
+    Stream a JSON representation of the transaction component of the selected
+    graph.
+    """
+    queryset = Graph.objects.all()
+    serializer_class = GraphJsonTransactionsSerializer
+    export_function = staticmethod(iter_graph_transaction_json)
 # </editor-fold>
 
 
@@ -463,8 +606,9 @@ class VertexesView(generics.ListCreateAPIView):
     """
     Support Create and List operations of Vertexes.
     """
-    queryset = Vertex.objects.prefetch_related('vertex_attribs')
+    queryset = Vertex.objects.all()
     serializer_class = VertexSerializer
+    filter_fields = ('graph_fk', 'vx_id', 'vx_id__in')
 
 
 class VertexView(generics.RetrieveUpdateDestroyAPIView):
@@ -476,9 +620,8 @@ class VertexView(generics.RetrieveUpdateDestroyAPIView):
 
     def perform_destroy(self, instance):
         # Delete the record
-        signals.post_delete.disconnect(vertex_attribute_deleted, sender=VertexAttrib)
-        instance.delete()
-        signals.post_delete.connect(vertex_attribute_deleted, sender=VertexAttrib)
+        with suppress(vertex_attribute_deleted):
+            instance.delete()
 
 
 class VertexAttributesView(generics.ListCreateAPIView):
@@ -487,6 +630,8 @@ class VertexAttributesView(generics.ListCreateAPIView):
     """
     queryset = VertexAttrib.objects.all()
     serializer_class = VertexAttribSerializer
+    filter_fields = {'graph_fk': 'vertex_fk__graph_fk', 'vertex_fk': 'vertex_fk', 'attrib_fk': 'attrib_fk',
+                     'attrib_fk__label': 'attrib_fk__label'}
 
 
 class VertexAttributeView(generics.RetrieveUpdateDestroyAPIView):
@@ -501,19 +646,12 @@ class VertexAttributeView(generics.RetrieveUpdateDestroyAPIView):
         An attribute is being deleted from a vertex. The parent vertexes cached json needs to be updated to reflect it.
         :param instance: The attribute being deleted
         """
-        # Get parent vertexes JSON, pop the attribute identified by its label and save to object
-        vertex = instance.vertex_fk
-        vertex_attribute_json = json.loads(str(vertex.attribute_json))
-
-        if instance.attrib_fk.label in vertex_attribute_json:
-            vertex_attribute_json.pop(instance.attrib_fk.label)
-        vertex.attribute_json = json.dumps(vertex_attribute_json)
-        signals.post_save.disconnect(vertex_saved, sender=Vertex)
-        vertex.save()
-        signals.post_save.connect(vertex_saved, sender=Vertex)
+        # Remove the attribute identified by its label from the parent vertexes JSON
+        with transaction.atomic():
+            remove_attributes(instance.vertex_fk, [instance.attrib_fk.label])
 
-        # Delete the record
-        instance.delete()
+            # Delete the record
+            instance.delete()
 # </editor-fold>
 
 
@@ -525,6 +663,7 @@ class TransactionsView(generics.ListCreateAPIView):
     """
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    filter_fields = ('graph_fk', 'tx_id', 'tx_id__in', 'vx_src', 'vx_dst')
 
 
 class TransactionView(generics.RetrieveUpdateDestroyAPIView):
@@ -537,9 +676,8 @@ class TransactionView(generics.RetrieveUpdateDestroyAPIView):
 
     def perform_destroy(self, instance):
         # Delete the record
-        signals.post_delete.disconnect(transaction_attribute_deleted, sender=TransactionAttrib)
-        instance.delete()
-        signals.post_delete.connect(transaction_attribute_deleted, sender=TransactionAttrib)
+        with suppress(transaction_attribute_deleted):
+            instance.delete()
 
 
 class TransactionAttributesView(generics.ListCreateAPIView):
@@ -549,6 +687,8 @@ class TransactionAttributesView(generics.ListCreateAPIView):
     """
     queryset = TransactionAttrib.objects.all()
     serializer_class = TransactionAttribSerializer
+    filter_fields = {'graph_fk': 'transaction_fk__graph_fk', 'transaction_fk': 'transaction_fk',
+                     'attrib_fk': 'attrib_fk', 'attrib_fk__label': 'attrib_fk__label'}
 
 
 class TransactionAttributeView(generics.RetrieveUpdateDestroyAPIView):
@@ -565,20 +705,12 @@ class TransactionAttributeView(generics.RetrieveUpdateDestroyAPIView):
         transactions cached json needs to be updated to reflect it.
         :param instance: The attribute being deleted
         """
-        # Get parent vertexes JSON, pop the attribute identified by its label and save to object
-        transaction = instance.transaction_fk
-        transaction_attribute_json = json.loads(str(transaction.attribute_json))
+        # Remove the attribute identified by its label from the parent transactions JSON
+        with transaction.atomic():
+            remove_attributes(instance.transaction_fk, [instance.attrib_fk.label])
 
-        if instance.attrib_fk.label in transaction_attribute_json:
-            transaction_attribute_json.pop(instance.attrib_fk.label)
-        transaction.attribute_json = json.dumps(transaction_attribute_json)
-
-        signals.post_save.disconnect(transaction_saved, sender=Transaction)
-        transaction.save()
-        signals.post_save.connect(transaction_saved, sender=Transaction)
-
-        # Delete the record
-        instance.delete()
+            # Delete the record
+            instance.delete()
 # </editor-fold>
 
 
@@ -742,6 +874,45 @@ def EditTransactionAttribute(request):
 
         return Response({"Info": "Found all keys", "data": request.data})
 
+
+@api_view(['POST'])
+def EditAttributes(request):
+    """
+    Allow a batch of graph, vertex and transaction attributes of a graph to be
+    added, or edited in one request, ie to change an attribute of every
+    vertex at once. Body of POST should be of the form:
+        {"graph_id": 3,
+         "vertexes": {"vx_id": [0, 1, 2], "values": {"x": [1.0, 2.0, 3.0], "color": "red"}},
+         "transactions": {"tx_id": [5, 6], "values": {"weight": [2, 3]}},
+         "graph": {"title": "My graph"},
+         "edits": [{"vx_id": 0, "label": "x", "value": 1.0}]}
+    Where graph_id identifies the parent graph, and the attributes to change
+    are supplied as columns (a list of values per label, or a single value
+    for every listed vx_id/tx_id) and/or as rows of the form accepted by the
+    edit_vertex_attrib, edit_transaction_attrib and edit_graph_attrib
+    endpoints. Refer to app/batch_edit.py:parse_edits.
+    The edits are applied in a single transaction; if any vertex,
+    transaction or attribute label does not exist none are applied and 400
+    is returned. Subscribers receive a single AttributeEdit update for the
+    batch rather than one per attribute.
+    """
+    if ATTRIBUTE_EDITOR_KEY_GRAPH_ID not in request.data:
+        return Response({"Error": "Missing keys: " + ATTRIBUTE_EDITOR_KEY_GRAPH_ID, "data": request.data},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        graph_id = int(request.data[ATTRIBUTE_EDITOR_KEY_GRAPH_ID])
+    except (TypeError, ValueError):
+        return Response({"Error": ATTRIBUTE_EDITOR_KEY_GRAPH_ID + " must be an integer"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        counts = apply_edits(graph_id, parse_edits(request.data))
+    except Graph.DoesNotExist:
+        return Response({"Error": "Could not find graph with supplied graph_id value"},
+                        status=status.HTTP_404_NOT_FOUND)
+    except BatchEditError as e:
+        return Response({"Error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"graph_id": graph_id, "counts": counts})
+
 # </editor-fold>
 
 
@@ -759,14 +930,17 @@ def ImportLegacyJSON(request):
     This script will output some JSON to cut and paste into the payload of the
     POST command.
 
+    The import is queued as a background task performed by a celery worker,
+    and this endpoint returns immediately with the ID of an ImportJob. Progress
+    of the import can be followed using the import_jobs/<id> endpoint or via
+    ImportJob update notifications.
+
     WARNING1: This endpoint is for development purposes only, so is not overly
     robust - it expects valid graph file data to exist.
-    WARNING2: The upload process is a slow process, grab a coffee or a chai
-    latte and wait a few minutes.
-    WARNING3: The imported depends on attrib_type values existing for all types
+    WARNING2: The imported depends on attrib_type values existing for all types
     defined in the graph file, if any don't exist, they need to manually be
-    created first. An error will be returned in the POST output highlighting
-    the attrib_type labels that need to be created.
+    created first. The ImportJob will fail with an error highlighting the
+    attrib_type labels that need to be created.
     """
     if request.method == 'POST':
 
@@ -778,369 +952,28 @@ def ImportLegacyJSON(request):
         if not path.isfile(star_filename):
             return Response({"Error": "supplied filename could not be found in import directory", "data": request.data})
 
-        # Unzip the file to get its inner graph.txt which contains the JSON to
-        # import
-        with zipfile.ZipFile(star_filename, 'r') as zip_ref:
-            zip_ref.extractall('import')
-
-        # Process the inner graph file
-        json_filename = path.join('import', 'graph.txt')
-        f = open(json_filename, )
-        data = json.load(f, encoding="utf8")
-
-        # Read the blocks of data from the STAR file, which provides the graph
-        # elements as an array of 'blocks'
-        version_block = data[0]
-        graph_block = data[1]
-        vertex_block = data[2]
-        transaction_block = data[3]
-        meta_block = data[4]
-
-        # Ensure all attribute types are already defined. Because the import
-        # cannot deduce the 'raw type' of defined attribute types, the user
-        # needs to make sure all the attribute types are known before the
-        # import
-        missing_attribute_types = set()
-        attr_types = list(AttribType.objects.all().values_list('label', flat=True))
-        attr_type_error = False
-        attrs = graph_block['graph'][0]['attrs']
-        for attr in attrs:
-            typename = attr['type']
-            if typename not in attr_types:
-                attr_type_error = True
-                missing_attribute_types.add(typename)
-        attrs = vertex_block['vertex'][0]['attrs']
-        for attr in attrs:
-            typename = attr['type']
-            if typename not in attr_types:
-                attr_type_error = True
-                missing_attribute_types.add(typename)
-        attrs = transaction_block['transaction'][0]['attrs']
-        for attr in attrs:
-            typename = attr['type']
-            if typename not in attr_types:
-                attr_type_error = True
-                missing_attribute_types.add(typename)
-        if attr_type_error:
-            return Response({"Error": "Unknown attribute types specified - please create using attrib_types endpoint: "
-                                      + str(missing_attribute_types), "data": request.data})
-
-        # Create a dictionary of attribute types indexed by name to allow
-        # subsequent processing
-        attr_types = {}
-        attr_types_queryset = AttribType.objects.all()
-        for attr in attr_types_queryset:
-            attr_types[attr.label] = attr
-
-        # Handle processing of schema, create a corresponding schema if one
-        # doesn't exist
-        schema = None
-        if 'version' in version_block and 'schema' in version_block:
-            schema_name = version_block['schema']
-            matching_schemas = Schema.objects.filter(label=schema_name)
-            if len(matching_schemas) > 0:
-                schema = matching_schemas.last()
-            else:
-                schema = Schema(label=schema_name)
-                schema.save()
-
-        # If graph already exists in DB, delete all its records so it can be
-        # recreated
-
-        signals.post_delete.disconnect(graph_attribute_def_graph_deleted, sender=GraphAttribDefGraph)
-        signals.post_delete.disconnect(graph_attribute_def_vertex_deleted, sender=GraphAttribDefVertex)
-        signals.post_delete.disconnect(graph_attribute_def_transaction_deleted, sender=GraphAttribDefTrans)
-        signals.post_delete.disconnect(graph_attribute_deleted, sender=GraphAttrib)
-        signals.post_delete.disconnect(vertex_deleted, sender=Vertex)
-        signals.post_delete.disconnect(vertex_attribute_deleted, sender=VertexAttrib)
-        signals.post_delete.disconnect(transaction_deleted, sender=Transaction)
-        signals.post_delete.disconnect(transaction_attribute_deleted, sender=TransactionAttrib)
-
-        Graph.objects.filter(title=request.data["filename"]).delete()
-        graph = Graph.objects.create(title=request.data["filename"], schema_fk=schema,
-                                     next_vertex_id=1, next_transaction_id=1)
-
-        signals.post_delete.connect(graph_attribute_def_graph_deleted, sender=GraphAttribDefGraph)
-        signals.post_delete.connect(graph_attribute_def_vertex_deleted, sender=GraphAttribDefVertex)
-        signals.post_delete.connect(graph_attribute_def_transaction_deleted, sender=GraphAttribDefTrans)
-        signals.post_delete.connect(graph_attribute_deleted, sender=GraphAttrib)
-        signals.post_delete.connect(vertex_deleted, sender=Vertex)
-        signals.post_delete.connect(vertex_attribute_deleted, sender=VertexAttrib)
-        signals.post_delete.connect(transaction_deleted, sender=Transaction)
-        signals.post_delete.connect(transaction_attribute_deleted, sender=TransactionAttrib)
-
-        # Process graph attribute definitions
-        attrs = graph_block['graph'][0]['attrs']
-        signals.post_save.disconnect(graph_attribute_def_graph_saved, sender=GraphAttribDefGraph)
-        for attr in attrs:
-            label = attr['label']
-            typename = attr['type']
-            descr = attr['descr'] if 'descr' in attr else None
-            default_str = attr['default'] if 'default' in attr else None
-            attr_type = attr_types[typename]
-            GraphAttribDefGraph.objects.create(graph_fk=graph, label=label, type_fk=attr_type,
-                                               descr=descr, default_str=default_str)
-        signals.post_save.connect(graph_attribute_def_graph_saved, sender=GraphAttribDefGraph)
-
-        # Create a dictionary of graph attribute definitions just created for
-        # quick lookup when processing actual graph
-        graph_attribute_defs = {}
-        for attr in GraphAttribDefGraph.objects.filter(graph_fk=graph):
-            graph_attribute_defs[attr.label] = attr
-
-        count = 0
-        django_attributes = []
-        graph_data = graph_block['graph'][1]['data']
-        for attr in graph_data[0]:
-            print(str(attr))
-
-            # Find corresponding attribute definition
-            graph_attrib = graph_attribute_defs[attr]
-            value = graph_data[0][attr]
-
-
-            # TODO: sometime string is either string or json, in this
-            # TODO: case, if its json, better to convert to double
-            # TODO: quote JSON with json.dumps
-            if graph_attrib.type_fk.raw_type == AttribTypeChoice.DICT.value:
-                value = json.dumps(value)
-            graph_attrib = GraphAttrib(graph_fk=graph, attrib_fk=graph_attrib,
-                                       value_str=value)
-            django_attributes.append(graph_attrib)
-            count = count + 1
-            print(str(attr) + " = " + str(graph_attrib))
-            if count >= IMPORT_BATCH_SIZE:
-                signals.post_save.disconnect(graph_saved, sender=Graph)
-                GraphAttrib.objects.bulk_create(django_attributes)
-                signals.post_save.connect(graph_saved, sender=Graph)
-                django_attributes = []
-                count = 0
-
-        # Create any leftover records
-        if count > 0:
-            signals.post_save.disconnect(graph_saved, sender=Graph)
-            GraphAttrib.objects.bulk_create(django_attributes)
-            signals.post_save.connect(graph_saved, sender=Graph)
-
-
-        # Process vertex attribute definitions
-        attrs = vertex_block['vertex'][0]['attrs']
-        signals.post_save.disconnect(graph_attribute_def_vertex_saved, sender=GraphAttribDefVertex)
-        for attr in attrs:
-            label = attr['label']
-            typename = attr['type']
-            descr = attr['descr'] if 'descr' in attr else None
-            default_str = attr['default'] if 'default' in attr else None
-            attr_type = attr_types[typename]
-            GraphAttribDefVertex.objects.create(graph_fk=graph, label=label, type_fk=attr_type,
-                                                descr=descr, default_str=default_str)
-        signals.post_save.connect(graph_attribute_def_vertex_saved, sender=GraphAttribDefVertex)
-
-        # Create a dictionary of vertex attribute definitions just created for
-        # quick lookup when processing actual vertexes
-        graph_vertex_attribute_defs = {}
-        for attr in GraphAttribDefVertex.objects.filter(graph_fk=graph):
-            graph_vertex_attribute_defs[attr.label] = attr
-
-        # Loop through vertexes and generate them
-        vertexes = vertex_block['vertex'][1]['data']
-        max_vx_id = 0
-        count = 0
-        django_vertexes = []
-        for vtx in vertexes:
-            vx_id = vtx['vx_id_']
-
-            # Keep track of maximum ID to setup auto increment
-            max_vx_id = max(max_vx_id, vx_id)
-
-            # Add vertex attributes to rolled up vertex JSON
-            vertex_json = {}
-            for attr in vtx:
-                vertex_json[attr] = vtx[attr]
-
-            # Add vertex to array pending bulk create
-            vertex = Vertex(graph_fk=graph, vx_id=vx_id, attribute_json=json.dumps(vertex_json))
-            django_vertexes.append(vertex)
-
-            # Manage bulk creation based on list size, chunk up into blocks of
-            # up to IMPORT_BATCH_SIZE records at a time
-            count = count + 1
-            if count >= IMPORT_BATCH_SIZE:
-                signals.post_save.disconnect(vertex_saved, sender=Vertex)
-                Vertex.objects.bulk_create(django_vertexes)
-                signals.post_save.connect(vertex_saved, sender=Vertex)
-                django_vertexes = []
-                count = 0
-
-        # Create any leftover records
-        if count > 0:
-            signals.post_save.disconnect(vertex_saved, sender=Vertex)
-            Vertex.objects.bulk_create(django_vertexes)
-            signals.post_save.connect(vertex_saved, sender=Vertex)
-
-        # Store dictionary of vertexes for this graph, used in lookups by
-        # vertex attributes and transaction endpoints
-        db_vertexes = Vertex.objects.filter(graph_fk=graph)
-        vertex_dict = {}
-        for vertex in db_vertexes:
-            vertex_dict[vertex.vx_id] = vertex
-
-        # Loop through vertex attributes and generate them
-        count = 0
-        django_vertex_attributes = []
-        for vtx in vertexes:
-            for attr in vtx:
-                if attr != 'vx_id_':
-
-                    # Find corresponding attribute definition
-                    graph_vtx_attrib = graph_vertex_attribute_defs[attr]
-                    value = vtx[attr]
-
-                    # TODO: sometime string is either string or json, in this
-                    # TODO: case, if its json, better to convert to double
-                    # TODO: quote JSON with json.dumps
-                    if graph_vtx_attrib.type_fk.raw_type == AttribTypeChoice.DICT.value:
-                        value = json.dumps(value)
-                    vertex_attrib = VertexAttrib(vertex_fk=vertex_dict[vtx['vx_id_']], attrib_fk=graph_vtx_attrib,
-                                                 value_str=value)
-                    django_vertex_attributes.append(vertex_attrib)
-                    # Keep track of actual attributes processed rather than
-                    # vertexes, as such sometimes count will end up greater
-                    # than IMPORT_BATCH_SIZE, but not by much.
-                    count = count + 1
-
-            # Manage bulk creation based on list size, chunk up into blocks of
-            # (about) IMPORT_BATCH_SIZE records at a time
-            if count >= IMPORT_BATCH_SIZE:
-                signals.post_save.disconnect(vertex_saved, sender=Vertex)
-                signals.post_save.disconnect(vertex_attribute_saved, sender=VertexAttrib)
-                VertexAttrib.objects.bulk_create(django_vertex_attributes)
-                signals.post_save.connect(vertex_saved, sender=Vertex)
-                signals.post_save.connect(vertex_attribute_saved, sender=VertexAttrib)
-                django_vertex_attributes = []
-                count = 0
-
-        # Create any leftover records
-        if count > 0:
-            signals.post_save.disconnect(vertex_saved, sender=Vertex)
-            signals.post_save.disconnect(vertex_attribute_saved, sender=VertexAttrib)
-            VertexAttrib.objects.bulk_create(django_vertex_attributes)
-            signals.post_save.connect(vertex_saved, sender=Vertex)
-            signals.post_save.connect(vertex_attribute_saved, sender=VertexAttrib)
-
-        # Process transaction attribute definitions
-        attrs = transaction_block['transaction'][0]['attrs']
-        signals.post_save.disconnect(graph_attribute_def_transaction_saved, sender=GraphAttribDefTrans)
-        for attr in attrs:
-            label = attr['label']
-            typename = attr['type']
-            descr = attr['descr']
-            default_str = attr['default'] if 'default' in attr else None
-            attr_type = attr_types[typename]
-            GraphAttribDefTrans.objects.create(graph_fk=graph, label=label, type_fk=attr_type,
-                                               descr=descr, default_str=default_str)
-        signals.post_save.connect(graph_attribute_def_transaction_saved, sender=GraphAttribDefTrans)
-
-        # Create a dictionary of transaction attribute definitions just created for
-        # quick lookup when processing actual transactions
-        graph_transaction_attribute_defs = {}
-        for attr in GraphAttribDefTrans.objects.filter(graph_fk=graph):
-            graph_transaction_attribute_defs[attr.label] = attr
-
-        # Loop through transactions and generate them
-        transactions = transaction_block['transaction'][1]['data']
-        max_tx_id = 0
-        count = 0
-        django_transactions = []
-        for trans in transactions:
-            tx_id = trans['tx_id_']
-            tx_dir = trans['tx_dir_']
-            vx_src = vertex_dict[trans['vx_src_']]
-            vx_dst = vertex_dict[trans['vx_dst_']]
-
-            # Keep track of maximum ID to setup auto increment
-            max_tx_id = max(max_tx_id, tx_id)
-
-            # Add transaction attributes to rolled up transaction JSON
-            transaction_json = {}
-            for attr in trans:
-                transaction_json[attr] = trans[attr]
-
-            # Add transaction to array pending bulk create
-            transaction = Transaction(graph_fk=graph, tx_id=tx_id, vx_src=vx_src, vx_dst=vx_dst,
-                                      tx_dir=tx_dir, attribute_json=json.dumps(transaction_json))
-            django_transactions.append(transaction)
-
-            # Manage bulk creation based on list size, chunk up into blocks of
-            # up to IMPORT_BATCH_SIZE records at a time
-            count = count + 1
-            if count >= IMPORT_BATCH_SIZE:
-                signals.post_save.disconnect(transaction_saved, sender=Transaction)
-                Transaction.objects.bulk_create(django_transactions)
-                signals.post_save.connect(transaction_saved, sender=Transaction)
-                django_transactions = []
-                count = 0
-
-        # Create any leftover records
-        if count > 0:
-            signals.post_save.disconnect(transaction_saved, sender=Transaction)
-            Transaction.objects.bulk_create(django_transactions)
-            signals.post_save.connect(transaction_saved, sender=Transaction)
-
-        # Store dictionary of transactions for this graph, used in lookups by
-        # transaction attributes
-        db_transactions = Transaction.objects.filter(graph_fk=graph)
-        transaction_dict = {}
-        for transaction in db_transactions:
-            transaction_dict[transaction.tx_id] = transaction
-
-        # Loop through transaction attributes and generate them
-        count = 0
-        django_trans_attribs = []
-        for trans in transactions:
-            for attr in trans:
-                if attr != 'tx_id_' and attr != 'vx_src_' and attr != 'vx_dst_' and attr != 'tx_dir_':
-                    # Find corresponding attribute definition
-                    graph_trans_attrib = graph_transaction_attribute_defs[attr]
-                    value = trans[attr]
-
-                    # TODO: sometime string is either string or json, in this
-                    # TODO: case, if its json, better to convert to double
-                    # TODO: quote JSON with json.dumps
-                    if graph_trans_attrib.type_fk.raw_type == AttribTypeChoice.DICT.value:
-                        value = json.dumps(value)
-                    transaction_attrib = TransactionAttrib(transaction_fk=transaction_dict[trans['tx_id_']],
-                                                           attrib_fk=graph_trans_attrib, value_str=value)
-                    django_trans_attribs.append(transaction_attrib)
-                    # Keep track of actual attributes processed rather than
-                    # transactions, as such sometimes count will end up greater
-                    # than IMPORT_BATCH_SIZE, but not by much.
-                    count = count + 1
-
-            # Manage bulk creation based on list size, chunk up into blocks of
-            # (about) IMPORT_BATCH_SIZE records at a time
-            if count >= IMPORT_BATCH_SIZE:
-                signals.post_save.disconnect(transaction_saved, sender=Transaction)
-                signals.post_save.disconnect(transaction_attribute_saved, sender=TransactionAttrib)
-                TransactionAttrib.objects.bulk_create(django_trans_attribs)
-                signals.post_save.connect(transaction_saved, sender=Transaction)
-                signals.post_save.connect(transaction_attribute_saved, sender=TransactionAttrib)
-                django_trans_attribs = []
-                count = 0
-        if count > 0:
-            signals.post_save.disconnect(transaction_saved, sender=Transaction)
-            signals.post_save.disconnect(transaction_attribute_saved, sender=TransactionAttrib)
-            TransactionAttrib.objects.bulk_create(django_trans_attribs)
-            signals.post_save.connect(transaction_saved, sender=Transaction)
-            signals.post_save.connect(transaction_attribute_saved, sender=TransactionAttrib)
-
-        # Update graph counters and cleanup
-        graph.next_vertex_id = max_vx_id + 1
-        graph.next_transaction_id = max_tx_id + 1
-        graph.save()
-        os.remove(json_filename)
-        return Response({"message": "Completed processing import", "data": request.data})
+        job = ImportJob.objects.create(filename=str(request.data["filename"]))
+        import_starfile_task.delay(job.id)
+        return Response({"message": "Queued import", "import_job_id": job.id, "data": request.data})
 
     return Response({"Error": "Operation nor permitted"})
 
+
+class ImportJobsView(generics.ListAPIView):
+    """
+    Support List operations of star file ImportJobs.
+    """
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    filter_fields = ('status', 'graph_fk')
+
+
+class ImportJobView(generics.RetrieveAPIView):
+    """
+    Support Read operations of star file ImportJobs, allowing the progress of
+    an import to be followed.
+    """
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+
 # </editor-fold>
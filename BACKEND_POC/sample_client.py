@@ -24,12 +24,119 @@
 # Usage - 'python sample_client.py'
 # when running a set of unique queues are generated based on requested data and
 # current PID. These queues are red and new entries popped off of them as read.
-import pika, sys, os
+#
+# If the backend publishes to a topic exchange (UPDATE_EXCHANGE_TYPE=topic),
+# the queue can be bound to only the updates of interest, ie:
+#   python sample_client.py --graph 12 --model Vertex --model VertexAttrib
+#   python sample_client.py --graph 12 --operation DELETE
+#   python sample_client.py --bind 'schema.#'
+# Routing keys have the form <scope>.<id>.<Model>.<operation>, where scope is
+# graph, schema or global.
+#
+# Graph changes carry their graphs change sequence number as 'seq'. When a gap
+# in the sequence is seen (ie changes were published while the client was not
+# consuming) the missed changes are fetched from the graphs/<id>/changes
+# endpoint of the REST API (--api) rather than reloading the graph.
+import argparse, json, pika, sys, os
+import urllib.request
 
 EXCHANGER_NAME = 'CONSTELLATION.DataUpdates'
+TOPIC_EXCHANGER_NAME = 'CONSTELLATION.DataUpdates.Topic'
+
+
+def binding_key(graph_id=None, model=None, operation=None):
+    """
+    Return a topic exchange binding key matching updates to the supplied
+    graph, model and operation, any of which may be omitted to match all.
+    """
+    scope = 'graph.' + str(graph_id) if graph_id is not None else '*.*'
+    return scope + '.' + (model or '*') + '.' + (operation or '*')
+
+
+def binding_keys(graph_ids, models, operations):
+    """
+    Return the binding keys matching any combination of the supplied graph
+    IDs, models and operations.
+    """
+    return [binding_key(graph_id, model, operation)
+            for graph_id in (graph_ids or [None])
+            for model in (models or [None])
+            for operation in (operations or [None])]
+
+
+def apply_delta(attributes, change):
+    """
+    Apply the delta of an attribute change to the locally held attribute
+    values, keyed by (graph_id, record type, record id), printing the
+    resulting values. Changes without a delta (or with delta_truncated set)
+    would need the record to be fetched using the REST endpoints.
+    """
+    delta = change.get('delta')
+    if delta is None:
+        return
+    if change['type'] == 'AttributeEdit':
+        # A batch of attribute edits, with the new values of each record
+        graph_id = change['graph_id']
+        edits = [((graph_id, 'graph', graph_id), delta.get('graph'))]
+        edits.extend(((graph_id, 'vertex', vertex['vertex_id']), vertex['values'])
+                     for vertex in delta.get('vertexes', []))
+        edits.extend(((graph_id, 'transaction', transaction['transaction_id']), transaction['values'])
+                     for transaction in delta.get('transactions', []))
+        for key, edited_values in edits:
+            if edited_values:
+                values = attributes.setdefault(key, {})
+                values.update(edited_values)
+                print('  graph %s %s %s: %r' % (key[0], key[1], key[2], values))
+        return
+    if change['type'] not in ('GraphAttrib', 'VertexAttrib', 'TransactionAttrib'):
+        return
+    if change['type'] == 'VertexAttrib':
+        key = (change['graph_id'], 'vertex', change['vertex_id'])
+    elif change['type'] == 'TransactionAttrib':
+        key = (change['graph_id'], 'transaction', change['transaction_id'])
+    else:
+        key = (change['graph_id'], 'graph', change['graph_id'])
+    values = attributes.setdefault(key, {})
+    if change['operation'] == 'DELETE':
+        values.pop(delta['label'], None)
+    else:
+        values[delta['label']] = delta['value']
+    print('  graph %s %s %s: %r' % (key[0], key[1], key[2], values))
+
+
+def fetch_changes(api, graph_id, since):
+    """
+    Fetch the changes made to a graph since the change numbered since, from
+    the graphs/<id>/changes endpoint, following the endpoint while it has
+    more changes.
+    :return: List of changes, or None if the changes are no longer available
+             and the graph needs to be reloaded.
+    """
+    changes = []
+    while True:
+        url = api.rstrip('/') + '/graphs/' + str(graph_id) + '/changes?since=' + str(since)
+        with urllib.request.urlopen(url) as response:
+            replay = json.loads(response.read().decode())
+        if replay['reload']:
+            return None
+        changes.extend(replay['changes'])
+        if not replay['more'] or not replay['changes']:
+            return changes
+        since = replay['changes'][-1]['seq']
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Echo updates published by web-constellation')
+    parser.add_argument('--graph', type=int, action='append', help='Only receive updates to this graph')
+    parser.add_argument('--model', action='append', help='Only receive updates to this model, ie Vertex')
+    parser.add_argument('--operation', action='append', help='Only receive this operation, ie POST')
+    parser.add_argument('--bind', action='append', help='Topic exchange binding key to bind the queue with')
+    parser.add_argument('--api', default='http://127.0.0.1:8000', help='REST API used to fetch missed changes')
+    args = parser.parse_args()
+    keys = list(args.bind or [])
+    if args.graph or args.model or args.operation:
+        keys.extend(binding_keys(args.graph, args.model, args.operation))
+
     my_pid = os.getpid()
     credentials = pika.PlainCredentials('user', 'password')
     connection = pika.BlockingConnection(pika.ConnectionParameters(host='127.0.0.1',
@@ -37,15 +144,57 @@ def main():
     channel = connection.channel()
 
     # Identify the exchanges being read
-    channel.exchange_declare(exchange=EXCHANGER_NAME, exchange_type='fanout', durable=True)
     results = channel.queue_declare(queue='client.' + str(my_pid) + '.Schema', exclusive=False,
                                     durable=True, arguments={'x-message-ttl':600000})
-    channel.queue_bind(exchange=EXCHANGER_NAME, queue=results.method.queue)
+    if keys:
+        channel.exchange_declare(exchange=TOPIC_EXCHANGER_NAME, exchange_type='topic', durable=True)
+        for key in keys:
+            print('Binding to ' + key)
+            channel.queue_bind(exchange=TOPIC_EXCHANGER_NAME, queue=results.method.queue, routing_key=key)
+    else:
+        channel.exchange_declare(exchange=EXCHANGER_NAME, exchange_type='fanout', durable=True)
+        channel.queue_bind(exchange=EXCHANGER_NAME, queue=results.method.queue)
+
+    # Attribute values of graphs, vertexes and transactions, kept up to date
+    # from the deltas included in changes when the backend has delta payloads
+    # enabled (CHANGE_PAYLOADS setting), without fetching the records.
+    attributes = {}
+    # Sequence number of the last change seen of each graph. Gaps are only
+    # looked for when receiving every change of the graphs, not a selection
+    # of models or operations.
+    last_seqs = {}
+    track_seqs = not (args.model or args.operation or args.bind)
+
+    def handle_change(change):
+        seq = change.get('seq')
+        if seq is not None and track_seqs:
+            graph_id = change['graph_id']
+            last_seq = last_seqs.get(graph_id)
+            if last_seq is not None and seq <= last_seq:
+                # Already seen, ie fetched while catching up
+                return
+            if last_seq is not None and seq > last_seq + 1:
+                print('Missed changes %d to %d of graph %d, fetching' % (last_seq + 1, seq - 1, graph_id))
+                missed = fetch_changes(args.api, graph_id, last_seq)
+                if missed is None:
+                    print('  changes no longer available, graph %d needs to be reloaded' % graph_id)
+                else:
+                    for missed_change in missed:
+                        handle_change(missed_change)
+                    if last_seqs[graph_id] >= seq:
+                        return
+            last_seqs[graph_id] = seq
+        print("%r" % json.dumps(change))
+        apply_delta(attributes, change)
 
     # Simple callbacks to echo results of entries popped off of the subscribed
-    # queues
+    # queues. Changes committed together arrive as a single BATCH message
+    # listing each change.
     def callback_results(ch, method, properties, body):
-        print("%r" % body.decode())
+        update = json.loads(body.decode())
+        changes = update['changes'] if update.get('operation') == 'BATCH' else [update]
+        for change in changes:
+            handle_change(change)
 
     print('Waiting for logs. To exit press CTRL+C')
 
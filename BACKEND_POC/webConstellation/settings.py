@@ -112,6 +112,63 @@ CELERY = {
     'CELERY_ACCEPT_CONTENT': ['json'],
 }
 
+# Type of the RabbitMQ exchange updates are published to. 'fanout' publishes
+# every update to every queue on CONSTELLATION.DataUpdates, 'topic' publishes
+# to CONSTELLATION.DataUpdates.Topic with routing keys of the form
+# graph.<id>.<Model>.<operation>, refer to sample_client.py.
+UPDATE_EXCHANGE_TYPE = os.environ.get('UPDATE_EXCHANGE_TYPE', 'fanout')
+
+# Updates are published to RabbitMQ by a background publisher holding a
+# persistent channel, refer to worker/publisher.py. Up to MAX_BUFFERED updates
+# are held while the broker is unavailable, and with CONFIRM each update waits
+# for the broker to confirm it. BROKER_URL defaults to the celery broker.
+UPDATE_PUBLISHER = {
+    'BROKER_URL': None,
+    'MAX_BUFFERED': 100000,
+    'CONFIRM': True,
+}
+
+# Change notifications are queued and sent to subscribers in batches by a
+# background thread, refer to websockets/dispatcher.py. Set ASYNC to False to
+# send them from the thread making the change instead.
+CHANGE_DISPATCHER = {
+    'ASYNC': True,
+    'BATCH_INTERVAL': 0.05,  # Seconds to wait for further changes to batch
+    'MAX_BATCH': 500,
+    'MAX_QUEUED': 100000,
+}
+
+# With DELTA, change notifications include the new state of the changed
+# record (ie an attributes label and value) under 'delta', so subscribers can
+# apply changes without fetching the record. Deltas over MAX_DELTA_BYTES are
+# left out, flagging the notification with 'delta_truncated'.
+CHANGE_PAYLOADS = {
+    'DELTA': False,
+    'MAX_DELTA_BYTES': 4096,
+}
+
+# Graph changes are numbered from a per graph sequence and logged, so that
+# subscribers that missed changes can replay them using graphs/<id>/changes
+# or the websocket replay command, refer to websockets/changelog.py. Changes
+# of EXCLUDE_TYPES are not logged, at most MAX_REPLAY changes are returned per
+# request, and prune_change_log deletes changes older than RETENTION_DAYS.
+CHANGE_LOG = {
+    'ENABLED': True,
+    'EXCLUDE_TYPES': ['ImportJob'],
+    'MAX_REPLAY': 1000,
+    'RETENTION_DAYS': 7,
+}
+
+# Updates are sent to each websocket every COALESCE_WINDOW seconds as a single
+# frame, refer to websockets/delivery.py. Once MAX_QUEUED updates are waiting
+# for a socket, BACKPRESSURE ('drop_oldest', 'drop_newest' or 'disconnect')
+# applies.
+WEBSOCKET_DELIVERY = {
+    'COALESCE_WINDOW': 0.05,
+    'MAX_QUEUED': 1000,
+    'BACKPRESSURE': 'drop_oldest',
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
@@ -123,10 +180,46 @@ DATABASES = {
         'USER': 'docker',         # This needs to match value of MYSQL_USER in docker-compose.yml
         'PASSWORD': 'dockerpassword', # This needs to match value of MYSQL_PASSWORD in docker-compose.yml
         'HOST': 'db',                  # This matches the database service name in docker-compose.yml 
-        'PORT': '3306'
+        'PORT': '3306',
+        'OPTIONS': {
+            'local_infile': 1,         # Allows the 'native' IMPORT_BULK_LOADER to use LOAD DATA LOCAL INFILE
+        }
     }
 }
 
+# Loader used to write the records of imported star files, either 'orm' to
+# create them using bulk_create, or 'native' to spool them to file and ingest
+# the file using the databases bulk load statement (LOAD DATA on MySQL/MariaDB,
+# COPY on PostgreSQL). The native loader falls back to 'orm' on other
+# databases. Use 'python manage.py benchmark_import' to compare them.
+IMPORT_BULK_LOADER = 'orm'
+
+# Whether star file imports are performed in a single transaction, with
+# constraint checks deferred until commit, so that a failed import leaves any
+# graph it was replacing untouched. When False, each batch of records is
+# committed as it is written.
+IMPORT_ATOMIC = True
+
+# Number of worker processes star file imports fan the writing of attributes
+# and transactions out to. Imports using more than one worker are never
+# atomic, and need to be run from a non-daemonic process, so the celery worker
+# must be started with a pool other than prefork (ie --pool=threads) for them
+# to be used by the import endpoint.
+IMPORT_WORKERS = 1
+
+# Cache of serialized graph JSON documents, as returned by the graphs/<id>/json
+# endpoints. Documents are held per process in an LRU limited to MAX_DOCUMENTS
+# documents and MAX_BYTES bytes, against graph versions kept in the database
+# (so changes made by any process, ie imports run by the celery worker, are
+# seen by all). Setting REDIS_URL (ie 'redis://redis:6379/1') also shares the
+# documents between processes, for REDIS_TIMEOUT seconds.
+GRAPH_JSON_CACHE = {
+    'MAX_DOCUMENTS': 16,
+    'MAX_BYTES': 256 * 1024 * 1024,
+    'REDIS_URL': None,
+    'REDIS_TIMEOUT': 60 * 60,
+}
+
 
 
 # Password validation
@@ -149,6 +242,15 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 # settings to support swagger API endpoint at base of application URL
+# List endpoints are paginated using keyset pagination on the primary key,
+# refer to app/pagination.py, and can be filtered by the fields listed in each
+# views filter_fields, refer to app/filters.py.
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'app.pagination.IdCursorPagination',
+    'DEFAULT_FILTER_BACKENDS': ['app.filters.FieldFilterBackend'],
+    'PAGE_SIZE': 100,
+}
+
 SWAGGER_SETTINGS = {
    'USE_SESSION_AUTH': False
 }
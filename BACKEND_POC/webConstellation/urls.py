@@ -89,6 +89,8 @@ urlpatterns = [
          name='graph_attributes'),
     path('graph_attributes/<int:pk>', views.GraphAttributeView.as_view(),
          name='graph_attribute'),
+    path('graphs/<int:pk>/changes', views.GraphChanges,
+         name='graph_changes'),
     # </editor-fold>
 
     # <editor-fold Graph JSON creation URLs">
@@ -98,6 +100,14 @@ urlpatterns = [
          name='JSON_graph_vertexes'),
     path('graphs/<int:pk>/json/transactions', views.GraphJsonTransactions.as_view(),
          name='JSON_graph_transactions'),
+    path('graphs/<int:pk>/json/stream', views.GraphJsonStream.as_view(),
+         name='JSON_graph_stream'),
+    path('graphs/<int:pk>/json/vertexes/stream', views.GraphJsonVertexesStream.as_view(),
+         name='JSON_graph_vertexes_stream'),
+    path('graphs/<int:pk>/json/transactions/stream', views.GraphJsonTransactionsStream.as_view(),
+         name='JSON_graph_transactions_stream'),
+    path('graphs/<int:pk>/npz', views.GraphNpz.as_view(),
+         name='NPZ_graph'),
     # </editor-fold>
 
     # <editor-fold Vertex and VertexAttrib URLs">
@@ -132,14 +142,23 @@ urlpatterns = [
          name='edit_vertex_attrib'),
     path('edit_transaction_attrib/', views.EditTransactionAttribute,
          name='edit_transaction_attrib'),
+    # Batch edit of many graph/vertex/transaction attributes of a graph in
+    # one request
+    path('edit_attribs/', views.EditAttributes,
+         name='edit_attribs'),
     # </editor-fold>
 
 
     # <editor-fold Test Code - Generate Data from Existing Graph JSON file, Performance checking">
-    # Import legacy graph file JSON into the database. This requires the
-    # contents of the .star file to be renamed .zip, then the enclosed file
-    # copied out onto the file system and used as an input to the endpoint.
+    # Import legacy graph file JSON into the database. The .star file needs
+    # to be copied into the import directory and its name used as an input to
+    # the endpoint. The import runs in the background, with its progress
+    # tracked by an ImportJob.
     path('import/', views.ImportLegacyJSON, name='import_json'),
+    path('import_jobs/', views.ImportJobsView.as_view(),
+         name='import_jobs'),
+    path('import_jobs/<int:pk>', views.ImportJobView.as_view(),
+         name='import_job'),
 
     # Added endpoint for developmental performance tuning
     url(r'^silk/', include('silk.urls', namespace='silk')),
@@ -0,0 +1,155 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from app.models import ChangeLogEntry, ChangeLogSequence
+
+
+logger = logging.getLogger(__name__)
+
+
+# <editor-fold Constants">
+# Default change log settings, overridden by the CHANGE_LOG setting.
+#  - ENABLED: False to neither number nor log changes.
+#  - EXCLUDE_TYPES: Types of change that are not numbered or logged, as they
+#    do not change the graph (ie import progress).
+#  - MAX_REPLAY: Maximum number of changes returned by one replay request.
+#  - RETENTION_DAYS: Days changes are kept for by prune_change_log.
+DEFAULT_CHANGE_LOG_SETTINGS = {
+    'ENABLED': True,
+    'EXCLUDE_TYPES': ['ImportJob'],
+    'MAX_REPLAY': 1000,
+    'RETENTION_DAYS': 7,
+}
+# </editor-fold>
+
+
+def change_log_settings():
+    """
+    :return: Dictionary of change log settings.
+    """
+    return dict(DEFAULT_CHANGE_LOG_SETTINGS, **getattr(settings, 'CHANGE_LOG', {}))
+
+
+def record_changes(payloads, using=DEFAULT_DB_ALIAS):
+    """
+    Number committed graph changes from their graphs change sequence, adding
+    the number to each payload as 'seq', and append them to the change log.
+    Sequence numbers are allocated and the changes logged in one transaction
+    that locks the graphs sequence, so a graphs changes are logged in the
+    order they are numbered. If logging fails the changes are left
+    unnumbered, and are still sent.
+    :param payloads: List of committed change payloads, updated in place.
+    :param using: Alias of the database the changes were made in.
+    """
+    options = change_log_settings()
+    if not options['ENABLED']:
+        return
+    graph_changes = OrderedDict()
+    for payload in payloads:
+        if payload.get('graph_id') is not None and payload.get('type') not in options['EXCLUDE_TYPES']:
+            graph_changes.setdefault(payload['graph_id'], []).append(payload)
+    if not graph_changes:
+        return
+    try:
+        with transaction.atomic(using=using):
+            entries = []
+            # Sequences are locked in graph ID order, so that concurrent
+            # commits changing the same graphs cannot deadlock
+            for graph_id in sorted(graph_changes):
+                changes = graph_changes[graph_id]
+                first_seq = _allocate_seqs(graph_id, len(changes), using)
+                for offset, payload in enumerate(changes):
+                    payload['seq'] = first_seq + offset
+                    entries.append(ChangeLogEntry(graph_id=graph_id, seq=payload['seq'], payload=payload))
+            ChangeLogEntry.objects.using(using).bulk_create(entries)
+    except DatabaseError:
+        logger.exception('Failed to log ' + str(len(payloads)) + ' changes')
+        for payload in payloads:
+            payload.pop('seq', None)
+
+
+def _allocate_seqs(graph_id, count, using):
+    """
+    Allocate consecutive sequence numbers to changes of a graph, locking its
+    sequence until the current transaction ends.
+    :return: The first sequence number allocated.
+    """
+    sequences = ChangeLogSequence.objects.using(using)
+    if not sequences.filter(graph_id=graph_id).update(last_seq=F('last_seq') + count):
+        try:
+            with transaction.atomic(using=using):
+                sequences.create(graph_id=graph_id, last_seq=count)
+            return 1
+        except IntegrityError:
+            # Created by a concurrent commit
+            sequences.filter(graph_id=graph_id).update(last_seq=F('last_seq') + count)
+    return sequences.get(graph_id=graph_id).last_seq - count + 1
+
+
+def changes_since(graph_id, since, limit=None, using=DEFAULT_DB_ALIAS):
+    """
+    Return the logged changes of a graph following the change numbered
+    since, allowing a subscriber that missed changes to catch up rather than
+    reload the graph:
+        {"graph_id": 12, "since": 40, "seq": 45, "more": false, "reload": false, "changes": [ {..} ]}
+    seq is the graphs latest sequence number. If more is true only the first
+    limit changes are returned, and the remainder can be requested using the
+    seq of the last change returned. If reload is true the missed changes are
+    no longer logged (or since is ahead of the graphs sequence) and the graph
+    needs to be reloaded instead.
+    :param graph_id: ID of the graph, which may since have been deleted.
+    :param since: Sequence number of the last change seen, 0 for all changes.
+    :param limit: Maximum number of changes to return, capped at the
+                  MAX_REPLAY setting.
+    :param using: Alias of the database to read from.
+    :return: Dictionary as above.
+    """
+    max_replay = change_log_settings()['MAX_REPLAY']
+    limit = max_replay if limit is None else min(limit, max_replay)
+    last_seq = ChangeLogSequence.objects.using(using).filter(graph_id=graph_id).values_list(
+        'last_seq', flat=True).first() or 0
+    entries = list(ChangeLogEntry.objects.using(using).filter(graph_id=graph_id, seq__gt=since).order_by(
+        'seq').values_list('seq', 'payload')[:limit])
+    reload = since > last_seq or (since < last_seq and (not entries or entries[0][0] != since + 1))
+    return {'graph_id': graph_id, 'since': since, 'seq': last_seq,
+            'more': not reload and bool(entries) and entries[-1][0] < last_seq, 'reload': reload,
+            'changes': [] if reload else [payload for seq, payload in entries]}
+
+
+def prune_change_log(days=None, using=DEFAULT_DB_ALIAS):
+    """
+    Delete logged changes older than the supplied number of days. Graph
+    sequences are kept, so subscribers asking for pruned changes are told to
+    reload.
+    :param days: Age in days of the changes to delete, defaults to the
+                 RETENTION_DAYS setting.
+    :param using: Alias of the database to delete from.
+    :return: Number of changes deleted.
+    """
+    if days is None:
+        days = change_log_settings()['RETENTION_DAYS']
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, counts = ChangeLogEntry.objects.using(using).filter(created__lt=cutoff).delete()
+    return deleted
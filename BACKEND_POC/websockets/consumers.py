@@ -16,32 +16,79 @@
  *
 """
 
+import asyncio
 import json
-from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
 from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete
 from app import models
-from worker import tasks
+from app.batch_edit import attributes_edited
+from app.graph_cache import graph_json_cache
+from websockets.changelog import changes_since
+from websockets.deltas import add_delta, schema_delta, graph_delta, attribute_def_delta, attribute_delta
+from websockets.deltas import attribute_label_delta, vertex_delta, transaction_delta, attribute_edit_delta
+from websockets.delivery import SendQueue, delivery_settings
+from websockets.dispatcher import ChangeDispatcher, graph_group_name, schema_group_name
+from websockets.outbox import ChangeOutbox, POST, UPDATE, DELETE, batch_message, message_changes
+from websockets.suppression import suppressible
 
 # Group name used to capture list of updates and used by django_channels
 NOTIFICATION_GROUP_NAME = 'CONSTELLATION.DataUpdates'
 NOTIFICATION_TYPE = 'data_update'
-# Type of changes that can occur to objects
-POST = 'POST'
-UPDATE = 'UPDATE'
-DELETE = 'DELETE'
+# Commands sent by sockets to change the updates they receive
+SUBSCRIBE = 'subscribe'
+UNSUBSCRIBE = 'unsubscribe'
+REPLAY = 'replay'
+# Close code of sockets disconnected because their send queue overflowed
+SEND_QUEUE_FULL = 4008
+# Type of the single change sent for a batch of attribute edits
+ATTRIBUTE_EDIT_TYPE = 'AttributeEdit'
+
+# Dispatcher sending changes to subscribers from a background thread, so the
+# receivers below return without waiting on the channel layer or RabbitMQ
+change_dispatcher = ChangeDispatcher(NOTIFICATION_GROUP_NAME, NOTIFICATION_TYPE)
+# Outbox holding changes back until their transaction commits
+change_outbox = ChangeOutbox(change_dispatcher)
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     """
     Consumer of web sockets related to notification of data record updates.
+    Sockets receive the updates of all records until they subscribe to
+    specific graphs, schemas and/or model types by sending:
+        {"command": "subscribe", "graphs": [1, 2], "schemas": [3], "types": ["Vertex"]}
+    after which they only receive updates to the subscribed graphs and
+    schemas (joining their channel layer groups, so updates to other graphs
+    are never sent to the socket), further filtered to the subscribed types
+    if any are given. "unsubscribe" removes graphs, schemas and types from
+    the subscription, the socket receiving all updates again once none
+    remain. Each command is answered with the resulting subscription:
+        {"subscription": {"graphs": [1, 2], "schemas": [3], "types": ["Vertex"]}}
+    Graph changes carry their graphs change sequence number as 'seq'. A
+    socket reconnecting after missing changes subscribes to the graph and
+    then sends:
+        {"command": "replay", "graph": 1, "since": 40}
+    to be answered with the logged changes following seq 40 (refer to
+    websockets/changelog.py:changes_since), under "replay". Changes arriving
+    while replaying may also be replayed, and can be told apart by seq.
+    Updates are not sent as they arrive, but queued (refer to
+    websockets/delivery.py) and sent every COALESCE_WINDOW seconds as a single
+    frame, superseded updates to the same record being merged. A socket that
+    cannot keep up has the WEBSOCKET_DELIVERY BACKPRESSURE policy applied.
     """
     async def connect(self):
         """
         Handle connection of web socket.
         """
+        self.graph_ids = set()
+        self.schema_ids = set()
+        self.types = set()
+        self.groups = {NOTIFICATION_GROUP_NAME}
+        options = delivery_settings()
+        self.coalesce_window = options['COALESCE_WINDOW']
+        self.send_queue = SendQueue(options['MAX_QUEUED'], options['BACKPRESSURE'])
+        self.delivery = asyncio.ensure_future(self.deliver())
         await self.channel_layer.group_add(
             NOTIFICATION_GROUP_NAME,
             self.channel_name
@@ -52,16 +99,26 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         """
         Handle disconnection of web socket.
         """
-        await self.channel_layer.group_discard(
-            NOTIFICATION_GROUP_NAME,
-            self.channel_name
-        )
+        self.delivery.cancel()
+        self.send_queue.close()
+        for group_name in self.groups:
+            await self.channel_layer.group_discard(
+                group_name,
+                self.channel_name
+            )
 
     async def receive(self, text_data):
         """
-        Process changes to be published to web socket subscribers.
+        Process subscription commands and changes to be published to web
+        socket subscribers.
         """
         text_data_json = json.loads(text_data)
+        if text_data_json.get('command') in (SUBSCRIBE, UNSUBSCRIBE):
+            await self.update_subscription(text_data_json)
+            return
+        if text_data_json.get('command') == REPLAY:
+            await self.replay(text_data_json)
+            return
         message = text_data_json['message']
 
         # Send message to room group
@@ -73,20 +130,97 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             }
         )
 
+    async def update_subscription(self, command):
+        """
+        Apply a subscribe or unsubscribe command, joining the channel layer
+        groups of the subscribed graphs and schemas, or the group of all
+        updates if there are none, and leaving any other groups.
+        :param command: Dictionary of the command and lists of graph IDs,
+                        schema IDs and types.
+        """
+        try:
+            graph_ids = set(int(graph_id) for graph_id in command.get('graphs', []))
+            schema_ids = set(int(schema_id) for schema_id in command.get('schemas', []))
+            types = set(str(model_type) for model_type in command.get('types', []))
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({'error': 'graphs and schemas must be lists of IDs'}))
+            return
+        if command['command'] == SUBSCRIBE:
+            self.graph_ids |= graph_ids
+            self.schema_ids |= schema_ids
+            self.types |= types
+        else:
+            self.graph_ids -= graph_ids
+            self.schema_ids -= schema_ids
+            self.types -= types
+
+        groups = set(graph_group_name(graph_id) for graph_id in self.graph_ids)
+        groups |= set(schema_group_name(schema_id) for schema_id in self.schema_ids)
+        if not groups:
+            groups = {NOTIFICATION_GROUP_NAME}
+        for group_name in groups - self.groups:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        for group_name in self.groups - groups:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+        self.groups = groups
+
+        await self.send(text_data=json.dumps({'subscription': {
+            'graphs': sorted(self.graph_ids), 'schemas': sorted(self.schema_ids), 'types': sorted(self.types)}}))
+
+    async def replay(self, command):
+        """
+        Answer a replay command with the logged changes of a graph following
+        the supplied sequence number.
+        :param command: Dictionary of the command, graph ID, sequence number
+                        and optional limit.
+        """
+        try:
+            graph_id = int(command['graph'])
+            since = int(command.get('since', 0))
+            limit = int(command['limit']) if command.get('limit') is not None else None
+        except (KeyError, TypeError, ValueError):
+            await self.send(text_data=json.dumps({'error': 'replay requires a graph ID and since sequence number'}))
+            return
+        replay = await database_sync_to_async(changes_since)(graph_id, since, limit)
+        await self.send(text_data=json.dumps({'replay': replay}))
+
     async def data_update(self, event):
         """
-        Handler of updates of type = NOTIFICATION_TYPE
+        Handler of updates of type = NOTIFICATION_TYPE, queueing them to be
+        sent by deliver.
+        """
+        changes = message_changes(json.loads(event['message']))
+        if self.types:
+            changes = [change for change in changes if change.get('type') in self.types]
+        if not self.send_queue.put(changes):
+            # The client is not keeping up, it will reload once reconnected
+            self.send_queue.close()
+            await self.close(code=SEND_QUEUE_FULL)
+
+    async def deliver(self):
         """
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({'message': event['message']}))
+        Send queued updates to the socket, those arriving within
+        coalesce_window seconds of each other being sent as one frame.
+        """
+        while True:
+            changes = await self.send_queue.take(self.coalesce_window)
+            if not changes:
+                continue
+            # Send message to WebSocket
+            await self.send(text_data=json.dumps({'message': json.dumps(batch_message(changes))}))
+            self.send_queue.metrics.frames = self.send_queue.metrics.frames + 1
+            self.send_queue.metrics.sent = self.send_queue.metrics.sent + len(changes)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Receivers set up to capture changes to models. These receivers trigger updates to subscribed receivers, either via
-# websockets, or using RabbitMQ for non-web applications.
+# websockets, or using RabbitMQ for non-web applications. Updates are held in the change outbox until their transaction
+# commits (refer to websockets/outbox.py), then queued with the change dispatcher, which sends them in batches from a
+# background thread (refer to websockets/dispatcher.py).
 # ---------------------------------------------------------------------------------------------------------------------
 
 @receiver(post_save, sender=models.Schema)
+@suppressible
 def schema_saved(sender, **kwargs):
     """
     Hook into save event of a Schema, resulting in payload being constructed
@@ -95,15 +229,14 @@ def schema_saved(sender, **kwargs):
     schema = kwargs['instance']
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': schema.__class__.__name__, 'schema_id': schema.id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(schema.__class__.__name__, payload)
+    # Schema labels appear in graph JSON
+    graph_json_cache.invalidate_all()
+    add_delta(payload, lambda: schema_delta(schema))
+    change_outbox.add(schema.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.Schema)
+@suppressible
 def schema_deleted(sender, **kwargs):
     """
     Hook into delete event of a Schema, resulting in payload being constructed
@@ -111,15 +244,11 @@ def schema_deleted(sender, **kwargs):
     """
     schema = kwargs['instance']
     payload = {'type': schema.__class__.__name__, 'schema_id': schema.id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(schema.__class__.__name__, payload)
+    change_outbox.add(schema.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.SchemaAttribDefGraph)
+@suppressible
 def schema_attribute_def_graph_saved(sender, **kwargs):
     """
     Hook into save event of a SchemaAttribDefGraph, resulting in payload being
@@ -130,15 +259,12 @@ def schema_attribute_def_graph_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute_def.__class__.__name__, 'schema_id': schema.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    add_delta(payload, lambda: attribute_def_delta(attribute_def))
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.SchemaAttribDefGraph)
+@suppressible
 def schema_attribute_def_graph_deleted(sender, **kwargs):
     """
     Hook into delete event of a SchemaAttribDefGraph, resulting in payload being
@@ -148,15 +274,11 @@ def schema_attribute_def_graph_deleted(sender, **kwargs):
     schema = attribute_def.schema_fk
     payload = {'type': attribute_def.__class__.__name__, 'schema_id': schema.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.SchemaAttribDefVertex)
+@suppressible
 def schema_attribute_def_vertex_saved(sender, **kwargs):
     """
     Hook into save event of a SchemaAttribDefVertex, resulting in payload being
@@ -167,15 +289,12 @@ def schema_attribute_def_vertex_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute_def.__class__.__name__, 'schema_id': schema.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    add_delta(payload, lambda: attribute_def_delta(attribute_def))
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.SchemaAttribDefVertex)
+@suppressible
 def schema_attribute_def_vertex_deleted(sender, **kwargs):
     """
     Hook into delete event of a SchemaAttribDefVertex, resulting in payload being
@@ -185,15 +304,11 @@ def schema_attribute_def_vertex_deleted(sender, **kwargs):
     schema = attribute_def.schema_fk
     payload = {'type': attribute_def.__class__.__name__, 'schema_id': schema.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.SchemaAttribDefTrans)
+@suppressible
 def schema_attribute_def_transaction_saved(sender, **kwargs):
     """
     Hook into save event of a SchemaAttribDefTrans, resulting in payload being
@@ -204,15 +319,12 @@ def schema_attribute_def_transaction_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute_def.__class__.__name__, 'schema_id': schema.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    add_delta(payload, lambda: attribute_def_delta(attribute_def))
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.SchemaAttribDefTrans)
+@suppressible
 def schema_attribute_def_transaction_deleted(sender, **kwargs):
     """
     Hook into delete event of a SchemaAttribDefTrans, resulting in payload being
@@ -222,15 +334,11 @@ def schema_attribute_def_transaction_deleted(sender, **kwargs):
     schema = attribute_def.schema_fk
     payload = {'type': attribute_def.__class__.__name__, 'schema_id': schema.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.Graph)
+@suppressible
 def graph_saved(sender, **kwargs):
     """
     Hook into save event of a Graph, resulting in payload being constructed
@@ -239,14 +347,13 @@ def graph_saved(sender, **kwargs):
     graph = kwargs['instance']
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': graph.__class__.__name__, 'graph_id': graph.id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)})
-    tasks.publish_update(graph.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: graph_delta(graph))
+    change_outbox.add(graph.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.Graph)
+@suppressible
 def graph_deleted(sender, **kwargs):
     """
     Hook into save event of a Graph, resulting in payload being constructed
@@ -254,15 +361,12 @@ def graph_deleted(sender, **kwargs):
     """
     graph = kwargs['instance']
     payload = {'type': graph.__class__.__name__, 'graph_id': graph.id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(graph.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    change_outbox.add(graph.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.GraphAttribDefGraph)
+@suppressible
 def graph_attribute_def_graph_saved(sender, **kwargs):
     """
     Hook into save event of a GraphAttribDefGraph, resulting in payload being
@@ -273,15 +377,13 @@ def graph_attribute_def_graph_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute_def.__class__.__name__, 'graph_id': graph.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_def_delta(attribute_def))
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.GraphAttribDefGraph)
+@suppressible
 def graph_attribute_def_graph_deleted(sender, **kwargs):
     """
     Hook into delete event of a GraphAttribDefGraph, resulting in payload being
@@ -291,15 +393,12 @@ def graph_attribute_def_graph_deleted(sender, **kwargs):
     graph = attribute_def.graph_fk
     payload = {'type': attribute_def.__class__.__name__, 'graph_id': graph.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.GraphAttribDefVertex)
+@suppressible
 def graph_attribute_def_vertex_saved(sender, **kwargs):
     """
     Hook into save event of a GraphAttribDefVertex, resulting in payload being
@@ -310,15 +409,13 @@ def graph_attribute_def_vertex_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute_def.__class__.__name__, 'graph_id': graph.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_def_delta(attribute_def))
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.GraphAttribDefVertex)
+@suppressible
 def graph_attribute_def_vertex_deleted(sender, **kwargs):
     """
     Hook into delete event of a GraphAttribDefVertex, resulting in payload being
@@ -328,15 +425,12 @@ def graph_attribute_def_vertex_deleted(sender, **kwargs):
     graph = attribute_def.graph_fk
     payload = {'type': attribute_def.__class__.__name__, 'graph_id': graph.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.GraphAttribDefTrans)
+@suppressible
 def graph_attribute_def_transaction_saved(sender, **kwargs):
     """
     Hook into save event of a GraphAttribDefTrans, resulting in payload being
@@ -347,15 +441,13 @@ def graph_attribute_def_transaction_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute_def.__class__.__name__, 'graph_id': graph.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_def_delta(attribute_def))
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.GraphAttribDefTrans)
+@suppressible
 def graph_attribute_def_transaction_deleted(sender, **kwargs):
     """
     Hook into delete event of a GraphAttribDefTrans, resulting in payload being
@@ -365,15 +457,12 @@ def graph_attribute_def_transaction_deleted(sender, **kwargs):
     graph = attribute_def.graph_fk
     payload = {'type': attribute_def.__class__.__name__, 'graph_id': graph.id,
                'attribute_def_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute_def.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    change_outbox.add(attribute_def.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.GraphAttrib)
+@suppressible
 def graph_attribute_saved(sender, **kwargs):
     """
     Hook into save event of a GraphAttrib, resulting in payload being
@@ -384,15 +473,13 @@ def graph_attribute_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': attribute.__class__.__name__, 'graph_id': graph.id,
                'attribute_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_delta(attribute))
+    change_outbox.add(attribute.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.GraphAttrib)
+@suppressible
 def graph_attribute_deleted(sender, **kwargs):
     """
     Hook into delete event of a GraphAttrib, resulting in payload being
@@ -402,15 +489,13 @@ def graph_attribute_deleted(sender, **kwargs):
     graph = attribute.graph_fk
     payload = {'type': attribute.__class__.__name__, 'graph_id': graph.id,
                'attribute_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_label_delta(attribute))
+    change_outbox.add(attribute.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.Vertex)
+@suppressible
 def vertex_saved(sender, **kwargs):
     """
     Hook into save event of a Vertex, resulting in payload being constructed
@@ -420,15 +505,13 @@ def vertex_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': vertex.__class__.__name__, 'graph_id': vertex.graph_fk.id,
                'vertex_id': vertex.id, 'vx_id': vertex.vx_id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(vertex.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: vertex_delta(vertex))
+    change_outbox.add(vertex.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.Vertex)
+@suppressible
 def vertex_deleted(sender, **kwargs):
     """
     Hook into delete event of a Vertex, resulting in payload being constructed
@@ -437,15 +520,12 @@ def vertex_deleted(sender, **kwargs):
     vertex = kwargs['instance']
     payload = {'type': vertex.__class__.__name__, 'graph_id': vertex.graph_fk.id,
                'vertex_id': vertex.id, 'vx_id': vertex.vx_id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(vertex.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    change_outbox.add(vertex.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.VertexAttrib)
+@suppressible
 def vertex_attribute_saved(sender, **kwargs):
     """
     Hook into save event of a VertexAttrib, resulting in payload being
@@ -457,15 +537,13 @@ def vertex_attribute_saved(sender, **kwargs):
     payload = {'type': attribute.__class__.__name__, 'graph_id': vertex.graph_fk.id,
                'vertex_id': vertex.id, 'vx_id': vertex.vx_id,
                'attribute_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_delta(attribute))
+    change_outbox.add(attribute.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.VertexAttrib)
+@suppressible
 def vertex_attribute_deleted(sender, **kwargs):
     """
     Hook into delete event of a VertexAttrib, resulting in payload being
@@ -476,15 +554,13 @@ def vertex_attribute_deleted(sender, **kwargs):
     payload = {'type': attribute.__class__.__name__, 'graph_id': vertex.graph_fk.id,
                'vertex_id': vertex.id, 'vx_id': vertex.vx_id,
                'attribute_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_label_delta(attribute))
+    change_outbox.add(attribute.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.Transaction)
+@suppressible
 def transaction_saved(sender, **kwargs):
     """
     Hook into save event of a Transaction, resulting in payload being
@@ -494,15 +570,13 @@ def transaction_saved(sender, **kwargs):
     operation = POST if kwargs['created'] else UPDATE
     payload = {'type': transaction.__class__.__name__, 'graph_id': transaction.graph_fk.id,
                'transaction_id': transaction.id, 'tx_id': transaction.tx_id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(transaction.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: transaction_delta(transaction))
+    change_outbox.add(transaction.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.Transaction)
+@suppressible
 def transaction_deleted(sender, **kwargs):
     """
     Hook into delete event of a Transaction, resulting in payload being constructed
@@ -511,15 +585,12 @@ def transaction_deleted(sender, **kwargs):
     transaction = kwargs['instance']
     payload = {'type': transaction.__class__.__name__, 'graph_id': transaction.graph_fk.id,
                'transaction_id': transaction.id, 'tx_id': transaction.tx_id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(transaction.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    change_outbox.add(transaction.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_save, sender=models.TransactionAttrib)
+@suppressible
 def transaction_attribute_saved(sender, **kwargs):
     """
     Hook into save event of a TransactionAttrib, resulting in payload being
@@ -531,15 +602,13 @@ def transaction_attribute_saved(sender, **kwargs):
     payload = {'type': attribute.__class__.__name__, 'graph_id': transaction.graph_fk.id,
                'transaction_id': transaction.id, 'tx_id': transaction.tx_id,
                'attribute_id': kwargs['instance'].id, 'operation': operation}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_delta(attribute))
+    change_outbox.add(attribute.__class__.__name__, payload, kwargs['using'])
 
 
 @receiver(post_delete, sender=models.TransactionAttrib)
+@suppressible
 def transaction_attribute_deleted(sender, **kwargs):
     """
     Hook into delete event of a TransactionAttrib, resulting in payload being
@@ -550,9 +619,54 @@ def transaction_attribute_deleted(sender, **kwargs):
     payload = {'type': attribute.__class__.__name__, 'graph_id': transaction.graph_fk.id,
                'transaction_id': transaction.id, 'tx_id': transaction.tx_id,
                'attribute_id': kwargs['instance'].id, 'operation': DELETE}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(NOTIFICATION_GROUP_NAME, {
-        'type': NOTIFICATION_TYPE,
-        'message': json.dumps(payload)
-    })
-    tasks.publish_update(attribute.__class__.__name__, payload)
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_label_delta(attribute))
+    change_outbox.add(attribute.__class__.__name__, payload, kwargs['using'])
+
+
+@receiver(attributes_edited)
+@suppressible
+def attributes_batch_edited(sender, **kwargs):
+    """
+    Hook into a batch of attribute edits (refer to app/batch_edit.py),
+    resulting in a single payload listing the labels edited and the number of
+    vertexes and transactions edited being constructed and sent to message
+    broker, in place of a payload per attribute.
+    """
+    values = kwargs['values']
+    labels = {}
+    for element_type, element_values in values.items():
+        labels[element_type] = sorted(set(label for record_values in element_values.values()
+                                          for label in record_values))
+    payload = {'type': ATTRIBUTE_EDIT_TYPE, 'graph_id': kwargs['graph_id'], 'operation': UPDATE, 'labels': labels,
+               'vertex_count': len(values.get('vertex', {})),
+               'transaction_count': len(values.get('transaction', {}))}
+    graph_json_cache.graph_changed(payload['graph_id'])
+    add_delta(payload, lambda: attribute_edit_delta(values, kwargs['record_ids']))
+    change_outbox.add(ATTRIBUTE_EDIT_TYPE, payload, kwargs['using'])
+
+
+@receiver(post_save, sender=models.ImportJob)
+@suppressible
+def import_job_saved(sender, **kwargs):
+    """
+    Hook into save event of an ImportJob, resulting in payload capturing the
+    progress of the import being constructed and sent to message broker.
+    """
+    job = kwargs['instance']
+    operation = POST if kwargs['created'] else UPDATE
+    payload = {'type': job.__class__.__name__, 'import_job_id': job.id, 'graph_id': job.graph_fk_id,
+               'status': job.status, 'percent_complete': job.percent_complete, 'operation': operation}
+    change_outbox.add(job.__class__.__name__, payload, kwargs['using'])
+
+
+@receiver(post_save, sender=models.AttribType)
+@receiver(post_delete, sender=models.AttribType)
+@suppressible
+def attrib_type_changed(sender, **kwargs):
+    """
+    Hook into save and delete events of an AttribType. Attribute type labels
+    and raw types appear in every graphs JSON, so all cached graph JSON is
+    invalidated. No update is published.
+    """
+    graph_json_cache.invalidate_all()
@@ -0,0 +1,171 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import asyncio
+import weakref
+from collections import OrderedDict
+from django.conf import settings
+from websockets.outbox import merge_key, merge_operations
+
+
+# <editor-fold Constants">
+# Policies applied when a sockets send queue is full:
+#  - DROP_OLDEST: discard the oldest queued change to make room.
+#  - DROP_NEWEST: discard the incoming change.
+#  - DISCONNECT: close the socket, so the client reconnects and reloads.
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DISCONNECT = 'disconnect'
+
+# Default delivery settings, overridden by the WEBSOCKET_DELIVERY setting.
+#  - COALESCE_WINDOW: Seconds changes are collected for before being sent to
+#    the socket as one frame.
+#  - MAX_QUEUED: Maximum number of changes queued per socket.
+#  - BACKPRESSURE: Policy applied when a sockets queue is full.
+DEFAULT_DELIVERY_SETTINGS = {
+    'COALESCE_WINDOW': 0.05,
+    'MAX_QUEUED': 1000,
+    'BACKPRESSURE': DROP_OLDEST,
+}
+# </editor-fold>
+
+
+def delivery_settings():
+    """
+    :return: Dictionary of delivery settings.
+    """
+    return dict(DEFAULT_DELIVERY_SETTINGS, **getattr(settings, 'WEBSOCKET_DELIVERY', {}))
+
+
+class DeliveryMetrics:
+    """
+    Counters of the changes delivered to the sockets of this process, along
+    with the depth of each sockets send queue.
+    """
+
+    def __init__(self):
+        self.queues = weakref.WeakSet()
+        self.queued = 0
+        self.merged = 0
+        self.dropped = 0
+        self.disconnected = 0
+        self.frames = 0
+        self.sent = 0
+
+    def stats(self):
+        """
+        :return: Dictionary of delivery counters.
+        """
+        depths = [len(send_queue) for send_queue in list(self.queues)]
+        return {'connections': len(depths), 'queue_depth': sum(depths), 'max_queue_depth': max(depths, default=0),
+                'queued': self.queued, 'merged': self.merged, 'dropped': self.dropped,
+                'disconnected': self.disconnected, 'frames': self.frames, 'sent': self.sent}
+
+
+# Metrics of all sockets in the process
+delivery_metrics = DeliveryMetrics()
+
+
+class SendQueue:
+    """
+    Bounded queue of the changes waiting to be sent to a socket. Changes to a
+    record already in the queue are merged with it (refer to
+    merge_operations) and move to the end of the queue, so superseded
+    UPDATEs are never sent and changes leave in seq order. Only changes
+    naming a single record (refer to websockets/outbox.py:record_id) are
+    merged; others, such as the AttributeEdit of a batch of edits, are
+    queued as they arrive. Must be used from the event loop of the socket.
+    """
+
+    def __init__(self, max_queued, backpressure, metrics=delivery_metrics):
+        """
+        :param max_queued: Maximum number of changes held.
+        :param backpressure: Policy applied when the queue is full.
+        :param metrics: DeliveryMetrics to count changes against.
+        """
+        self.max_queued = max_queued
+        self.backpressure = backpressure
+        self.metrics = metrics
+        # Changes keyed by merge_key, in the order last queued
+        self.changes = OrderedDict()
+        self.ready = asyncio.Event()
+        self.closed = False
+        metrics.queues.add(self)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def put(self, changes):
+        """
+        Queue changes to be sent.
+        :param changes: List of change payloads.
+        :return: False if the queue overflowed and the DISCONNECT policy
+                 applies, otherwise True.
+        """
+        if self.closed:
+            return True
+        for change in changes:
+            key = merge_key(change.get('type'), change)
+            previous = self.changes.get(key)
+            if previous is not None:
+                self.metrics.merged = self.metrics.merged + 1
+                operation = merge_operations(previous.get('operation'), change.get('operation'))
+                if operation is None:
+                    del self.changes[key]
+                else:
+                    # Takes the seq of the newer change, so moves to its place to keep frames in seq order
+                    self.changes[key] = dict(change, operation=operation)
+                    self.changes.move_to_end(key)
+                continue
+            if len(self.changes) >= self.max_queued:
+                self.metrics.dropped = self.metrics.dropped + 1
+                if self.backpressure == DISCONNECT:
+                    self.metrics.disconnected = self.metrics.disconnected + 1
+                    return False
+                if self.backpressure == DROP_NEWEST:
+                    continue
+                self.changes.popitem(last=False)
+            self.changes[key] = change
+            self.metrics.queued = self.metrics.queued + 1
+        if self.changes:
+            self.ready.set()
+        return True
+
+    async def take(self, window):
+        """
+        Wait for changes to be queued, then collect changes for the supplied
+        window before removing and returning them all.
+        :param window: Seconds to collect changes for.
+        :return: List of change payloads.
+        """
+        await self.ready.wait()
+        if window > 0:
+            await asyncio.sleep(window)
+        changes = list(self.changes.values())
+        self.changes.clear()
+        self.ready.clear()
+        return changes
+
+    def close(self):
+        """
+        Discard queued changes and ignore further changes, once the socket
+        is closing.
+        """
+        self.closed = True
+        self.changes.clear()
+        self.metrics.queues.discard(self)
@@ -0,0 +1,151 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from app.models import attrib_str_to_value
+
+
+# <editor-fold Constants">
+# Default change payload settings, overridden by the CHANGE_PAYLOADS setting.
+#  - DELTA: True to include the new state of changed records in change
+#    payloads, under 'delta', so subscribers can apply changes without
+#    fetching the record.
+#  - MAX_DELTA_BYTES: Maximum size of a delta, as JSON. Larger deltas are
+#    left out and the payload flagged with 'delta_truncated', subscribers
+#    fetching the record as usual.
+DEFAULT_PAYLOAD_SETTINGS = {
+    'DELTA': False,
+    'MAX_DELTA_BYTES': 4096,
+}
+# </editor-fold>
+
+
+def payload_settings():
+    """
+    :return: Dictionary of change payload settings.
+    """
+    return dict(DEFAULT_PAYLOAD_SETTINGS, **getattr(settings, 'CHANGE_PAYLOADS', {}))
+
+
+def add_delta(payload, build):
+    """
+    Add the delta of a change to its payload, if delta payloads are enabled.
+    :param payload: Change payload, updated in place.
+    :param build: Function returning the delta, only called if delta
+                  payloads are enabled. It may return None if there is no
+                  delta.
+    :return: The payload.
+    """
+    options = payload_settings()
+    if not options['DELTA']:
+        return payload
+    delta = build()
+    if delta is None:
+        return payload
+    if len(json.dumps(delta)) > options['MAX_DELTA_BYTES']:
+        payload['delta_truncated'] = True
+    else:
+        payload['delta'] = delta
+    return payload
+
+
+def schema_delta(schema):
+    """
+    :return: Delta of a saved Schema.
+    """
+    return {'label': schema.label}
+
+
+def graph_delta(graph):
+    """
+    :return: Delta of a saved Graph.
+    """
+    return {'title': graph.title, 'schema_id': graph.schema_fk_id}
+
+
+def attribute_def_delta(attribute_def):
+    """
+    :return: Delta of a saved schema or graph attribute definition.
+    """
+    raw_type = attribute_def.type_fk.raw_type
+    return {'label': attribute_def.label, 'type': attribute_def.type_fk.label, 'descr': attribute_def.descr,
+            'default': attrib_str_to_value(raw_type, attribute_def.default_str)}
+
+
+def attribute_delta(attribute):
+    """
+    :return: Delta of a saved GraphAttrib, VertexAttrib or TransactionAttrib,
+             being its label and new value.
+    """
+    attribute_def = attribute.attrib_fk
+    return {'label': attribute_def.label, 'value': attrib_str_to_value(attribute_def.type_fk.raw_type,
+                                                                       attribute.value_str)}
+
+
+def attribute_label_delta(attribute):
+    """
+    :return: Delta of a deleted GraphAttrib, VertexAttrib or TransactionAttrib,
+             being its label, or None if its definition is already deleted.
+    """
+    try:
+        return {'label': attribute.attrib_fk.label}
+    except ObjectDoesNotExist:
+        return None
+
+
+def vertex_delta(vertex):
+    """
+    :return: Delta of a saved Vertex, being its attribute_json.
+    """
+    return {'attribute_json': vertex.attribute_json}
+
+
+def transaction_delta(transaction):
+    """
+    :return: Delta of a saved Transaction, being its source and destination
+             vertex IDs, direction and attribute_json.
+    """
+    return {'vertex_src_id': transaction.vx_src_id, 'vertex_dst_id': transaction.vx_dst_id,
+            'tx_dir': transaction.tx_dir, 'attribute_json': transaction.attribute_json}
+
+
+def attribute_edit_delta(values, record_ids):
+    """
+    :param values: New attribute values of a batch edit, refer to
+                   app/batch_edit.py:attributes_edited.
+    :param record_ids: Primary keys of the edited vertexes and transactions.
+    :return: Delta of a batch of attribute edits, being the new values of the
+             graphs attributes and of the attributes of each vertex and
+             transaction, ie:
+                 {"graph": {"title": "x"},
+                  "vertexes": [{"vertex_id": 12, "vx_id": 0, "values": {"x": 1.0}}],
+                  "transactions": [{"transaction_id": 40, "tx_id": 5, "values": {"weight": 2}}]}
+    """
+    delta = {}
+    if 'graph' in values:
+        delta['graph'] = values['graph'][None]
+    if 'vertex' in values:
+        delta['vertexes'] = [{'vertex_id': record_ids['vertex'][vx_id], 'vx_id': vx_id, 'values': vertex_values}
+                             for vx_id, vertex_values in values['vertex'].items()]
+    if 'transaction' in values:
+        delta['transactions'] = [{'transaction_id': record_ids['transaction'][tx_id], 'tx_id': tx_id,
+                                  'values': transaction_values}
+                                 for tx_id, transaction_values in values['transaction'].items()]
+    return delta
@@ -0,0 +1,272 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from websockets.outbox import batch_message, message_changes
+from worker import tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+# <editor-fold Constants">
+# Default dispatcher settings, overridden by the CHANGE_DISPATCHER setting.
+#  - ASYNC: False to send changes inline, from the thread making them.
+#  - BATCH_INTERVAL: Seconds to wait for further changes to batch with the
+#    first change queued.
+#  - MAX_BATCH: Maximum number of changes sent in one batch.
+#  - MAX_QUEUED: Maximum number of changes queued before further changes are
+#    dropped (and logged), protecting the process if the brokers are down.
+DEFAULT_DISPATCHER_SETTINGS = {
+    'ASYNC': True,
+    'BATCH_INTERVAL': 0.05,
+    'MAX_BATCH': 500,
+    'MAX_QUEUED': 100000,
+}
+
+# Seconds to wait for queued changes to be sent when the process exits.
+EXIT_FLUSH_TIMEOUT = 5.0
+
+# Prefixes of the channel layer groups receiving the changes of a single graph
+# or schema, followed by its ID.
+GRAPH_GROUP_PREFIX = 'CONSTELLATION.Graph.'
+SCHEMA_GROUP_PREFIX = 'CONSTELLATION.Schema.'
+# </editor-fold>
+
+
+def graph_group_name(graph_id):
+    """
+    :return: Name of the channel layer group receiving changes to a graph.
+    """
+    return GRAPH_GROUP_PREFIX + str(graph_id)
+
+
+def schema_group_name(schema_id):
+    """
+    :return: Name of the channel layer group receiving changes to a schema.
+    """
+    return SCHEMA_GROUP_PREFIX + str(schema_id)
+
+
+def change_group_name(change):
+    """
+    :param change: Change payload.
+    :return: Name of the graph or schema group the change is sent to, or None
+             if it belongs to neither.
+    """
+    if change.get('graph_id') is not None:
+        return graph_group_name(change['graph_id'])
+    if change.get('schema_id') is not None:
+        return schema_group_name(change['schema_id'])
+    return None
+
+
+class ChangeDispatcher:
+    """
+    Send change notifications to websocket subscribers (via the channel
+    layer) and to RabbitMQ subscribers, without holding up the thread making
+    the change. Websocket messages are sent to the group of all changes, and
+    the changes of each graph (or schema) in a message are also sent to that
+    graphs group, so subscribers of a graph receive only its changes. Changes are queued and sent by a background thread, which
+    collects changes made within BATCH_INTERVAL of each other into batches,
+    drops duplicate changes within a batch, and sends each batch through a
+    single event loop run and a single broker producer. Changes are sent in
+    the order they were queued.
+    """
+
+    def __init__(self, group_name, message_type):
+        """
+        :param group_name: Channel layer group to send all changes to.
+        :param message_type: Channel layer message type, identifying the
+                             consumer handler of the change.
+        """
+        self.group_name = group_name
+        self.message_type = message_type
+        options = dict(DEFAULT_DISPATCHER_SETTINGS, **getattr(settings, 'CHANGE_DISPATCHER', {}))
+        self.asynchronous = options['ASYNC']
+        self.batch_interval = options['BATCH_INTERVAL']
+        self.max_batch = options['MAX_BATCH']
+        self.queue = queue.Queue(maxsize=options['MAX_QUEUED'])
+        self.lock = threading.Lock()
+        # The thread is started on first use, and restarted in forked
+        # processes (ie celery workers), which do not inherit it
+        self.thread = None
+        self.pid = None
+        # Counters reported by stats()
+        self.dispatched = 0
+        self.sent = 0
+        self.batches = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.failed = 0
+        atexit.register(self.flush, EXIT_FLUSH_TIMEOUT)
+
+    def dispatch(self, model_name, payload):
+        """
+        Queue a change to be sent to subscribers, returning immediately.
+        :param model_name: Name of the changed model, used as the routing key
+                           of the RabbitMQ message.
+        :param payload: Dictionary describing the change.
+        """
+        self.dispatched = self.dispatched + 1
+        if not self.asynchronous:
+            self._send([(model_name, payload)])
+            return
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait((model_name, payload))
+        except queue.Full:
+            self.dropped = self.dropped + 1
+            logger.warning('Change dispatcher queue is full, dropping ' + model_name + ' change ' + str(payload))
+
+    def flush(self, timeout=None):
+        """
+        Wait for queued changes to be sent.
+        :param timeout: Maximum number of seconds to wait, or None to wait
+                        until all changes are sent.
+        :return: True if all queued changes were sent.
+        """
+        if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+            return self.queue.unfinished_tasks == 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        """
+        :return: Dictionary of dispatcher counters.
+        """
+        return {'dispatched': self.dispatched, 'sent': self.sent, 'batches': self.batches,
+                'duplicates': self.duplicates, 'dropped': self.dropped, 'failed': self.failed,
+                'queued': self.queue.qsize()}
+
+    def _ensure_thread(self):
+        """
+        Start the sending thread if it is not running in this process.
+        """
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # Forked from a process with its own queue and thread
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='ChangeDispatcher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        """
+        Sending thread, sending queued changes in batches. The thread runs
+        its own event loop rather than using async_to_sync, whose executor
+        is shut down before atexit handlers run, so changes queued as the
+        process exits can still be flushed.
+        """
+        loop = asyncio.new_event_loop()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch, loop)
+            except Exception:
+                self.failed = self.failed + len(batch)
+                logger.exception('Change dispatcher failed to send ' + str(len(batch)) + ' changes')
+            finally:
+                for change in batch:
+                    self.queue.task_done()
+
+    def _send(self, changes, loop=None):
+        """
+        Send a batch of changes to websocket and RabbitMQ subscribers,
+        dropping duplicate changes.
+        :param changes: List of (model_name, payload) tuples.
+        :param loop: Event loop to send channel layer messages through, or
+                     None to use async_to_sync.
+        """
+        messages = []
+        seen = set()
+        for model_name, payload in changes:
+            message = json.dumps(payload)
+            if (model_name, message) in seen:
+                self.duplicates = self.duplicates + 1
+                continue
+            seen.add((model_name, message))
+            messages.append((model_name, payload, message))
+        group_messages = self._group_messages(messages)
+        if loop is None:
+            async_to_sync(self._group_send)(group_messages)
+        else:
+            loop.run_until_complete(self._group_send(group_messages))
+        tasks.publish_updates([(model_name, payload) for model_name, payload, message in messages])
+        self.sent = self.sent + len(messages)
+        self.batches = self.batches + 1
+
+    def _group_messages(self, messages):
+        """
+        Route messages to channel layer groups.
+        :param messages: List of (model_name, payload, JSON message) tuples.
+        :return: List of (group name, JSON message) tuples.
+        """
+        group_messages = []
+        for model_name, payload, message in messages:
+            group_messages.append((self.group_name, message))
+            group_changes = OrderedDict()
+            for change in message_changes(payload):
+                group_name = change_group_name(change)
+                if group_name is not None:
+                    group_changes.setdefault(group_name, []).append(change)
+            for group_name, changes in group_changes.items():
+                group_messages.append((group_name, json.dumps(batch_message(changes))))
+        return group_messages
+
+    async def _group_send(self, group_messages):
+        """
+        Send messages to channel layer groups.
+        :param group_messages: List of (group name, JSON message) tuples.
+        """
+        channel_layer = get_channel_layer()
+        for group_name, message in group_messages:
+            await channel_layer.group_send(group_name, {
+                'type': self.message_type,
+                'message': message
+            })
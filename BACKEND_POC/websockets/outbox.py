@@ -0,0 +1,215 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import threading
+from collections import OrderedDict
+from django.db import DEFAULT_DB_ALIAS, transaction
+from websockets.changelog import record_changes
+
+
+# <editor-fold Constants">
+# Type of changes that can occur to objects
+POST = 'POST'
+UPDATE = 'UPDATE'
+DELETE = 'DELETE'
+
+# Type and operation of the message sent for a commit containing several
+# changes, which lists each change (in its usual format) under 'changes'.
+BATCH_TYPE = 'Batch'
+BATCH = 'BATCH'
+
+# Payload keys identifying the changed record, most specific first. Changes
+# to the same record are merged within a commit (and in socket send queues,
+# refer to websockets/delivery.py).
+RECORD_ID_KEYS = ('attribute_id', 'attribute_def_id', 'vertex_id', 'transaction_id', 'import_job_id')
+
+# Keys identifying the changed record of the types of change whose record is
+# a graph or schema. Other changes carry graph_id or schema_id to identify
+# their parent, so changes not identifying a single record (ie the
+# AttributeEdit of a batch of edits) are never merged.
+OWN_RECORD_ID_KEYS = {'Graph': 'graph_id', 'Schema': 'schema_id'}
+# </editor-fold>
+
+
+class _CommitBatch:
+    """
+    Changes recorded within a transaction (or savepoint), sent once it
+    commits.
+    """
+
+    def __init__(self, outbox, key, connection):
+        self.outbox = outbox
+        self.key = key
+        # Changes keyed by merge_key, in the order first recorded
+        self.changes = OrderedDict()
+        # The commit hook, registered once, and its position in the
+        # connections list of hooks. The hook is discarded by Django if the
+        # transaction (or savepoint) rolls back, see is_pending.
+        self.callback = self.send
+        transaction.on_commit(self.callback, using=connection.alias)
+        self.connection = connection
+        self.index = len(connection.run_on_commit) - 1
+
+    def is_pending(self):
+        """
+        :return: True if the batches commit hook is still registered, ie the
+                 transaction it was created in has not been rolled back.
+        """
+        run_on_commit = self.connection.run_on_commit
+        return len(run_on_commit) > self.index and run_on_commit[self.index][1] is self.callback
+
+    def send(self):
+        self.outbox.batches.pop(self.key, None)
+        self.outbox.send(list(self.changes.values()), self.connection.alias)
+
+
+class ChangeOutbox:
+    """
+    Collect the changes made within a database transaction and hand them to
+    the change dispatcher once the transaction commits, so subscribers are
+    never told of changes that are rolled back. Changes to the same record
+    are merged, and a commit containing several changes is sent as one BATCH
+    message listing them, rather than as a message per row:
+        {"type": "Batch", "operation": "BATCH", "changes": [ { .. change .. } ]}
+    A commit containing a single change is sent in the usual format. Changes
+    made outside a transaction (autocommit) are sent straight away. Graph
+    changes are numbered and logged before being sent (refer to
+    websockets/changelog.py).
+    """
+
+    def __init__(self, dispatcher):
+        """
+        :param dispatcher: ChangeDispatcher sending changes to subscribers.
+        """
+        self.dispatcher = dispatcher
+        self.local = threading.local()
+
+    @property
+    def batches(self):
+        """
+        Batches of the current thread, keyed by (database alias, savepoint
+        IDs).
+        """
+        if not hasattr(self.local, 'batches'):
+            self.local.batches = {}
+        return self.local.batches
+
+    def add(self, model_name, payload, using=DEFAULT_DB_ALIAS):
+        """
+        Record a change, to be sent when the current transaction commits.
+        :param model_name: Name of the changed model.
+        :param payload: Dictionary describing the change.
+        :param using: Alias of the database the change was made in.
+        """
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            self.send([(model_name, payload)], using)
+            return
+        # Blocks entered with savepoint=False record a savepoint ID of None
+        key = (using, tuple(sid for sid in connection.savepoint_ids if sid is not None))
+        batch = self.batches.get(key)
+        if batch is None or not batch.is_pending():
+            batch = _CommitBatch(self, key, connection)
+            self.batches[key] = batch
+        change_key = merge_key(model_name, payload)
+        previous = batch.changes.get(change_key)
+        if previous is None:
+            batch.changes[change_key] = (model_name, payload)
+            return
+        operation = merge_operations(previous[1].get('operation'), payload.get('operation'))
+        if operation is None:
+            # Created and deleted within the transaction, so never seen
+            del batch.changes[change_key]
+            return
+        batch.changes[change_key] = (model_name, dict(payload, operation=operation))
+
+    def send(self, changes, using=DEFAULT_DB_ALIAS):
+        """
+        Number and log committed changes, then send them to subscribers.
+        :param changes: List of (model_name, payload) tuples.
+        :param using: Alias of the database the changes were made in.
+        """
+        if not changes:
+            return
+        record_changes([payload for model_name, payload in changes], using)
+        if len(changes) == 1:
+            self.dispatcher.dispatch(*changes[0])
+            return
+        self.dispatcher.dispatch(BATCH_TYPE, batch_message([payload for model_name, payload in changes]))
+
+
+def batch_message(changes):
+    """
+    :param changes: List of change payloads.
+    :return: The change if there is only one, otherwise a BATCH message
+             listing the changes.
+    """
+    if len(changes) == 1:
+        return changes[0]
+    return {'type': BATCH_TYPE, 'operation': BATCH, 'changes': changes}
+
+
+def message_changes(message):
+    """
+    :param message: Change message, a single change or a BATCH message.
+    :return: List of the change payloads in the message.
+    """
+    if message.get('operation') == BATCH:
+        return message['changes']
+    return [message]
+
+
+def record_id(payload):
+    """
+    :return: ID of the record a change payload describes, or None if it does
+             not describe a single record.
+    """
+    for key in RECORD_ID_KEYS:
+        if payload.get(key) is not None:
+            return payload[key]
+    own_key = OWN_RECORD_ID_KEYS.get(payload.get('type'))
+    if own_key is not None:
+        return payload.get(own_key)
+    return None
+
+
+def merge_key(change_type, payload):
+    """
+    :param change_type: Type of the change.
+    :param payload: Change payload.
+    :return: Key shared by the changes that merge with the change, being
+             its type and record ID, or a key unique to the change if it does
+             not describe a single record.
+    """
+    change_record_id = record_id(payload)
+    if change_record_id is None:
+        return object()
+    return change_type, change_record_id
+
+
+def merge_operations(first, second):
+    """
+    Merge the operations of two changes to the same record.
+    :return: Operation describing both changes, or None if the record was
+             created and then deleted.
+    """
+    if first == POST:
+        return None if second == DELETE else POST
+    if first == DELETE and second == POST:
+        return UPDATE
+    return second
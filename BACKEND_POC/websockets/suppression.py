@@ -0,0 +1,80 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import contextvars
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+# Receivers suppressed in the current context (thread, or asyncio task)
+_suppressed_receivers = contextvars.ContextVar('suppressed_receivers', default=frozenset())
+
+# Number of calls of each receiver that have been suppressed, keyed by
+# receiver name
+_suppressed_counts = Counter()
+_suppressed_counts_lock = threading.Lock()
+
+
+@contextmanager
+def suppress(*receivers):
+    """
+    Context manager suppressing the supplied receivers for signals sent
+    within it, ie so that deleting a Graph reports the deletion of the Graph
+    but not of each of its Vertexes:
+        with suppress(vertex_deleted, transaction_deleted):
+            graph.delete()
+    Suppression only applies to the current thread or asyncio task, unlike
+    disconnecting and reconnecting receivers, which affects every request in
+    the process while disconnected. Receivers must be decorated with
+    suppressible.
+    :param receivers: Receivers to suppress.
+    """
+    token = _suppressed_receivers.set(_suppressed_receivers.get() | frozenset(receivers))
+    try:
+        yield
+    finally:
+        _suppressed_receivers.reset(token)
+
+
+def suppressible(receiver_function):
+    """
+    Decorator allowing a signal receiver to be suppressed using suppress. It
+    must be applied beneath the receiver decorator, ie:
+        @receiver(post_save, sender=models.Vertex)
+        @suppressible
+        def vertex_saved(sender, **kwargs):
+    """
+    @functools.wraps(receiver_function)
+    def wrapper(sender, **kwargs):
+        if wrapper in _suppressed_receivers.get():
+            with _suppressed_counts_lock:
+                _suppressed_counts[receiver_function.__name__] += 1
+            return None
+        return receiver_function(sender, **kwargs)
+    return wrapper
+
+
+def suppression_stats():
+    """
+    :return: Dictionary of the number of suppressed calls of each receiver,
+             keyed by receiver name.
+    """
+    with _suppressed_counts_lock:
+        return dict(_suppressed_counts)
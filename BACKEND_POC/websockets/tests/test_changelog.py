@@ -0,0 +1,91 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from app.models import ChangeLogEntry, ChangeLogSequence
+from websockets.changelog import changes_since, prune_change_log, record_changes
+
+
+def change(graph_id, attribute_id, change_type='VertexAttrib'):
+    """
+    :return: Payload of a change to an attribute of a graph.
+    """
+    return {'type': change_type, 'operation': 'UPDATE', 'graph_id': graph_id, 'attribute_id': attribute_id}
+
+
+class ChangeLogTests(TestCase):
+    """
+    Check that committed graph changes are numbered per graph and logged,
+    and replayed from the log (refer to websockets/changelog.py).
+    """
+
+    def test_changes_numbered_per_graph(self):
+        payloads = [change(1, 1), change(2, 2), change(1, 3)]
+        record_changes(payloads)
+        record_changes([change(1, 4)])
+        self.assertEqual([payload['seq'] for payload in payloads], [1, 1, 2])
+        self.assertEqual(list(ChangeLogEntry.objects.filter(graph_id=1).order_by('seq').values_list(
+            'seq', 'payload__attribute_id')), [(1, 1), (2, 3), (3, 4)])
+        self.assertEqual(ChangeLogSequence.objects.get(graph_id=1).last_seq, 3)
+        self.assertEqual(ChangeLogSequence.objects.get(graph_id=2).last_seq, 1)
+
+    def test_excluded_changes_not_numbered(self):
+        payloads = [change(1, 1, 'ImportJob'), {'type': 'Schema', 'operation': 'POST', 'schema_id': 1}]
+        record_changes(payloads)
+        self.assertFalse(any('seq' in payload for payload in payloads))
+        self.assertFalse(ChangeLogEntry.objects.exists())
+
+    @override_settings(CHANGE_LOG={'ENABLED': False})
+    def test_disabled(self):
+        payloads = [change(1, 1)]
+        record_changes(payloads)
+        self.assertNotIn('seq', payloads[0])
+        self.assertFalse(ChangeLogEntry.objects.exists())
+
+    def test_changes_since(self):
+        record_changes([change(1, attribute_id) for attribute_id in range(1, 6)])
+        replay = changes_since(1, 2)
+        self.assertEqual((replay['seq'], replay['more'], replay['reload']), (5, False, False))
+        self.assertEqual([payload['seq'] for payload in replay['changes']], [3, 4, 5])
+        replay = changes_since(1, 5)
+        self.assertEqual((replay['changes'], replay['more'], replay['reload']), ([], False, False))
+
+    def test_changes_since_limited(self):
+        record_changes([change(1, attribute_id) for attribute_id in range(1, 6)])
+        replay = changes_since(1, 0, limit=2)
+        self.assertEqual([payload['seq'] for payload in replay['changes']], [1, 2])
+        self.assertTrue(replay['more'])
+
+    def test_changes_since_reload(self):
+        record_changes([change(1, attribute_id) for attribute_id in range(1, 6)])
+        # Ahead of the graphs sequence
+        self.assertTrue(changes_since(1, 6)['reload'])
+        # Missed changes no longer logged
+        ChangeLogEntry.objects.filter(graph_id=1, seq__lte=3).delete()
+        replay = changes_since(1, 1)
+        self.assertEqual((replay['changes'], replay['reload']), ([], True))
+        self.assertFalse(changes_since(1, 3)['reload'])
+
+    def test_prune(self):
+        record_changes([change(1, 1), change(1, 2)])
+        ChangeLogEntry.objects.filter(seq=1).update(created=timezone.now() - timedelta(days=8))
+        self.assertEqual(prune_change_log(7), 1)
+        self.assertEqual(list(ChangeLogEntry.objects.values_list('seq', flat=True)), [2])
+        self.assertTrue(changes_since(1, 0)['reload'])
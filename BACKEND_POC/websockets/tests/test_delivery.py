@@ -0,0 +1,123 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import asyncio
+from django.test import SimpleTestCase
+from websockets.delivery import DISCONNECT, DROP_NEWEST, DROP_OLDEST, DeliveryMetrics, SendQueue
+from websockets.outbox import DELETE, POST, UPDATE
+
+
+def vertex(seq, vertex_id, operation=UPDATE, **fields):
+    """
+    :return: Payload of a change to a vertex.
+    """
+    return dict({'type': 'Vertex', 'vertex_id': vertex_id, 'graph_id': 10, 'operation': operation, 'seq': seq},
+                **fields)
+
+
+def batch_edit(seq, labels, graph_id=10):
+    """
+    :return: Payload of a batch of attribute edits (refer to
+             websockets/consumers.py:attributes_batch_edited).
+    """
+    return {'type': 'AttributeEdit', 'graph_id': graph_id, 'operation': UPDATE, 'labels': {'vertex': labels},
+            'vertex_count': 1, 'transaction_count': 0, 'seq': seq}
+
+
+class SendQueueTests(SimpleTestCase):
+    """
+    Check that changes queued for a socket are merged, bounded and ordered
+    (refer to websockets/delivery.py).
+    """
+
+    def setUp(self):
+        self.metrics = DeliveryMetrics()
+
+    def send_queue(self, max_queued=10, backpressure=DROP_OLDEST):
+        return SendQueue(max_queued, backpressure, self.metrics)
+
+    def test_batch_edits_not_merged(self):
+        send_queue = self.send_queue()
+        send_queue.put([batch_edit(1, ['x'])])
+        send_queue.put([batch_edit(2, ['color'])])
+        self.assertEqual(list(send_queue.changes.values()), [batch_edit(1, ['x']), batch_edit(2, ['color'])])
+        self.assertEqual(self.metrics.merged, 0)
+
+    def test_updates_merged(self):
+        send_queue = self.send_queue()
+        send_queue.put([vertex(1, 1, x=1), vertex(2, 2)])
+        send_queue.put([vertex(3, 1, x=2)])
+        # The latest update is kept, in the place of the latest change
+        self.assertEqual(list(send_queue.changes.values()), [vertex(2, 2), vertex(3, 1, x=2)])
+        self.assertEqual(self.metrics.merged, 1)
+
+    def test_post_then_delete_dropped(self):
+        send_queue = self.send_queue()
+        send_queue.put([vertex(1, 1, POST), vertex(2, 1, UPDATE), vertex(3, 1, DELETE)])
+        self.assertEqual(len(send_queue), 0)
+
+    def test_delete_then_post_updates(self):
+        send_queue = self.send_queue()
+        send_queue.put([vertex(1, 1, DELETE), vertex(2, 1, POST, x=1)])
+        self.assertEqual(list(send_queue.changes.values()), [vertex(2, 1, UPDATE, x=1)])
+
+    def test_overflow_drops_oldest(self):
+        send_queue = self.send_queue(max_queued=2, backpressure=DROP_OLDEST)
+        self.assertTrue(send_queue.put([vertex(1, 1), vertex(2, 2), vertex(3, 3)]))
+        self.assertEqual(list(send_queue.changes.values()), [vertex(2, 2), vertex(3, 3)])
+        self.assertEqual(self.metrics.dropped, 1)
+
+    def test_overflow_drops_newest(self):
+        send_queue = self.send_queue(max_queued=2, backpressure=DROP_NEWEST)
+        self.assertTrue(send_queue.put([vertex(1, 1), vertex(2, 2), vertex(3, 3)]))
+        self.assertEqual(list(send_queue.changes.values()), [vertex(1, 1), vertex(2, 2)])
+        self.assertEqual(self.metrics.dropped, 1)
+
+    def test_overflow_merges_when_full(self):
+        # A change merging with a queued change takes no room, so nothing is dropped
+        send_queue = self.send_queue(max_queued=2, backpressure=DISCONNECT)
+        self.assertTrue(send_queue.put([vertex(1, 1), vertex(2, 2), vertex(3, 1)]))
+        self.assertEqual(self.metrics.dropped, 0)
+
+    def test_overflow_disconnects(self):
+        send_queue = self.send_queue(max_queued=2, backpressure=DISCONNECT)
+        self.assertTrue(send_queue.put([vertex(1, 1), vertex(2, 2)]))
+        self.assertFalse(send_queue.put([vertex(3, 3)]))
+        self.assertEqual(self.metrics.dropped, 1)
+        self.assertEqual(self.metrics.disconnected, 1)
+
+    def test_take(self):
+        send_queue = self.send_queue()
+        send_queue.put([vertex(1, 1), vertex(2, 2)])
+        self.assertEqual(asyncio.run(send_queue.take(0)), [vertex(1, 1), vertex(2, 2)])
+        self.assertEqual(len(send_queue), 0)
+        self.assertFalse(send_queue.ready.is_set())
+
+    def test_closed(self):
+        send_queue = self.send_queue()
+        send_queue.put([vertex(1, 1)])
+        send_queue.close()
+        send_queue.put([vertex(2, 2)])
+        self.assertEqual(len(send_queue), 0)
+        self.assertEqual(self.metrics.stats()['connections'], 0)
+
+    def test_stats(self):
+        send_queue = self.send_queue()
+        send_queue.put([vertex(1, 1), vertex(2, 2), vertex(3, 1)])
+        stats = self.metrics.stats()
+        self.assertEqual((stats['connections'], stats['queue_depth'], stats['queued'], stats['merged']), (1, 2, 2, 1))
@@ -0,0 +1,118 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from app.models import AttribType, AttribTypeChoice, Graph, GraphAttribDefVertex, Schema, SchemaAttribDefVertex
+from app.models import Vertex, VertexAttrib, Transaction
+from websockets.deltas import add_delta, attribute_def_delta, attribute_delta, attribute_edit_delta
+from websockets.deltas import attribute_label_delta, graph_delta, schema_delta, transaction_delta, vertex_delta
+
+# Settings enabling delta payloads of up to 128 bytes
+DELTA_PAYLOADS = {'DELTA': True, 'MAX_DELTA_BYTES': 128}
+
+
+def attribute_def(label, raw_type, default_str=None):
+    """
+    :return: Unsaved vertex attribute definition of the supplied type.
+    """
+    return GraphAttribDefVertex(label=label, descr='Test ' + label, default_str=default_str,
+                                type_fk=AttribType(label='type ' + str(raw_type), raw_type=raw_type))
+
+
+class DeltaTests(SimpleTestCase):
+    """
+    Check the deltas describing the new state of changed records (refer to
+    websockets/deltas.py).
+    """
+
+    def test_disabled(self):
+        build = mock.Mock(return_value={'title': 'x'})
+        self.assertEqual(add_delta({'type': 'Graph'}, build), {'type': 'Graph'})
+        build.assert_not_called()
+
+    @override_settings(CHANGE_PAYLOADS=DELTA_PAYLOADS)
+    def test_enabled(self):
+        self.assertEqual(add_delta({'type': 'Graph'}, lambda: {'title': 'x'}),
+                         {'type': 'Graph', 'delta': {'title': 'x'}})
+        self.assertEqual(add_delta({'type': 'GraphAttrib'}, lambda: None), {'type': 'GraphAttrib'})
+
+    @override_settings(CHANGE_PAYLOADS=DELTA_PAYLOADS)
+    def test_truncated(self):
+        self.assertEqual(add_delta({'type': 'Graph'}, lambda: {'title': 'x' * 128}),
+                         {'type': 'Graph', 'delta_truncated': True})
+
+    def test_record_deltas(self):
+        self.assertEqual(schema_delta(Schema(label='s')), {'label': 's'})
+        self.assertEqual(graph_delta(Graph(title='g', schema_fk_id=3)), {'title': 'g', 'schema_id': 3})
+        self.assertEqual(vertex_delta(Vertex(attribute_json={'x': 1.0})), {'attribute_json': {'x': 1.0}})
+        self.assertEqual(transaction_delta(Transaction(vx_src_id=1, vx_dst_id=2, tx_dir=False,
+                                                       attribute_json={'weight': 2})),
+                         {'vertex_src_id': 1, 'vertex_dst_id': 2, 'tx_dir': False, 'attribute_json': {'weight': 2}})
+
+    def test_attribute_def_delta(self):
+        self.assertEqual(attribute_def_delta(attribute_def('x', AttribTypeChoice.FLOAT.value, '1.5')),
+                         {'label': 'x', 'type': 'type 1', 'descr': 'Test x', 'default': 1.5})
+        self.assertEqual(attribute_def_delta(attribute_def('raw', AttribTypeChoice.DICT.value))['default'], None)
+
+    def test_attribute_delta(self):
+        attribute = VertexAttrib(attrib_fk=attribute_def('selected', AttribTypeChoice.BOOL.value), value_str='true')
+        self.assertEqual(attribute_delta(attribute), {'label': 'selected', 'value': True})
+        attribute = VertexAttrib(attrib_fk=attribute_def('raw', AttribTypeChoice.DICT.value), value_str='{"a": [1]}')
+        self.assertEqual(attribute_delta(attribute), {'label': 'raw', 'value': {'a': [1]}})
+
+    def test_attribute_label_delta(self):
+        attribute = VertexAttrib(attrib_fk=attribute_def('x', AttribTypeChoice.FLOAT.value))
+        self.assertEqual(attribute_label_delta(attribute), {'label': 'x'})
+        # The definition has already been deleted
+        self.assertIsNone(attribute_label_delta(VertexAttrib()))
+
+    def test_attribute_edit_delta(self):
+        values = {'graph': {None: {'title': 'x'}}, 'vertex': {0: {'x': 1.0}, 3: {'x': 2.0}},
+                  'transaction': {5: {'weight': 2}}}
+        record_ids = {'vertex': {0: 12, 3: 15}, 'transaction': {5: 40}}
+        self.assertEqual(attribute_edit_delta(values, record_ids), {
+            'graph': {'title': 'x'},
+            'vertexes': [{'vertex_id': 12, 'vx_id': 0, 'values': {'x': 1.0}},
+                         {'vertex_id': 15, 'vx_id': 3, 'values': {'x': 2.0}}],
+            'transactions': [{'transaction_id': 40, 'tx_id': 5, 'values': {'weight': 2}}]})
+        self.assertEqual(attribute_edit_delta({'vertex': {0: {'x': 1.0}}}, {'vertex': {0: 12}}),
+                         {'vertexes': [{'vertex_id': 12, 'vx_id': 0, 'values': {'x': 1.0}}]})
+
+
+@override_settings(CHANGE_PAYLOADS=DELTA_PAYLOADS)
+class DeltaPayloadTests(TestCase):
+    """
+    Check that change notifications carry the delta of the changed record
+    when delta payloads are enabled.
+    """
+
+    def test_notifications(self):
+        with mock.patch('websockets.consumers.change_outbox') as change_outbox:
+            schema = Schema.objects.create(label='delta')
+            vertex_type = AttribType.objects.create(label='delta float', raw_type=AttribTypeChoice.FLOAT.value)
+            SchemaAttribDefVertex.objects.create(schema_fk=schema, label='x', type_fk=vertex_type, default_str='0.5')
+            graph = Graph.objects.create(title='delta', schema_fk=schema)
+            Vertex.objects.create(graph_fk=graph, vx_id=0, attribute_json={'label': 'x' * 128})
+        payloads = {call.args[0]: call.args[1] for call in change_outbox.add.call_args_list}
+        self.assertEqual(payloads['Schema']['delta'], {'label': 'delta'})
+        self.assertEqual(payloads['SchemaAttribDefVertex']['delta'],
+                         {'label': 'x', 'type': 'delta float', 'descr': '', 'default': 0.5})
+        self.assertEqual(payloads['Graph']['delta'], {'title': 'delta', 'schema_id': schema.id})
+        self.assertTrue(payloads['Vertex']['delta_truncated'])
+        self.assertNotIn('delta', payloads['Vertex'])
@@ -0,0 +1,128 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import json
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import SimpleTestCase, override_settings
+from websockets.dispatcher import ChangeDispatcher, graph_group_name, schema_group_name
+from websockets.outbox import BATCH_TYPE, batch_message
+
+# Group receiving all changes, and the message type they are sent with
+GROUP_NAME = 'CONSTELLATION.Test'
+MESSAGE_TYPE = 'test.message'
+
+
+def change(attribute_id, graph_id=10):
+    """
+    :return: Payload of a change to a vertex attribute.
+    """
+    return {'type': 'VertexAttrib', 'operation': 'UPDATE', 'graph_id': graph_id, 'attribute_id': attribute_id}
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChangeDispatcherTests(SimpleTestCase):
+    """
+    Check that dispatched changes are sent to the group of all changes, to
+    the group of their graph (or schema), and to RabbitMQ, in the order they
+    were dispatched (refer to websockets/dispatcher.py). RabbitMQ publishing
+    is replaced by a mock.
+    """
+
+    def setUp(self):
+        patcher = mock.patch('websockets.dispatcher.tasks.publish_updates')
+        self.publish_updates = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.channel_layer = get_channel_layer()
+        self.channels = {}
+        for group_name in (GROUP_NAME, graph_group_name(10), graph_group_name(11), schema_group_name(3)):
+            self.channels[group_name] = async_to_sync(self.channel_layer.new_channel)()
+            async_to_sync(self.channel_layer.group_add)(group_name, self.channels[group_name])
+
+    def received(self, group_name):
+        """
+        :return: List of the decoded messages sent to a group.
+        """
+        channel = self.channels[group_name]
+        messages = []
+        while self.channel_layer.channels.get(channel):
+            message = async_to_sync(self.channel_layer.receive)(channel)
+            self.assertEqual(message['type'], MESSAGE_TYPE)
+            messages.append(json.loads(message['message']))
+        return messages
+
+    def published(self):
+        """
+        :return: List of the (model_name, payload) tuples published to RabbitMQ.
+        """
+        return [update for call in self.publish_updates.call_args_list for update in call[0][0]]
+
+    @override_settings(CHANGE_DISPATCHER={'ASYNC': False})
+    def test_sent_inline(self):
+        dispatcher = ChangeDispatcher(GROUP_NAME, MESSAGE_TYPE)
+        dispatcher.dispatch('VertexAttrib', change(1))
+        dispatcher.dispatch('Schema', {'type': 'Schema', 'operation': 'UPDATE', 'schema_id': 3})
+        self.assertEqual(self.received(GROUP_NAME), [change(1), {'type': 'Schema', 'operation': 'UPDATE',
+                                                                 'schema_id': 3}])
+        self.assertEqual(self.received(graph_group_name(10)), [change(1)])
+        self.assertEqual(self.received(schema_group_name(3)), [{'type': 'Schema', 'operation': 'UPDATE',
+                                                                'schema_id': 3}])
+        self.assertEqual(self.published(), [('VertexAttrib', change(1)),
+                                            ('Schema', {'type': 'Schema', 'operation': 'UPDATE', 'schema_id': 3})])
+
+    @override_settings(CHANGE_DISPATCHER={'ASYNC': False})
+    def test_batch_split_by_graph(self):
+        dispatcher = ChangeDispatcher(GROUP_NAME, MESSAGE_TYPE)
+        message = batch_message([change(1, 10), change(2, 11), change(3, 10)])
+        dispatcher.dispatch(BATCH_TYPE, message)
+        self.assertEqual(self.received(GROUP_NAME), [message])
+        self.assertEqual(self.received(graph_group_name(10)), [batch_message([change(1, 10), change(3, 10)])])
+        self.assertEqual(self.received(graph_group_name(11)), [change(2, 11)])
+        self.assertEqual(self.published(), [(BATCH_TYPE, message)])
+
+    @override_settings(CHANGE_DISPATCHER={'ASYNC': True, 'BATCH_INTERVAL': 0.5})
+    def test_sent_in_order_by_thread(self):
+        dispatcher = ChangeDispatcher(GROUP_NAME, MESSAGE_TYPE)
+        for attribute_id in (1, 2, 1, 3):
+            dispatcher.dispatch('VertexAttrib', change(attribute_id))
+        self.assertTrue(dispatcher.flush(5))
+        # The duplicate change is dropped from the batch
+        self.assertEqual(self.received(graph_group_name(10)), [change(1), change(2), change(3)])
+        self.assertEqual(self.published(), [('VertexAttrib', change(attribute_id)) for attribute_id in (1, 2, 3)])
+        stats = dispatcher.stats()
+        self.assertEqual((stats['dispatched'], stats['sent'], stats['duplicates'], stats['batches']), (4, 3, 1, 1))
+
+    @override_settings(CHANGE_DISPATCHER={'ASYNC': True, 'MAX_QUEUED': 1})
+    def test_dropped_when_queue_full(self):
+        dispatcher = ChangeDispatcher(GROUP_NAME, MESSAGE_TYPE)
+        # Without the sending thread the queue fills
+        with mock.patch.object(dispatcher, '_ensure_thread'):
+            with self.assertLogs('websockets.dispatcher', 'WARNING'):
+                dispatcher.dispatch('VertexAttrib', change(1))
+                dispatcher.dispatch('VertexAttrib', change(2))
+        self.assertEqual((dispatcher.stats()['dropped'], dispatcher.stats()['queued']), (1, 1))
+
+    @override_settings(CHANGE_DISPATCHER={'ASYNC': True})
+    def test_failed_send_logged(self):
+        dispatcher = ChangeDispatcher(GROUP_NAME, MESSAGE_TYPE)
+        self.publish_updates.side_effect = RuntimeError('broker down')
+        with self.assertLogs('websockets.dispatcher', 'ERROR'):
+            dispatcher.dispatch('VertexAttrib', change(1))
+            self.assertTrue(dispatcher.flush(5))
+        self.assertEqual(dispatcher.stats()['failed'], 1)
@@ -0,0 +1,185 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from django.db import transaction
+from django.test import TransactionTestCase
+from websockets.outbox import BATCH, BATCH_TYPE, DELETE, POST, UPDATE, ChangeOutbox
+
+
+class RecordingDispatcher:
+    """
+    Change dispatcher recording the changes dispatched to it rather than
+    sending them.
+    """
+
+    def __init__(self):
+        self.dispatched = []
+
+    def dispatch(self, model_name, payload):
+        self.dispatched.append((model_name, payload))
+
+
+def change(operation, attribute_id=1, value='a', graph_id=10):
+    """
+    :return: Payload of a change to a vertex attribute.
+    """
+    return {'type': 'VertexAttrib', 'operation': operation, 'graph_id': graph_id, 'attribute_id': attribute_id,
+            'value': value}
+
+
+def batch_edit(graph_id=10, labels=('x',), vertex_count=1):
+    """
+    :return: Payload of a batch of attribute edits (refer to
+             websockets/consumers.py:attributes_batch_edited).
+    """
+    return {'type': 'AttributeEdit', 'graph_id': graph_id, 'operation': UPDATE, 'labels': {'vertex': list(labels)},
+            'vertex_count': vertex_count, 'transaction_count': 0}
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back a transaction or savepoint.
+    """
+    pass
+
+
+class ChangeOutboxTests(TransactionTestCase):
+    """
+    Check that changes are sent once the transaction (or savepoint) they were
+    made in commits, merged and batched, and never if it rolls back (refer to
+    websockets/outbox.py). A TransactionTestCase is used as commit hooks are
+    not run within a TestCase.
+    """
+
+    def setUp(self):
+        self.dispatcher = RecordingDispatcher()
+        self.outbox = ChangeOutbox(self.dispatcher)
+
+    def sent(self):
+        """
+        :return: List of the change payloads dispatched, with BATCH messages
+                 expanded, without their sequence numbers.
+        """
+        payloads = []
+        for model_name, payload in self.dispatcher.dispatched:
+            for sent in payload['changes'] if payload.get('operation') == BATCH else [payload]:
+                payloads.append(dict((key, value) for key, value in sent.items() if key != 'seq'))
+        return payloads
+
+    def test_autocommit_sent_immediately(self):
+        self.outbox.add('VertexAttrib', change(POST))
+        self.assertEqual(self.dispatcher.dispatched, [('VertexAttrib', dict(change(POST), seq=1))])
+
+    def test_sent_on_commit(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST))
+            self.assertEqual(self.dispatcher.dispatched, [])
+        self.assertEqual(self.dispatcher.dispatched, [('VertexAttrib', dict(change(POST), seq=1))])
+
+    def test_commit_sent_as_batch(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST, 1))
+            self.outbox.add('VertexAttrib', change(POST, 2))
+        self.assertEqual(len(self.dispatcher.dispatched), 1)
+        model_name, message = self.dispatcher.dispatched[0]
+        self.assertEqual((model_name, message['type'], message['operation']), (BATCH_TYPE, BATCH_TYPE, BATCH))
+        self.assertEqual(message['changes'], [dict(change(POST, 1), seq=1), dict(change(POST, 2), seq=2)])
+
+    def test_rolled_back_not_sent(self):
+        with self.assertRaises(Rollback):
+            with transaction.atomic():
+                self.outbox.add('VertexAttrib', change(POST))
+                raise Rollback()
+        self.assertEqual(self.dispatcher.dispatched, [])
+
+    def test_transaction_after_rollback_sent(self):
+        with self.assertRaises(Rollback):
+            with transaction.atomic():
+                self.outbox.add('VertexAttrib', change(POST, 1))
+                raise Rollback()
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST, 2))
+        self.assertEqual(self.sent(), [change(POST, 2)])
+
+    def test_rolled_back_savepoint_not_sent(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST, 1))
+            with self.assertRaises(Rollback):
+                with transaction.atomic():
+                    self.outbox.add('VertexAttrib', change(POST, 2))
+                    raise Rollback()
+            self.outbox.add('VertexAttrib', change(POST, 3))
+        self.assertEqual(self.sent(), [change(POST, 1), change(POST, 3)])
+
+    def test_nested_atomic_sent_on_outer_commit(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST, 1))
+            with transaction.atomic():
+                self.outbox.add('VertexAttrib', change(POST, 2))
+            with transaction.atomic(savepoint=False):
+                self.outbox.add('VertexAttrib', change(POST, 3))
+            self.assertEqual(self.dispatcher.dispatched, [])
+        self.assertEqual(self.sent(), [change(POST, 1), change(POST, 3), change(POST, 2)])
+
+    def test_outer_rollback_discards_savepoints(self):
+        with self.assertRaises(Rollback):
+            with transaction.atomic():
+                with transaction.atomic():
+                    self.outbox.add('VertexAttrib', change(POST))
+                raise Rollback()
+        self.assertEqual(self.dispatcher.dispatched, [])
+
+    def test_created_and_deleted_not_sent(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST))
+            self.outbox.add('VertexAttrib', change(DELETE))
+        self.assertEqual(self.dispatcher.dispatched, [])
+
+    def test_deleted_and_created_sent_as_update(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(DELETE, value='a'))
+            self.outbox.add('VertexAttrib', change(POST, value='b'))
+        self.assertEqual(self.sent(), [change(UPDATE, value='b')])
+
+    def test_created_and_updated_sent_as_created(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(POST, value='a'))
+            self.outbox.add('VertexAttrib', change(UPDATE, value='b'))
+        self.assertEqual(self.sent(), [change(POST, value='b')])
+
+    def test_updates_merged_in_order_first_made(self):
+        with transaction.atomic():
+            self.outbox.add('VertexAttrib', change(UPDATE, 1, 'a'))
+            self.outbox.add('VertexAttrib', change(UPDATE, 2, 'b'))
+            self.outbox.add('VertexAttrib', change(UPDATE, 1, 'c'))
+        self.assertEqual(self.sent(), [change(UPDATE, 1, 'c'), change(UPDATE, 2, 'b')])
+
+    def test_batch_edits_not_merged(self):
+        with transaction.atomic():
+            self.outbox.add('AttributeEdit', batch_edit(labels=['x'], vertex_count=2))
+            self.outbox.add('AttributeEdit', batch_edit(labels=['color'], vertex_count=5))
+        self.assertEqual(self.sent(), [batch_edit(labels=['x'], vertex_count=2),
+                                       batch_edit(labels=['color'], vertex_count=5)])
+
+    def test_graph_changes_merged(self):
+        with transaction.atomic():
+            self.outbox.add('Graph', {'type': 'Graph', 'graph_id': 10, 'operation': UPDATE, 'title': 'a'})
+            self.outbox.add('AttributeEdit', batch_edit())
+            self.outbox.add('Graph', {'type': 'Graph', 'graph_id': 10, 'operation': UPDATE, 'title': 'b'})
+        self.assertEqual(self.sent(), [{'type': 'Graph', 'graph_id': 10, 'operation': UPDATE, 'title': 'b'},
+                                       batch_edit()])
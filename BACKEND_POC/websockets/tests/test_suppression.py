@@ -0,0 +1,100 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import asyncio
+import threading
+from django.dispatch import Signal
+from django.test import SimpleTestCase
+from websockets.suppression import suppress, suppressible, suppression_stats
+
+
+class SuppressionTests(SimpleTestCase):
+    """
+    Check that receivers are only suppressed within the context, thread and
+    asyncio task that suppressed them (refer to websockets/suppression.py).
+    """
+
+    def setUp(self):
+        self.signal = Signal()
+        self.received = []
+
+        @suppressible
+        def suppression_test_receiver(sender, **kwargs):
+            self.received.append(kwargs['name'])
+
+        self.receiver = suppression_test_receiver
+        self.signal.connect(self.receiver, weak=False)
+
+    def send(self, name):
+        self.signal.send(sender=None, name=name)
+
+    def test_suppressed_within_context(self):
+        suppressed = suppression_stats().get('suppression_test_receiver', 0)
+        self.send('before')
+        with suppress(self.receiver):
+            self.send('within')
+            with suppress():
+                self.send('nested')
+        self.send('after')
+        self.assertEqual(self.received, ['before', 'after'])
+        self.assertEqual(suppression_stats()['suppression_test_receiver'], suppressed + 2)
+
+    def test_restored_after_exception(self):
+        with self.assertRaises(ValueError), suppress(self.receiver):
+            raise ValueError()
+        self.send('after')
+        self.assertEqual(self.received, ['after'])
+
+    def test_other_threads_not_suppressed(self):
+        inside = threading.Event()
+        sent = threading.Event()
+
+        def suppressing_thread():
+            with suppress(self.receiver):
+                inside.set()
+                sent.wait(5)
+                self.send('suppressing thread')
+
+        thread = threading.Thread(target=suppressing_thread)
+        thread.start()
+        self.assertTrue(inside.wait(5))
+        # Sent while the other thread is within its suppress context
+        self.send('main thread')
+        sent.set()
+        thread.join(5)
+        self.assertEqual(self.received, ['main thread'])
+
+    def test_other_tasks_not_suppressed(self):
+        async def suppressing_task(inside, sent):
+            with suppress(self.receiver):
+                inside.set()
+                await sent.wait()
+                self.send('suppressing task')
+
+        async def other_task(inside, sent):
+            await inside.wait()
+            self.send('other task')
+            sent.set()
+
+        async def run():
+            inside = asyncio.Event()
+            sent = asyncio.Event()
+            await asyncio.gather(suppressing_task(inside, sent), other_task(inside, sent))
+
+        asyncio.run(run())
+        self.assertEqual(self.received, ['other task'])
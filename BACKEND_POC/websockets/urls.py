@@ -21,4 +21,5 @@ from . import views
 
 urlpatterns = [
     path('', views.updates, name='updates'),
+    path('metrics', views.metrics, name='update_metrics'),
 ]
\ No newline at end of file
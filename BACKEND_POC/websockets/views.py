@@ -16,11 +16,26 @@
  *
 """
 
+from django.http import JsonResponse
 from django.shortcuts import render
+from websockets.consumers import change_dispatcher
+from websockets.delivery import delivery_metrics
+from websockets.suppression import suppression_stats
+from worker.publisher import update_publisher
 
 
 def updates(request):
     """
     Return sample web socket consumer.
     """
-    return render(request, 'websockets/updates.html')
\ No newline at end of file
+    return render(request, 'websockets/updates.html')
+
+
+def metrics(request):
+    """
+    Return the change dispatcher, update publisher and websocket delivery
+    counters of this process, including the depth of the sockets send queues,
+    and the number of suppressed receiver calls.
+    """
+    return JsonResponse({'dispatcher': change_dispatcher.stats(), 'publisher': update_publisher.stats(),
+                         'delivery': delivery_metrics.stats(), 'suppressed': suppression_stats()})
@@ -0,0 +1,259 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+import kombu
+from django.conf import settings
+from worker.worker import EXCHANGE_NAME, EXCHANGE_TYPE
+
+
+logger = logging.getLogger(__name__)
+
+
+# <editor-fold Constants">
+# Default publisher settings, overridden by the UPDATE_PUBLISHER setting.
+#  - BROKER_URL: Broker to publish to, defaults to the celery broker.
+#  - MAX_BUFFERED: Maximum number of updates buffered while the broker is
+#    unavailable, beyond which the oldest updates are discarded (and counted
+#    as lost).
+#  - CONFIRM: True to wait for the broker to confirm each update (publisher
+#    confirms) before it is removed from the buffer.
+DEFAULT_PUBLISHER_SETTINGS = {
+    'BROKER_URL': None,
+    'MAX_BUFFERED': 100000,
+    'CONFIRM': True,
+}
+
+# Seconds to wait before reconnecting after a failure, doubling with each
+# consecutive failure up to RECONNECT_MAX_DELAY.
+RECONNECT_DELAY = 0.05
+RECONNECT_MAX_DELAY = 5.0
+
+# Seconds of recent publishes the reported throughput is calculated over.
+THROUGHPUT_WINDOW = 10.0
+
+# Seconds to wait for buffered updates to be published when the process
+# exits.
+EXIT_FLUSH_TIMEOUT = 5.0
+# </editor-fold>
+
+
+class UpdatePublisher:
+    """
+    Publish updates to the message broker exchange from a background thread,
+    over a single long lived connection and channel, rather than acquiring a
+    producer from the celery pool for every update (which has issues when
+    the broker reconnects, refer to https://github.com/celery/celery/issues/4867
+    and https://github.com/celery/celery/issues/5358). Updates are buffered
+    locally and removed once published (and, with CONFIRM, confirmed by the
+    broker), so a broker outage or reconnect delays updates rather than
+    losing them. Updates are only lost if the buffer overflows. Works with
+    any kombu transport, ie memory:// for testing.
+    """
+
+    def __init__(self, broker_url, exchange_name, exchange_type, max_buffered, confirm=True):
+        """
+        :param broker_url: URL of the broker.
+        :param exchange_name: Name of the exchange to publish to.
+        :param exchange_type: Type of the exchange, ie 'fanout'.
+        :param max_buffered: Maximum number of updates buffered.
+        :param confirm: True to use publisher confirms.
+        """
+        self.broker_url = broker_url
+        self.exchange = kombu.Exchange(name=exchange_name, type=exchange_type, durable=True)
+        self.max_buffered = max_buffered
+        self.confirm = confirm
+        # Updates waiting to be published, as (routing key, payload, time
+        # queued) tuples
+        self.buffer = collections.deque()
+        self.in_flight = False
+        self.condition = threading.Condition()
+        self.connection = None
+        self.producer = None
+        # The thread is started on first use, and restarted in forked
+        # processes (ie celery workers), which do not inherit it
+        self.thread = None
+        self.pid = None
+        # Counters reported by stats()
+        self.queued = 0
+        self.published = 0
+        self.lost = 0
+        self.failures = 0
+        self.connects = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.recent = collections.deque()
+        atexit.register(self.flush, EXIT_FLUSH_TIMEOUT)
+
+    @classmethod
+    def from_settings(cls):
+        """
+        :return: UpdatePublisher configured by the UPDATE_PUBLISHER setting.
+        """
+        options = dict(DEFAULT_PUBLISHER_SETTINGS, **getattr(settings, 'UPDATE_PUBLISHER', {}))
+        broker_url = options['BROKER_URL'] or settings.CELERY['BROKER_URL']
+        return cls(broker_url, EXCHANGE_NAME, EXCHANGE_TYPE, options['MAX_BUFFERED'], options['CONFIRM'])
+
+    def publish(self, routing_key, payload):
+        """
+        Buffer an update to be published, returning immediately.
+        :param routing_key: Routing key of the update.
+        :param payload: Dictionary to publish, encoded as JSON.
+        """
+        self._ensure_thread()
+        with self.condition:
+            if len(self.buffer) >= self.max_buffered:
+                self.buffer.popleft()
+                self.lost = self.lost + 1
+                if self.lost % 1000 == 1:
+                    logger.warning('Update publisher buffer is full, ' + str(self.lost) + ' updates lost')
+            self.buffer.append((routing_key, payload, time.monotonic()))
+            self.queued = self.queued + 1
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Wait for buffered updates to be published.
+        :param timeout: Maximum number of seconds to wait, or None to wait
+                        until all updates are published.
+        :return: True if all buffered updates were published.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.buffer or self.in_flight:
+                if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def stats(self):
+        """
+        :return: Dictionary of publisher counters, latencies (from an
+                 update being buffered to it being published) in
+                 milliseconds, and the throughput over recent publishes.
+        """
+        with self.condition:
+            now = time.monotonic()
+            while self.recent and self.recent[0] < now - THROUGHPUT_WINDOW:
+                self.recent.popleft()
+            return {'queued': self.queued, 'published': self.published, 'lost': self.lost,
+                    'buffered': len(self.buffer) + (1 if self.in_flight else 0), 'failures': self.failures,
+                    'connects': self.connects, 'connected': self.producer is not None,
+                    'latency_avg_ms': round(1000 * self.latency_total / self.published, 3) if self.published else None,
+                    'latency_max_ms': round(1000 * self.latency_max, 3),
+                    'published_per_second': round(len(self.recent) / THROUGHPUT_WINDOW, 1)}
+
+    def _ensure_thread(self):
+        """
+        Start the publishing thread if it is not running in this process.
+        """
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.condition:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # Forked from a process with its own connection and thread
+                self.buffer.clear()
+                self.in_flight = False
+                self.connection = None
+                self.producer = None
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='UpdatePublisher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        """
+        Publishing thread, publishing buffered updates in order and
+        reconnecting, with backoff, after any failure.
+        """
+        delay = RECONNECT_DELAY
+        while True:
+            with self.condition:
+                while not self.buffer:
+                    self.condition.wait()
+                update = self.buffer.popleft()
+                self.in_flight = True
+            routing_key, payload, queued = update
+            try:
+                self._get_producer().publish(payload, routing_key=routing_key)
+            except Exception as ex:
+                self.failures = self.failures + 1
+                logger.warning('Unable to publish update, retrying in ' + str(delay) + 's: ' + str(ex))
+                self._disconnect()
+                with self.condition:
+                    if len(self.buffer) < self.max_buffered:
+                        self.buffer.appendleft(update)
+                    else:
+                        self.lost = self.lost + 1
+                    self.in_flight = False
+                    self.condition.notify_all()
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            delay = RECONNECT_DELAY
+            with self.condition:
+                now = time.monotonic()
+                self.published = self.published + 1
+                self.latency_total = self.latency_total + now - queued
+                self.latency_max = max(self.latency_max, now - queued)
+                self.recent.append(now)
+                if len(self.recent) > 100000:
+                    self.recent.popleft()
+                self.in_flight = False
+                self.condition.notify_all()
+
+    def _get_producer(self):
+        """
+        :return: Producer on the publishers channel, connecting and declaring
+                 the exchange if not connected.
+        """
+        if self.producer is None:
+            self.connection = kombu.Connection(self.broker_url, transport_options={'confirm_publish': self.confirm})
+            self.connection.ensure_connection(max_retries=1)
+            channel = self.connection.channel()
+            exchange = self.exchange(channel)
+            exchange.declare()
+            self.producer = kombu.Producer(channel, exchange=exchange, serializer='json')
+            self.connects = self.connects + 1
+        return self.producer
+
+    def _disconnect(self):
+        """
+        Discard the connection after a failure, so the next publish
+        reconnects.
+        """
+        self.producer = None
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.release()
+            except Exception:
+                pass
+
+
+# Publisher of change notifications, refer to tasks.publish_updates
+update_publisher = UpdatePublisher.from_settings()
@@ -17,10 +17,14 @@
 """
 
 import logging
-import time
+import threading
+from os import path
 from celery import shared_task
+from django.db import connection, connections
 from app import models
-from worker.worker import EXCHANGER_NAME, app
+from websockets.outbox import batch_message, message_changes
+from worker.publisher import update_publisher
+from worker.worker import EXCHANGE_TYPE, TOPIC, app
 
 
 logger = logging.getLogger(__name__)
@@ -32,25 +36,105 @@ POST = 'POST'
 UPDATE = 'UPDATE'
 DELETE = 'DElETE'
 
+# Scopes of topic exchange routing keys, being the first part of the key.
+# Changes belonging to neither a graph nor a schema (ie an ImportJob whose
+# graph does not exist yet) are routed as global.0.<Model>.<operation>.
+GRAPH_SCOPE = 'graph'
+SCHEMA_SCOPE = 'schema'
+GLOBAL_SCOPE = 'global'
+
 
 @app.task(bind=True, name='import_starfile_task')
-def import_starfile_task(self, arg1, arg2):
+def import_starfile_task(self, import_job_id):
     """
-    TODO
-    This is an example task to allow celery to asynchronously process long
-    running jobs. when called, ie with a call like:
-    import_starfile_task.s('example', 'argument').delay(), the request to run
-    is placed on a celery queue, and executed by a celery worker task
-    asynchronously.
+    Import a star file residing in the ./import directory, as described by
+    the ImportJob identified by import_job_id. The task is queued by the
+    import endpoint via import_starfile_task.delay(import_job_id) and executed
+    asynchronously by a celery worker. The ImportJob is saved as the import
+    progresses, which in turn publishes its progress to subscribers.
     """
-    logger.info('DEBUG: This is a test logger message demonstrating the ' +
-                'ability to access data from database arg1=' +
-                str(arg1) + ', arg2=' + str(arg2))
-    results = models.Graph.objects.all()
-    logger.info('DEBUG: Graphs=' + str(results))
+    # The importer depends on the websockets receivers which import this
+    # module, so it can only be imported once everything is loaded.
+    from app.importer import StarImportError
+    from app.parallel_importer import create_importer
+
+    job = models.ImportJob.objects.get(id=import_job_id)
+    job.status = models.ImportJobStatusChoice.RUNNING.value
+    job.save()
+
+    def report_progress(importer, percent):
+        # The graph of an atomic import only exists once it is committed
+        if not importer.atomic:
+            job.graph_fk = importer.graph
+        job.percent_complete = round(percent, 1)
+        job.progress_rates = importer.rates()
+        job.counts = importer.counts
+        _save_job_progress(job)
+
+    importer = create_importer(path.join('import', job.filename), job.filename, progress=report_progress)
+    try:
+        missing_attribute_types = importer.find_missing_attribute_types()
+        if missing_attribute_types:
+            raise StarImportError("Unknown attribute types specified - please create using attrib_types "
+                                  "endpoint: " + str(missing_attribute_types))
+        importer.run()
+    except Exception as ex:
+        logger.exception('Import of ' + job.filename + ' failed')
+        job.status = models.ImportJobStatusChoice.FAILED.value
+        job.error = str(ex)
+        job.progress_rates = importer.rates()
+        job.counts = importer.counts
+        job.timings = {phase: round(seconds, 3) for phase, seconds in importer.timings.items()}
+        job.save()
+        return
 
-    # Simulate a slow running process
-    time.sleep(60)
+    job.graph_fk = importer.graph
+    job.status = models.ImportJobStatusChoice.COMPLETE.value
+    job.percent_complete = 100.0
+    job.progress_rates = importer.rates()
+    job.counts = importer.counts
+    job.timings = {phase: round(seconds, 3) for phase, seconds in importer.timings.items()}
+    job.save()
+
+
+@app.task(name='purge_graph_task')
+def purge_graph_task(graph_id):
+    """
+    Delete a graph along with all of its records (refer to
+    app/purge.py:purge_graphs), queued by the graphs/<id> endpoint when a
+    background delete is requested so that the request is not held up while
+    a large graph is purged.
+    """
+    # The purge depends on the websockets receivers which import this module
+    from app.purge import purge_graphs
+
+    counts = purge_graphs([graph_id])
+    logger.info('Purged graph ' + str(graph_id) + ': ' + str(counts))
+
+
+def _save_job_progress(job):
+    """
+    Save the progress of an ImportJob. If the import is running within a
+    transaction the job is saved from a separate thread, and so using a
+    separate connection, allowing the progress to be seen before the import
+    commits. SQLite cannot write while the import holds its write lock, so
+    progress is not saved in this case.
+    """
+    if not connection.in_atomic_block:
+        job.save()
+        return
+    if connection.vendor == 'sqlite':
+        return
+
+    def save():
+        try:
+            job.save()
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=save)
+    thread.start()
+    thread.join()
 
 
 @shared_task
@@ -59,27 +143,51 @@ def publish_update(model_name, payload):
     Publish supplied payload to message broker (RabbitMQ) exchange. The name
     of the exchange to use is constructed based on supplied model_name value.
     These exchanges have been setup when celery setup is performed.
-    some retry handling is added due to issues that can occur when broker
-    reconnects - as identified below.
     """
-    # Celery package has some issues when broker reconnects, refer to
-    # https://github.com/celery/celery/issues/4867 and
-    # https://github.com/celery/celery/issues/5358. To address this, use a
-    # try/catch block and perform several attempts.
-    success = False
-    sleep_delay = 0.05  # seconds
-    while not success:
-        try:
-            with app.producer_pool.acquire(block=True) as producer:
-                producer.publish(
-                    payload,
-                    exchange=EXCHANGER_NAME,
-                    routing_key=model_name,
-                )
-                success = True
-        except Exception as ex:
-            time.sleep(sleep_delay)
-            sleep_delay = sleep_delay * 2
-            if sleep_delay > 2.0:
-                # Need to break out of loop at some point to avoid issues
-                return
+    publish_updates([(model_name, payload)])
+
+
+def publish_updates(updates):
+    """
+    Publish a batch of payloads to the message broker (RabbitMQ) exchange,
+    each routed using its model_name value, or in topic mode its routing key
+    (refer to topic_routes). Payloads are handed to the update publisher
+    (refer to worker/publisher.py), which publishes them from its own thread
+    over a persistent channel, buffering them while the broker reconnects.
+    :param updates: List of (model_name, payload) tuples.
+    """
+    if EXCHANGE_TYPE == TOPIC:
+        updates = [route for model_name, payload in updates for route in topic_routes(payload)]
+    for routing_key, payload in updates:
+        update_publisher.publish(routing_key, payload)
+
+
+def topic_routing_key(change):
+    """
+    Return the topic exchange routing key of a change, of the form
+    <scope>.<id>.<Model>.<operation>, ie graph.12.Vertex.UPDATE or
+    schema.3.SchemaAttribDefVertex.DELETE.
+    :param change: Change payload.
+    :return: Routing key.
+    """
+    if change.get('graph_id') is not None:
+        scope = GRAPH_SCOPE + '.' + str(change['graph_id'])
+    elif change.get('schema_id') is not None:
+        scope = SCHEMA_SCOPE + '.' + str(change['schema_id'])
+    else:
+        scope = GLOBAL_SCOPE + '.0'
+    return scope + '.' + str(change['type']) + '.' + str(change['operation'])
+
+
+def topic_routes(payload):
+    """
+    Split a change message into one message per topic exchange routing key,
+    so a BATCH message is delivered only to the queues bound to its changes.
+    Changes sharing a routing key stay batched together.
+    :param payload: Change message, a single change or a BATCH message.
+    :return: List of (routing_key, payload) tuples.
+    """
+    routes = {}
+    for change in message_changes(payload):
+        routes.setdefault(topic_routing_key(change), []).append(change)
+    return [(routing_key, batch_message(changes)) for routing_key, changes in routes.items()]
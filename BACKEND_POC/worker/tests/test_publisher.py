@@ -0,0 +1,120 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+import os
+import threading
+import uuid
+import kombu
+from unittest import mock
+from django.test import SimpleTestCase
+from worker import publisher
+from worker.publisher import UpdatePublisher
+
+
+BROKER_URL = 'memory://'
+
+
+class FailingProducer:
+    """
+    Producer failing to publish, as when the broker does not confirm an
+    update (confirm_publish) or the connection drops.
+    """
+
+    def publish(self, payload, **kwargs):
+        raise kombu.exceptions.OperationalError('Update not confirmed')
+
+
+class UpdatePublisherTests(SimpleTestCase):
+    """
+    Check that updates are published to the exchange in order, buffered
+    while they cannot be published and republished after failures, using
+    the kombu memory transport.
+    """
+
+    def setUp(self):
+        self.exchange_name = 'test.' + uuid.uuid4().hex
+        self.publisher = UpdatePublisher(BROKER_URL, self.exchange_name, 'fanout', 10)
+        # Queue bound to the exchange, receiving the published updates
+        self.connection = kombu.Connection(BROKER_URL)
+        self.addCleanup(self.connection.release)
+        exchange = kombu.Exchange(self.exchange_name, type='fanout', durable=True)
+        self.queue = kombu.Queue(self.exchange_name, exchange=exchange)(self.connection.channel())
+        self.queue.declare()
+
+    def received(self):
+        """
+        :return: List of the payloads received by the queue.
+        """
+        payloads = []
+        message = self.queue.get(no_ack=True)
+        while message is not None:
+            payloads.append(message.payload)
+            message = self.queue.get(no_ack=True)
+        return payloads
+
+    def hold(self):
+        """
+        Stop the publisher starting its thread, so updates stay buffered.
+        """
+        self.publisher.thread = threading.Thread()
+        self.publisher.pid = os.getpid()
+
+    def test_publish(self):
+        self.publisher.publish('graph.1.Vertex.POST', {'id': 1})
+        self.publisher.publish('graph.1.Vertex.UPDATE', {'id': 2})
+        self.assertTrue(self.publisher.flush(5))
+        self.assertEqual(self.received(), [{'id': 1}, {'id': 2}])
+        stats = self.publisher.stats()
+        self.assertEqual((stats['queued'], stats['published'], stats['buffered'], stats['lost'], stats['connects']),
+                         (2, 2, 0, 0, 1))
+        self.assertTrue(stats['connected'])
+
+    def test_buffer_overflow(self):
+        self.hold()
+        with self.assertLogs('worker.publisher', 'WARNING'):
+            for update_id in range(12):
+                self.publisher.publish('graph.1.Vertex.POST', {'id': update_id})
+        # The oldest updates are discarded
+        self.assertEqual([payload['id'] for _key, payload, _queued in self.publisher.buffer], list(range(2, 12)))
+        self.assertEqual(self.publisher.stats()['lost'], 2)
+        # Nothing is published without a running thread
+        self.assertFalse(self.publisher.flush(0))
+
+    def test_publish_failure(self):
+        get_producer = self.publisher._get_producer
+        failures = [2]
+
+        def get_failing_producer():
+            producer = get_producer()
+            if failures[0]:
+                failures[0] = failures[0] - 1
+                return FailingProducer()
+            return producer
+
+        with mock.patch.object(self.publisher, '_get_producer', get_failing_producer), \
+                mock.patch.object(publisher, 'RECONNECT_DELAY', 0.001), \
+                self.assertLogs('worker.publisher', 'WARNING'):
+            self.publisher.publish('graph.1.Vertex.POST', {'id': 1})
+            self.publisher.publish('graph.1.Vertex.POST', {'id': 2})
+            self.assertTrue(self.publisher.flush(5))
+        # Unconfirmed updates are kept, and published in order once the
+        # publisher reconnects
+        self.assertEqual(self.received(), [{'id': 1}, {'id': 2}])
+        stats = self.publisher.stats()
+        self.assertEqual((stats['published'], stats['failures'], stats['lost']), (2, 2, 0))
+        self.assertEqual(stats['connects'], 3)
@@ -0,0 +1,81 @@
+"""
+ *
+ * Copyright 2010-2020 Australian Signals Directorate
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ *
+"""
+
+from unittest import mock
+from django.test import SimpleTestCase
+from websockets.outbox import BATCH, BATCH_TYPE, DELETE, UPDATE
+from worker import tasks
+from worker.tasks import publish_updates, topic_routes, topic_routing_key
+from worker.worker import FANOUT, TOPIC
+
+
+def vertex(vertex_id, graph_id=12, operation=UPDATE):
+    """
+    :return: Payload of a change to a vertex.
+    """
+    return {'type': 'Vertex', 'graph_id': graph_id, 'vertex_id': vertex_id, 'operation': operation}
+
+
+def batch(*changes):
+    """
+    :return: BATCH message of the supplied changes.
+    """
+    return {'type': BATCH_TYPE, 'operation': BATCH, 'changes': list(changes)}
+
+
+class TopicRoutingTests(SimpleTestCase):
+    """
+    Check the routing keys of changes published to the topic exchange (refer
+    to worker/tasks.py:topic_routes).
+    """
+
+    def test_routing_key(self):
+        self.assertEqual(topic_routing_key(vertex(1)), 'graph.12.Vertex.UPDATE')
+        self.assertEqual(topic_routing_key({'type': 'SchemaAttribDefVertex', 'schema_id': 3, 'operation': DELETE}),
+                         'schema.3.SchemaAttribDefVertex.DELETE')
+        # The graph takes precedence over the schema of a graph change
+        self.assertEqual(topic_routing_key({'type': 'Graph', 'graph_id': 12, 'schema_id': 3, 'operation': UPDATE}),
+                         'graph.12.Graph.UPDATE')
+        self.assertEqual(topic_routing_key({'type': 'ImportJob', 'import_job_id': 5, 'graph_id': None,
+                                            'operation': UPDATE}),
+                         'global.0.ImportJob.UPDATE')
+
+    def test_single_change(self):
+        self.assertEqual(topic_routes(vertex(1)), [('graph.12.Vertex.UPDATE', vertex(1))])
+
+    def test_batch_split(self):
+        routes = topic_routes(batch(vertex(1), vertex(2, graph_id=13), vertex(3), vertex(4, operation=DELETE)))
+        self.assertEqual(routes, [
+            ('graph.12.Vertex.UPDATE', batch(vertex(1), vertex(3))),
+            ('graph.13.Vertex.UPDATE', vertex(2, graph_id=13)),
+            ('graph.12.Vertex.DELETE', vertex(4, operation=DELETE)),
+        ])
+
+    def test_publish_updates(self):
+        updates = [('Batch', batch(vertex(1), vertex(2, graph_id=13)))]
+        with mock.patch.object(tasks, 'update_publisher') as update_publisher:
+            with mock.patch.object(tasks, 'EXCHANGE_TYPE', TOPIC):
+                publish_updates(updates)
+            self.assertEqual([call.args for call in update_publisher.publish.call_args_list],
+                             [('graph.12.Vertex.UPDATE', vertex(1)),
+                              ('graph.13.Vertex.UPDATE', vertex(2, graph_id=13))])
+            update_publisher.reset_mock()
+            # The fanout exchange is routed by model name, without splitting
+            with mock.patch.object(tasks, 'EXCHANGE_TYPE', FANOUT):
+                publish_updates(updates)
+            self.assertEqual([call.args for call in update_publisher.publish.call_args_list], updates)
@@ -22,21 +22,32 @@ from celery import Celery
 from django.conf import settings
 
 EXCHANGER_NAME = 'CONSTELLATION.DataUpdates'
+# Exchange used when UPDATE_EXCHANGE_TYPE is 'topic'. An existing exchange
+# cannot change type, so the topic exchange has its own name.
+TOPIC_EXCHANGER_NAME = 'CONSTELLATION.DataUpdates.Topic'
+FANOUT = 'fanout'
+TOPIC = 'topic'
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webConstellation.settings')
 app = Celery()
 app.conf.update(settings.CELERY)
 app.autodiscover_tasks()
 
+# Type and name of the exchange updates are published to
+EXCHANGE_TYPE = getattr(settings, 'UPDATE_EXCHANGE_TYPE', FANOUT)
+EXCHANGE_NAME = TOPIC_EXCHANGER_NAME if EXCHANGE_TYPE == TOPIC else EXCHANGER_NAME
+
 
 with app.pool.acquire(block=True) as conn:
 
     # Create one exchange per 'model of interest'. Each exchange will be
     # configured to be in fanout mode, meaning new queues can be attached
-    # to it as new clients subscribe.
+    # to it as new clients subscribe. In topic mode, updates are routed
+    # using keys of the form graph.<id>.<Model>.<operation>, so queues can
+    # be bound to just the graphs, models and operations of interest.
     exchange = kombu.Exchange(
-        name=EXCHANGER_NAME,
-        type='fanout',
+        name=EXCHANGE_NAME,
+        type=EXCHANGE_TYPE,
         durable=True,
         channel=conn,
     )
-    exchange.declare()
\ No newline at end of file
+    exchange.declare()
@@ -34,6 +34,10 @@ class GraphComponent extends Component {
     }
 
     websocket_endpoint = "ws://127.0.0.1:8000/ws/updates/"
+    // Socket receiving updates to the graph being displayed
+    websocket = undefined;
+    // Sequence number of the last change applied of each graph, reset when the displayed graph changes
+    lastSeqs = {};
     nodePositions = [];
     nodeVisuals = [];
 
@@ -73,21 +77,79 @@ class GraphComponent extends Component {
   }
 
 
-  // TODO: WEBSOCKET CODE
-  addWebSocket() {
-    console.log('MMDEBUG: addWebSocket');
-    // Initialise WebSocket
-    // This will fail if the endpoint cannot send a handshake in time (When server is not booted yet)
-    const ws = new WebSocket(this.websocket_endpoint)
-    ws.onmessage = evt =>{
+  // Apply the delta carried by a Vertex/VertexAttrib update (when the backend has CHANGE_PAYLOADS DELTA enabled)
+  // to the node positions, returning false if the update has no delta and the vertex needs to be loaded instead.
+  applyVertexDelta(response) {
+    const delta = response["delta"];
+    if (!delta) {
+      return false;
+    }
+    const axes = ["x", "y", "z"];
+    const vx_id = response["vertex_id"];
+    if (response["type"] == "VertexAttrib") {
+      const axis = axes.indexOf(delta["label"]);
+      if (axis >= 0 && delta["value"] !== undefined) {
+        this.nodePositions[(vx_id * 4) + axis] = delta["value"];
+      }
+    } else {
+      axes.forEach((label, axis) => {
+        if (delta["attribute_json"] && delta["attribute_json"][label] !== undefined) {
+          this.nodePositions[(vx_id * 4) + axis] = delta["attribute_json"][label];
+        }
+      });
+    }
+    return true;
+  }
 
-      const message = JSON.parse(evt.data)
-      const response = JSON.parse(message["message"])
-      console.log("in event: " + response["graph_id"] + " = " + this.state.currentGraphId + (response["graph_id"] ==  this.state.currentGraphId));
-      console.log("response: " + evt.data);
+  // Apply a batch of attribute edits (an AttributeEdit update) to the node positions, using the new values of each
+  // edited vertex carried in its delta. Without a delta (or if it was truncated) the graph needs to be reloaded if
+  // vertex positions were edited.
+  applyAttributeEdit(response) {
+    const axes = ["x", "y", "z"];
+    const delta = response["delta"];
+    if (!delta) {
+      const labels = (response["labels"] || {})["vertex"] || [];
+      if (labels.some(label => axes.includes(label))) {
+        console.log('MMDEBUG: vertex positions edited, reload graph ' + this.state.currentGraphId);
+      }
+      return;
+    }
+    (delta["vertexes"] || []).forEach(vertex => {
+      axes.forEach((label, axis) => {
+        if (vertex["values"][label] !== undefined) {
+          this.nodePositions[(vertex["vertex_id"] * 4) + axis] = vertex["values"][label];
+        }
+      });
+    });
+  }
 
+  // Apply a list of changes to the graph being displayed. Graph changes carry the graphs change sequence number as
+  // "seq", changes already applied (ie received while replaying) being skipped. On a gap in the sequence (ie a change
+  // missed or merged away on the way) the missed changes are replayed, the change and those following it being held
+  // until the replay completes.
+  applyChanges(responses) {
+    let held;
+    responses.forEach(response => {
+      if (held !== undefined) {
+        held.push(response);
+        return;
+      }
+      console.log("in event: " + response["graph_id"] + " = " + this.state.currentGraphId + (response["graph_id"] ==  this.state.currentGraphId));
 
       if (response["graph_id"] == this.state.currentGraphId) {
+        if (response["seq"] !== undefined) {
+          const lastSeq = this.lastSeqs[response["graph_id"]];
+          if (lastSeq !== undefined && response["seq"] <= lastSeq) {
+            return;
+          }
+          if (lastSeq !== undefined && response["seq"] > lastSeq + 1) {
+            console.log('MMDEBUG: missed changes ' + (lastSeq + 1) + ' to ' + (response["seq"] - 1) + ', replaying');
+            held = [response];
+            this.websocket.send(JSON.stringify({"command": "replay", "graph": response["graph_id"], "since": lastSeq}));
+            return;
+          }
+          this.lastSeqs[response["graph_id"]] = response["seq"];
+        }
         console.log('MMDEBUG: received update for ' + this.state.currentGraphId + ', operation=' + response["operation"] + ', type=' + response["type"]);
         this.nodePositions[0] = this.nodePositions[0] - 1.8;
         this.nodePositions[5] = this.nodePositions[5] - 1.8;
@@ -102,7 +164,9 @@ class GraphComponent extends Component {
           // Vertex
           if (response["type"] == "Vertex" || response["type"] == "VertexAttrib")  {
             console.log('MMDEBUG: TODO Vertex/VertexAttrib create' + response["vertex_id"]);
-            this.loadVertex(response["vertex_id"]);
+            if (!this.applyVertexDelta(response)) {
+              this.loadVertex(response["vertex_id"]);
+            }
           } 
           // Transaction
           else if (response["type"] == "Transaction" || response["type"] == "TransactionAttrib")  {
@@ -116,19 +180,96 @@ class GraphComponent extends Component {
           // Vertex
           if (response["type"] == "Vertex" || response["type"] == "VertexAttrib")  {
             console.log('MMDEBUG: TODO Vertex/VertexAttrib update' + response["vertex_id"]);
-            this.loadVertex(response["vertex_id"]);
+            if (!this.applyVertexDelta(response)) {
+              this.loadVertex(response["vertex_id"]);
+            }
           } 
           // Transaction
           else if (response["type"] == "Transaction" || response["type"] == "TransactionAttrib")  {
             console.log('MMDEBUG: TODO Transaction/TransactionAttrib update');
           }
+          // Batch of attribute edits
+          else if (response["type"] == "AttributeEdit")  {
+            this.applyAttributeEdit(response);
+          }
         } 
         // Delete
         else if (response["operation"] == "DELETE") {
           console.log('MMDEBUG: TODO ......... delete');
         }
       }
+    });
+    if (held !== undefined) {
+      this.heldChanges = held.concat(this.heldChanges || []);
+    }
+  }
+
+  // TODO: WEBSOCKET CODE
+  addWebSocket() {
+    console.log('MMDEBUG: addWebSocket');
+    // Close the socket of the previously displayed graph, without it reconnecting
+    if (this.websocket !== undefined) {
+      this.websocket.onclose = undefined;
+      this.websocket.close();
+    }
+    // Initialise WebSocket
+    // This will fail if the endpoint cannot send a handshake in time (When server is not booted yet)
+    const ws = new WebSocket(this.websocket_endpoint)
+    this.websocket = ws;
+    // Only receive updates to the graph being displayed, and after reconnecting replay the changes missed while
+    // disconnected rather than reloading the graph. Updates arriving while replaying are held until it completes.
+    ws.onopen = () => {
+      ws.send(JSON.stringify({"command": "subscribe", "graphs": [this.state.currentGraphId]}));
+      const lastSeq = this.lastSeqs[this.state.currentGraphId];
+      if (lastSeq !== undefined) {
+        this.heldChanges = [];
+        ws.send(JSON.stringify({"command": "replay", "graph": this.state.currentGraphId, "since": lastSeq}));
+      }
+    }
+    ws.onclose = () => {
+      if (this.websocket !== ws) {
+        return;
+      }
+      console.log('MMDEBUG: websocket closed, reconnecting');
+      setTimeout(() => this.addWebSocket(), 1000);
+    }
+    ws.onmessage = evt =>{
+
+      const message = JSON.parse(evt.data)
+      // Replayed changes, the graph needing to be reloaded if they are no longer available
+      if ("replay" in message) {
+        const replay = message["replay"];
+        if (replay["reload"]) {
+          console.log('MMDEBUG: missed changes no longer available, reload graph ' + this.state.currentGraphId);
+          // Sequence tracking restarts from the next change
+          delete this.lastSeqs[this.state.currentGraphId];
+        } else {
+          this.applyChanges(replay["changes"]);
+          if (replay["more"]) {
+            ws.send(JSON.stringify({"command": "replay", "graph": this.state.currentGraphId,
+                                    "since": this.lastSeqs[this.state.currentGraphId]}));
+            return;
+          }
+        }
+        const heldChanges = this.heldChanges || [];
+        this.heldChanges = undefined;
+        this.applyChanges(heldChanges);
+        return;
+      }
+      // Replies to subscription commands carry no update
+      if (!("message" in message)) {
+        return;
+      }
+      const update = JSON.parse(message["message"])
+      console.log("response: " + evt.data);
 
+      // Changes committed together arrive as a single BATCH message listing each change
+      const changes = update["operation"] == "BATCH" ? update["changes"] : [update];
+      if (this.heldChanges !== undefined) {
+        this.heldChanges.push(...changes);
+      } else {
+        this.applyChanges(changes);
+      }
     }
   }
 
@@ -147,6 +288,9 @@ class GraphComponent extends Component {
 
     // used to display the graph based on a request to the API
 displayGraph() {
+  // Changes are numbered per graph, so tracking restarts with the newly displayed graph
+  this.lastSeqs = {};
+  this.heldChanges = undefined;
   this.addWebSocket();
   var controller = new CanvasController(this.canvasRef.current);
       var gl = controller.gl;